@@ -7,8 +7,12 @@ Modules relevant to data.
 from .dataapi import DataApi
 from .dataservice import RemoteDataService, DataService
 from .dataview import DataView
+from .intraday import IntradayDataView
 from .py_expression_eval import Parser
+from .expr_graph import ExprProfiler
+from .trade_calendar import Calendar
 
 
 # we do not expose align and basic
-__all__ = ['DataApi', 'DataService', 'RemoteDataService', 'DataView', 'Parser']
\ No newline at end of file
+__all__ = ['DataApi', 'DataService', 'RemoteDataService', 'DataView', 'IntradayDataView', 'Parser',
+           'ExprProfiler', 'Calendar']
\ No newline at end of file
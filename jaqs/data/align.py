@@ -42,6 +42,92 @@ def get_neareast(df_ann, df_value, date):
     return res
     
 
+def get_asof_index(ann, date_arr):
+    """
+    For each date and security, get the row number of the last row whose announcement date is earlier than
+    or equal to the date. This is what get_neareast selects, computed for all dates and securities at once.
+    
+    Parameters
+    ----------
+    ann : np.ndarray
+        Announcement dates, no NaN. dtype = int, shape = (n_quarters, n_securities)
+    date_arr : np.ndarray
+        Target dates. dtype = int, shape = (n_days,)
+
+    Returns
+    -------
+    res : np.ndarray
+        Row numbers, -1 where no row is announced yet. shape = (n_days, n_securities)
+
+    """
+    n_quarters, n_securities = ann.shape
+    if n_quarters == 0:
+        return np.full((len(date_arr), n_securities), -1, dtype=np.int64)
+    
+    # sort announcement dates of each security, and keep the max row number announced so far
+    order = np.argsort(ann, axis=0, kind='mergesort')
+    ann_sorted = np.take_along_axis(ann, order, axis=0).astype(np.int64)
+    last_row = np.maximum.accumulate(order, axis=0)
+    
+    # search all securities in one call: shift each column so that keys of all columns are sorted as a whole
+    lo = min(ann_sorted.min(), date_arr.min()) if len(date_arr) else ann_sorted.min()
+    hi = max(ann_sorted.max(), date_arr.max()) if len(date_arr) else ann_sorted.max()
+    offset = (hi - lo + 1) * np.arange(n_securities, dtype=np.int64)
+    keys = (ann_sorted - lo + offset).T.ravel()
+    queries = date_arr.astype(np.int64).reshape(-1, 1) - lo + offset.reshape(1, -1)
+    n_announced = np.searchsorted(keys, queries, side='right') - np.arange(n_securities) * n_quarters
+    
+    res = last_row[np.maximum(n_announced - 1, 0), np.arange(n_securities)]
+    res[n_announced == 0] = -1
+    return res
+
+
+def _take_asof(values, idx):
+    """Select values[idx[i, j], j], NaN where idx is -1."""
+    missing = idx < 0
+    res = values[np.where(missing, 0, idx), np.arange(values.shape[1])] if len(values) else \
+        np.empty(idx.shape, dtype=values.dtype)
+    if missing.any():
+        if res.dtype.kind in 'biu':
+            res = res.astype(float)
+        res[missing] = np.nan
+    return res
+
+
+def align_many(df_values, df_ann, date_arr):
+    """
+    Expand several low frequency DataFrames sharing the same announcement dates to frequency of date_arr.
+    Positions of announcements are searched only once.
+    
+    Parameters
+    ----------
+    df_values : list of pd.DataFrame
+        DataFrames of announcement values, each of shape (n_quarters, n_securities).
+        Columns are matched with df_ann by position.
+    df_ann : pd.DataFrame
+        DataFrame of announcement dates. shape = (n_quarters, n_securities)
+    date_arr : list or np.array
+        Target date array. dtype = int
+
+    Returns
+    -------
+    list of pd.DataFrame
+        Expanded DataFrames. shape = (n_days, n_securities)
+
+    """
+    # IMPORTANT: At cells where no quarterly data is available, we know nothing, thus they are never selected
+    ann = df_ann.fillna(99999999).values.astype(np.int64)
+    date_arr = np.asarray(date_arr, dtype=int)
+    
+    idx = get_asof_index(ann, date_arr)
+    
+    res = []
+    for df_value in df_values:
+        data = _take_asof(df_value.values, idx)
+        res.append(pd.DataFrame(index=date_arr, columns=df_value.columns, data=data))
+    return res
+
+
 def align(df_value, df_ann, date_arr):
     """
     Expand low frequency DataFrame df_value to frequency of data_arr using announcement date from df_ann.
@@ -61,14 +147,16 @@ def align(df_value, df_ann, date_arr):
         Expanded DataFrame. shape = (n_days, n_securities)
 
     """
+    return align_many([df_value], df_ann, date_arr)[0]
+
+
+def _align_loop(df_value, df_ann, date_arr):
+    """Previous implementation of align, which calls get_neareast for every date. Kept as a reference for tests."""
     df_ann = df_ann.fillna(99999999).astype(int)
-    
     date_arr = np.asarray(date_arr, dtype=int)
-    
-    res = np.apply_along_axis(lambda date: get_neareast(df_ann.values, df_value.values, date), 1, date_arr.reshape(-1, 1))
-
-    df_res = pd.DataFrame(index=date_arr, columns=df_value.columns, data=res)
-    return df_res
+    res = np.apply_along_axis(lambda date: get_neareast(df_ann.values, df_value.values, date), 1,
+                              date_arr.reshape(-1, 1))
+    return pd.DataFrame(index=date_arr, columns=df_value.columns, data=res)
 
 
 def demo_usage():
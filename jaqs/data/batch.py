@@ -0,0 +1,188 @@
+# encoding: utf-8
+"""
+Evaluate many formulas in a process pool.
+
+Expression evaluation is CPU-bound and holds the GIL, so threads do not help. Inputs are written once
+as .npy files (in /dev/shm when it exists, so they stay in memory) and memory-mapped read-only
+by each worker process, so every worker shares the same pages instead of receiving a pickled copy.
+Results are written the same way and read back by the parent process.
+
+"""
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+from collections import OrderedDict
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data.py_expression_eval import Parser
+from jaqs.data.expr_graph import ExprGraph
+
+# state of a worker process, set by _init_worker
+_worker = dict()
+
+
+def _publish(folder, key, obj):
+    """
+    Write a DataFrame of numbers to folder, to be memory-mapped by workers.
+    Other objects (e.g. DataFrames of strings) are pickled to workers as they are.
+
+    """
+    if isinstance(obj, pd.DataFrame):
+        arr = obj.values
+        if arr.dtype.kind in 'biuf':
+            path = os.path.join(folder, '{}.npy'.format(key))
+            np.save(path, arr)
+            return 'npy', path, obj.index, obj.columns
+    return 'obj', obj
+
+
+def _load(item, mmap_mode='r'):
+    if item is None:
+        return None
+    if item[0] == 'npy':
+        _, path, index, columns = item
+        return pd.DataFrame(np.load(path, mmap_mode=mmap_mode), index=index, columns=columns, copy=False)
+    return item[1]
+
+
+def _init_worker(folder, inputs, formula_func_name_style):
+    _worker['folder'] = folder
+    _worker['inputs'] = inputs
+    _worker['formula_func_name_style'] = formula_func_name_style
+
+
+def _evaluate_task(task):
+    """Evaluate formulas of a task in a worker, write results to the shared folder."""
+    task_id, formulas, start_date, chunk_size = task
+    inputs = _worker['inputs']
+    parser = Parser()
+    parser.set_capital(_worker['formula_func_name_style'])
+    graph = ExprGraph(parser)
+    for name, formula in formulas:
+        graph.add(name, parser.parse(formula))
+    values = {var: _load(inputs['values'][var]) for var in graph.variables()}
+    dic = graph.evaluate(values, ann_dts=_load(inputs['ann_dts']), trade_dts=_load(inputs['trade_dts']),
+                         index_member=_load(inputs['index_member']), start_date=start_date, chunk_size=chunk_size)
+    return OrderedDict([(name, _publish(_worker['folder'], 'result_{}_{}'.format(task_id, i), res))
+                        for i, (name, res) in enumerate(dic.items())])
+
+
+class BatchEvaluator(object):
+    """
+    Evaluate a batch of formulas with a pool of worker processes.
+    Formulas using results of other formulas of the batch are evaluated in the same task,
+    other formulas are independent tasks.
+
+    Attributes
+    ----------
+    n_processes : int
+        Number of worker processes. Default number of CPUs.
+    formula_func_name_style : {'upper', 'lower', 'camel'}
+    shm_dir : str
+        Folder of shared input and result files. Default /dev/shm if it exists, else the temp folder.
+
+    Examples
+    --------
+    evaluator = BatchEvaluator(n_processes=8)
+    dic = evaluator.evaluate([('a', 'Rank(close)'), ('b', 'Ts_Mean(a, 5)')], {'close': df_close})
+
+    """
+    def __init__(self, n_processes=None, formula_func_name_style='camel', shm_dir=None):
+        self.n_processes = n_processes or multiprocessing.cpu_count()
+        self.formula_func_name_style = formula_func_name_style
+        if shm_dir is None and os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            shm_dir = '/dev/shm'
+        self.shm_dir = shm_dir
+
+    def split_tasks(self, formulas):
+        """
+        Group formulas which depend on each other.
+
+        Parameters
+        ----------
+        formulas : list of tuple
+            [(name, formula)]
+
+        Returns
+        -------
+        list of list
+            Each element is a list of (name, formula) in the original order.
+
+        """
+        names = [name for name, _ in formulas]
+        parent = {name: name for name in names}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        parser = Parser()
+        parser.set_capital(self.formula_func_name_style)
+        for name, formula in formulas:
+            for var in parser.parse(formula).variables():
+                if var in parent:
+                    parent[find(var)] = find(name)
+
+        tasks = OrderedDict()
+        for name, formula in formulas:
+            tasks.setdefault(find(name), []).append((name, formula))
+        return list(tasks.values())
+
+    def evaluate(self, formulas, values, ann_dts=None, trade_dts=None, index_member=None,
+                 start_date=None, chunk_size=None):
+        """
+        Evaluate formulas, see Parser.evaluate for parameters.
+
+        Parameters
+        ----------
+        formulas : dict or list of tuple
+            {name: formula} or [(name, formula)]. A formula may use results of other formulas.
+        values : dict
+            {variable: pd.DataFrame}
+
+        Returns
+        -------
+        OrderedDict
+            {name: result} in the order of formulas.
+
+        """
+        formulas = list(formulas.items()) if isinstance(formulas, dict) else list(formulas)
+        tasks = self.split_tasks(formulas)
+        n_processes = min(self.n_processes, len(tasks))
+
+        folder = tempfile.mkdtemp(prefix='jaqs_batch_', dir=self.shm_dir)
+        pool = None
+        try:
+            inputs = {'values': {var: _publish(folder, 'var_{}'.format(i), df)
+                                 for i, (var, df) in enumerate(values.items())},
+                      'ann_dts': _publish(folder, 'ann_dts', ann_dts),
+                      'trade_dts': None if trade_dts is None else ('obj', np.asarray(trade_dts)),
+                      'index_member': _publish(folder, 'index_member', index_member)}
+            task_args = [(i, task, start_date, chunk_size) for i, task in enumerate(tasks)]
+
+            if n_processes <= 1:
+                _init_worker(folder, inputs, self.formula_func_name_style)
+                task_results = [_evaluate_task(task) for task in task_args]
+            else:
+                pool = multiprocessing.Pool(n_processes, initializer=_init_worker,
+                                            initargs=(folder, inputs, self.formula_func_name_style))
+                task_results = pool.map(_evaluate_task, task_args, chunksize=1)
+
+            results = dict()
+            for dic in task_results:
+                for name, item in dic.items():
+                    # read to memory, since the folder is removed
+                    results[name] = _load(item, mmap_mode=None)
+            return OrderedDict([(name, results[name]) for name, _ in formulas])
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+            _worker.clear()
+            shutil.rmtree(folder, ignore_errors=True)
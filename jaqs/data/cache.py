@@ -0,0 +1,225 @@
+# encoding: utf-8
+"""
+Persistent cache of query results of data services, and of results of formulas.
+
+Each result is stored in its own file named by the SHA1 of the query (API name and arguments),
+so a query finished before a failure does not need to be fetched again.
+Access time of a result is its file modification time, which is used for LRU eviction.
+
+"""
+from __future__ import print_function
+import hashlib
+import json
+import os
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+import numpy as np
+from six import string_types
+
+import jaqs.util as jutil
+
+
+def _normalize_list(s, sep=','):
+    """Sort items of a separated string, so that 'a,b' and 'b, a' are the same query."""
+    return sep.join(sorted(set([x.strip() for x in s.split(sep) if x.strip()])))
+
+
+def _normalize_filter(s):
+    """Normalize filter string like 'symbol=b,a&start_date=1' to 'start_date=1&symbol=a,b'."""
+    parts = []
+    for part in s.split('&'):
+        if not part:
+            continue
+        if '=' in part:
+            k, v = part.split('=', 1)
+            part = '='.join([k.strip(), _normalize_list(v)])
+        parts.append(part)
+    return '&'.join(sorted(parts))
+
+
+def _normalize_value(key, value):
+    if isinstance(value, np.integer):
+        value = int(value)
+    elif isinstance(value, np.floating):
+        value = float(value)
+
+    if key in ('symbol', 'fields') and isinstance(value, string_types):
+        value = _normalize_list(value)
+    elif key == 'filter' and isinstance(value, string_types):
+        value = _normalize_filter(value)
+    return value
+
+
+class QueryCache(object):
+    """
+    Content-addressed on-disk cache of query results.
+
+    Attributes
+    ----------
+    folder : str
+    max_size : int or None
+        Max bytes of all cached files. Least recently used files will be removed when exceeded.
+        None means no limit.
+
+    """
+    SUFFIX = '.pic'
+
+    def __init__(self, folder, max_size=None):
+        self.folder = os.path.abspath(folder)
+        self.max_size = max_size
+
+        if not os.path.exists(self.folder):
+            os.makedirs(self.folder)
+        self._size = sum([os.path.getsize(fp) for fp in self._list_files()])
+
+    @staticmethod
+    def make_key(api, **kwargs):
+        """
+        Make key of a query. Order of symbols, fields and filter items does not matter.
+
+        Parameters
+        ----------
+        api : str
+            Name of the API, eg. 'daily', 'query'.
+        kwargs
+            Arguments of the query.
+
+        Returns
+        -------
+        str
+
+        """
+        items = sorted([(k, _normalize_value(k, v)) for k, v in kwargs.items()])
+        s = json.dumps([api, items], sort_keys=True)
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    @property
+    def size(self):
+        """Bytes of all cached files."""
+        return self._size
+
+    def _path(self, key):
+        return os.path.join(self.folder, key + self.SUFFIX)
+
+    def _list_files(self):
+        return [os.path.join(self.folder, fn) for fn in os.listdir(self.folder) if fn.endswith(self.SUFFIX)]
+
+    def __contains__(self, key):
+        return os.path.exists(self._path(key))
+
+    def __len__(self):
+        return len(self._list_files())
+
+    def get(self, key):
+        """
+        Get cached value. Return None if key is not cached.
+
+        Parameters
+        ----------
+        key : str
+
+        Returns
+        -------
+        object or None
+
+        """
+        fp = self._path(key)
+        try:
+            value = self._read(fp)
+        except (IOError, OSError):
+            return None
+        except Exception:
+            # damaged file, eg. written by an old version of pandas
+            print("Damaged cache file {:s}, removed.".format(fp))
+            self._remove(fp)
+            return None
+
+        try:
+            os.utime(fp, None)  # mark as recently used
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Store value. The file is written to a temporary path first, then renamed,
+        so an interrupted write does not leave a broken entry.
+
+        Parameters
+        ----------
+        key : str
+        value : object
+            Must be picklable.
+
+        """
+        fp = self._path(key)
+        fp_tmp = fp + '.tmp'
+        with open(fp_tmp, 'wb') as f:
+            self._write(f, value)
+
+        old_size = os.path.getsize(fp) if os.path.exists(fp) else 0
+        jutil.replace_file(fp_tmp, fp)
+        self._size += os.path.getsize(fp) - old_size
+
+        if self.max_size is not None and self._size > self.max_size:
+            self.evict(self.max_size)
+
+    def _read(self, fp):
+        with open(fp, 'rb') as f:
+            return pickle.load(f)
+
+    def _write(self, f, value):
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _remove(self, fp):
+        try:
+            size = os.path.getsize(fp)
+            os.remove(fp)
+            self._size -= size
+        except OSError:
+            pass
+
+    def evict(self, max_size):
+        """Remove least recently used files until total size is no more than max_size."""
+        files = sorted(self._list_files(), key=os.path.getmtime)
+        self._size = sum([os.path.getsize(fp) for fp in files])
+        for fp in files:
+            if self._size <= max_size:
+                break
+            self._remove(fp)
+
+    def clear(self):
+        """Remove all cached files."""
+        self.evict(0)
+
+
+class ExprCache(QueryCache):
+    """
+    On-disk cache of results of formulas, stored as .npy files which are memory-mapped when read.
+    Keys are made by make_key from the canonical formula and versions (content hashes) of its inputs,
+    see DataView.set_expr_cache.
+
+    Attributes
+    ----------
+    folder : str
+    max_size : int or None
+        Max bytes of all cached files. Least recently used files will be removed when exceeded.
+
+    """
+    SUFFIX = '.npy'
+
+    @staticmethod
+    def can_store(value):
+        """Only arrays of numbers and booleans can be stored."""
+        return isinstance(value, np.ndarray) and value.dtype.kind in 'biuf'
+
+    def _read(self, fp):
+        return np.load(fp, mmap_mode='r')
+
+    def _write(self, f, value):
+        if not self.can_store(value):
+            raise ValueError("Only arrays of numbers can be cached, got {}.".format(type(value)))
+        np.save(f, value, allow_pickle=False)
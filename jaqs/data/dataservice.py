@@ -3,6 +3,9 @@
 from __future__ import print_function
 from __future__ import unicode_literals
 from builtins import *
+import os
+import time
+import datetime
 from abc import abstractmethod
 from six import with_metaclass
 
@@ -12,6 +15,8 @@ import pandas as pd
 from jaqs.trade.event import EVENT_TYPE, Event
 from jaqs.data import DataApi
 from jaqs.data import align
+from jaqs.data.cache import QueryCache
+from jaqs.data.trade_calendar import Calendar
 import jaqs.util as jutil
 
 
@@ -256,13 +261,39 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
     """
     RemoteDataService is a concrete class using data from remote server's database.
     It wraps DataApi and simplify usage.
+    
+    Attributes
+    ----------
+    cache : QueryCache or None
+        If set, results of daily, bar and query are stored on local disk,
+        and the same query will be answered by cache without network I/O.
+        Results of dates before today are kept until evicted, results which may still change
+        (dates from today on, no date range, or pre-adjusted prices) expire after cache_ttl seconds.
+        Daily queries are cached in chunks of calendar years, see CACHE_CHUNK_YEARS.
+    cache_ttl : float
+        Seconds results which may still change are kept in cache. 0 means they are not cached.
+    calendar_path : str
+        File of the trade calendar saved on local disk. Default trade_calendar.npz in the cache folder if
+        cache is set, else the calendar is not saved.
 
     """
+    # first date of the trade calendar loaded from the server
+    CALENDAR_START_DATE = 19900101
+    # daily queries are cached in chunks of this many calendar years, so that finished chunks
+    # of an interrupted query and of queries with other date ranges are reused
+    CACHE_CHUNK_YEARS = 1
+    
     def __init__(self):
         print("Init RemoteDataService DEBUG")
         super(RemoteDataService, self).__init__()
         
         self.data_api = None
+        self.cache = None
+        self.cache_ttl = 3600.0
+        self.calendar_path = ""
+        self._calendar = None
+        # date of the last query of the calendar, to query at most once a day
+        self._calendar_query_date = 0
 
         self._address = ""
         self._username = ""
@@ -288,7 +319,13 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         -------
         {"remote.data.address": "tcp://Address:Port",
         "remote.data.username": "your username",
-        "remote.data.password": "your password"}
+        "remote.data.password": "your password",
+        "cache.path": "path/to/cache/folder",  # optional
+        "cache.max_size_mb": 2048,  # optional
+        "cache.ttl": 3600,  # optional, seconds results which may still change are cached
+        "calendar.path": "path/to/trade_calendar.npz"}  # optional
+        
+        If cache.path is given but address is not, no login will be performed and only cached data is available.
 
         """
         def get_from_list_of_dict(l, key, default=None):
@@ -308,9 +345,21 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         username = get_from_list_of_dict(dic_list, "remote.data.username", "")
         password = get_from_list_of_dict(dic_list, "remote.data.password", "")
         time_out = get_from_list_of_dict(dic_list, "timeout", 60)
+        cache_path = get_from_list_of_dict(dic_list, "cache.path", "")
+        cache_max_size_mb = get_from_list_of_dict(dic_list, "cache.max_size_mb", None)
+        cache_ttl = get_from_list_of_dict(dic_list, "cache.ttl", None)
+        calendar_path = get_from_list_of_dict(dic_list, "calendar.path", "")
 
-        print("\nBegin: DataApi login {}@{}".format(username, address))
         INDENT = ' ' * 4
+        if calendar_path:
+            self.calendar_path = calendar_path
+        if cache_path:
+            self.set_cache(cache_path, max_size_mb=cache_max_size_mb, ttl=cache_ttl)
+            if not address:
+                print(INDENT + "No address provided, use local cache only: {}".format(cache_path))
+                return
+
+        print("\nBegin: DataApi login {}@{}".format(username, address))
         
         if self.data_api is None:
             if (address == "") or (username == "") or (password == ""):
@@ -338,6 +387,122 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
             self.data_api = data_api
             print(INDENT + "login success \n")
         
+    def set_cache(self, path, max_size_mb=None, ttl=None):
+        """
+        Store query results on local disk.
+        
+        Parameters
+        ----------
+        path : str or None
+            Folder of cache files. None to disable cache.
+        max_size_mb : float, optional
+            Least recently used results will be removed when total size exceeds this. Default no limit.
+        ttl : float, optional
+            Seconds results which may still change are kept, see cache_ttl. Default not changed.
+
+        """
+        if ttl is not None:
+            self.cache_ttl = float(ttl)
+        if not path:
+            self.cache = None
+            return
+        max_size = None if max_size_mb is None else int(max_size_mb * 1024 * 1024)
+        self.cache = QueryCache(path, max_size=max_size)
+    
+    @staticmethod
+    def _parse_date(date):
+        """Int date of 20170101, '20170101' or '2017-01-01', 0 if date is empty or can not be parsed."""
+        try:
+            return int(str(date).replace('-', '')[:8])
+        except (TypeError, ValueError):
+            return 0
+    
+    def _is_final(self, api, kwargs):
+        """
+        Whether the result of a query will not change any more, i.e. all its dates are before today.
+        Queries without date range (e.g. instrument information) and pre-adjusted prices may always change.
+
+        """
+        if api == 'daily':
+            if kwargs.get('adjust_mode', None) == 'pre':
+                return False
+            end_date = kwargs.get('end_date', 0)
+        elif api == 'bar':
+            end_date = kwargs.get('trade_date', 0)
+        else:
+            end_date = kwargs.get('end_date', 0)
+            for part in kwargs.get('filter', '').split('&'):
+                k, _, v = part.partition('=')
+                if k.strip() in ('end_date', 'trade_date', 'date'):
+                    end_date = v
+        end_date = self._parse_date(end_date)
+        return 0 < end_date < jutil.convert_datetime_to_int(datetime.datetime.now())
+    
+    def _query_with_cache(self, api, func, **kwargs):
+        """
+        Call func(**kwargs) if the result is not cached, then cache successful result.
+        Cached results which may still change expire after cache_ttl seconds.
+        Without data_api, expired results are still used.
+        
+        Returns
+        -------
+        df : pd.DataFrame
+        err_msg : str
+
+        """
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(api, **kwargs)
+            res = self.cache.get(key)
+            if res is not None:
+                # (df, err_msg) of final results, (df, err_msg, expire time) of others
+                if len(res) == 2:
+                    return res
+                df, err_msg, expire_time = res
+                if time.time() < expire_time:
+                    return df, err_msg
+                if self.data_api is None:
+                    print("Cached result of {} may be outdated, use it since not logged in.".format(api))
+                    return df, err_msg
+        
+        self._raise_error_if_no_data_api()
+        df, err_msg = func(**kwargs)
+        self._raise_error_if_msg(err_msg)
+        
+        if key is not None:
+            if self._is_final(api, kwargs):
+                self.cache.put(key, (df, err_msg))
+            elif self.cache_ttl > 0:
+                self.cache.put(key, (df, err_msg, time.time() + self.cache_ttl))
+        return df, err_msg
+    
+    def _query_daily_with_cache(self, **kwargs):
+        """
+        Query daily in chunks of CACHE_CHUNK_YEARS calendar years, each chunk is cached as soon as it is done.
+        Chunks end on Dec 31st, so that chunks of whole years are shared by queries of other date ranges.
+
+        """
+        start_date = self._parse_date(kwargs['start_date'])
+        end_date = self._parse_date(kwargs['end_date'])
+        n_years = self.CACHE_CHUNK_YEARS
+        if (self.cache is None or kwargs.get('adjust_mode', None) == 'pre'
+                or not (0 < start_date <= end_date) or start_date // 10000 // n_years == end_date // 10000 // n_years):
+            return self._query_with_cache('daily', self._daily, **kwargs)
+        
+        dfs = []
+        chunk_start = start_date
+        while chunk_start <= end_date:
+            next_year = (chunk_start // 10000 // n_years + 1) * n_years
+            chunk_end = min((next_year - 1) * 10000 + 1231, end_date)
+            df, err_msg = self._query_with_cache('daily', self._daily,
+                                                 **dict(kwargs, start_date=chunk_start, end_date=chunk_end))
+            dfs.append(df)
+            chunk_start = next_year * 10000 + 101
+        df = pd.concat(dfs, axis=0, ignore_index=True)
+        if 'symbol' in df.columns and 'trade_date' in df.columns:
+            df = df.sort_values(['symbol', 'trade_date'], kind='mergesort').reset_index(drop=True)
+        return df, err_msg
+    
     def _raise_error_if_no_data_api(self):
         if self.data_api is None:
             raise NotLoginError("Please first login using init_from_config.")
@@ -351,28 +516,27 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
     # Basic APIs
     def daily(self, symbol, start_date, end_date,
               fields="", adjust_mode=None):
-        self._raise_error_if_no_data_api()
-        
-        df, err_msg = self.data_api.daily(symbol=symbol, start_date=start_date, end_date=end_date,
-                                          fields=fields, adjust_mode=adjust_mode, data_format="")
-
-        self._raise_error_if_msg(err_msg)
+        df, err_msg = self._query_daily_with_cache(symbol=symbol, start_date=start_date, end_date=end_date,
+                                                   fields=fields, adjust_mode=adjust_mode)
         
         # TODO there will be duplicate entries when on stocks' IPO day
         df = df.drop_duplicates()
         return df, err_msg
 
+    def _daily(self, **kwargs):
+        return self.data_api.daily(data_format="", **kwargs)
+
     def bar(self, symbol,
             start_time=200000, end_time=160000, trade_date=None,
             freq='1M', fields=""):
-        self._raise_error_if_no_data_api()
-        
-        df, err_msg = self.data_api.bar(symbol=symbol, fields=fields,
-                                        start_time=start_time, end_time=end_time, trade_date=trade_date,
-                                        freq=freq, data_format="")
-        
-        self._raise_error_if_msg(err_msg)
+        df, err_msg = self._query_with_cache('bar', self._bar,
+                                             symbol=symbol, fields=fields,
+                                             start_time=start_time, end_time=end_time, trade_date=trade_date,
+                                             freq=freq)
         return df, err_msg
+
+    def _bar(self, **kwargs):
+        return self.data_api.bar(data_format="", **kwargs)
     
     def quote(self, symbol, fields=""):
         self._raise_error_if_no_data_api()
@@ -412,13 +576,12 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
             view does not change. fileds can be any field predefined in reference data api.
 
         """
-        self._raise_error_if_no_data_api()
-        
-        df, err_msg = self.data_api.query(view, fields=fields, filter=filter, data_format="", **kwargs)
-        
-        self._raise_error_if_msg(err_msg)
+        df, err_msg = self._query_with_cache('query', self._query, view=view, fields=fields, filter=filter, **kwargs)
         return df, err_msg
 
+    def _query(self, view, **kwargs):
+        return self.data_api.query(view, data_format="", **kwargs)
+
     # -----------------------------------------------------------------------------------
     # Convenient Functions
     
@@ -974,6 +1137,79 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
     # ---------------------------------------------------------------------
     # Calendar
     
+    @property
+    def calendar(self):
+        """Calendar of all trade dates, see get_calendar."""
+        return self.get_calendar()
+    
+    def get_calendar(self, start_date=None, end_date=None):
+        """
+        Trade calendar kept in memory. It is loaded once from calendar_path, or from the server
+        (all trade dates from CALENDAR_START_DATE to the end of next year) and then saved to calendar_path.
+        The calendar ends on the last trade date published by the server. It is loaded from the server again
+        if it ends before end_date and before today, at most once a day.
+        
+        Parameters
+        ----------
+        start_date, end_date : int, optional
+            Range of dates the calendar must cover. Default today.
+        
+        Returns
+        -------
+        Calendar or None
+            None if the calendar can not be loaded.
+
+        """
+        cal = self._calendar
+        if cal is None and self._get_calendar_path():
+            cal = Calendar.load(self._get_calendar_path())
+        if cal is not None and start_date is not None and (end_date or start_date) <= cal.end_date:
+            self._calendar = cal
+            return cal
+        
+        today = jutil.convert_datetime_to_int(datetime.datetime.now())
+        start_date = start_date or today
+        end_date = end_date or start_date
+        # dates before CALENDAR_START_DATE are not loaded anyway
+        if cal is None or (end_date > cal.end_date and cal.end_date < today):
+            if (self._calendar_query_date != today
+                    and (self.data_api is not None or self.cache is not None)):
+                self._calendar_query_date = today
+                # till the end of next year
+                cal = self._query_calendar((max(end_date, today) // 10000 + 1) * 10000 + 1231) or cal
+        self._calendar = cal
+        return cal
+    
+    def _get_calendar_path(self):
+        if self.calendar_path:
+            return self.calendar_path
+        if self.cache is not None:
+            return os.path.join(self.cache.folder, 'trade_calendar.npz')
+        return ""
+    
+    def _query_calendar(self, end_date):
+        """Query all trade dates till end_date and save them. Return None if the query failed."""
+        try:
+            dates = self._query_trade_date_range(self.CALENDAR_START_DATE, end_date)
+        except Exception as e:
+            # queries of each range still work
+            print("Failed to load trade calendar: {}".format(e))
+            return None
+        if not len(dates):
+            return None
+        # dates after the last published trade date are not known yet
+        cal = Calendar(dates, start_date=self.CALENDAR_START_DATE, end_date=min(end_date, int(np.max(dates))))
+        if self._get_calendar_path():
+            cal.save(self._get_calendar_path())
+        return cal
+    
+    def _covering_calendar(self, start_date, end_date):
+        """Calendar covering [start_date, end_date], or None."""
+        cal = self.get_calendar(start_date, end_date)
+        if cal is not None and cal.covers(start_date, end_date):
+            return cal
+        return None
+    
     def get_trade_date_range(self, start_date, end_date):
         """
         Get array of trade dates within given range.
@@ -991,6 +1227,12 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
             dtype = int
 
         """
+        cal = self._covering_calendar(start_date, end_date)
+        if cal is not None:
+            return cal.get_trade_date_range(start_date, end_date)
+        return self._query_trade_date_range(start_date, end_date)
+    
+    def _query_trade_date_range(self, start_date, end_date):
         filter_argument = self._dic2url({'start_date': start_date,
                                          'end_date': end_date})
     
@@ -1016,11 +1258,11 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         res : int
 
         """
-        dt = jutil.convert_int_to_datetime(date)
-        delta = pd.Timedelta(weeks=2)
-        dt_old = dt - delta
-        date_old = jutil.convert_datetime_to_int(dt_old)
-    
+        date_old = jutil.shift(date, n_weeks=-2)
+        cal = self._covering_calendar(date_old, date)
+        if cal is not None:
+            return cal.get_last_trade_date(date)
+        
         dates = self.get_trade_date_range(date_old, date)
         mask = dates < date
         res = dates[mask][-1]
@@ -1055,11 +1297,11 @@ class RemoteDataService(with_metaclass(Singleton, DataService)):
         res : int
 
         """
-        dt = jutil.convert_int_to_datetime(date)
-        delta = pd.Timedelta(weeks=2)
-        dt_new = dt + delta
-        date_new = jutil.convert_datetime_to_int(dt_new)
-    
+        date_new = jutil.shift(date, n_weeks=2)
+        cal = self._covering_calendar(date, date_new)
+        if cal is not None:
+            return cal.get_next_trade_date(date)
+        
         dates = self.get_trade_date_range(date, date_new)
         mask = dates > date
         res = dates[mask][0]
@@ -10,13 +10,25 @@ If you want to declare your field in props, instead of append it manually, you w
 """
 from __future__ import print_function
 import os
+import copy
+import pickle
+import hashlib
+import tempfile
+from collections import OrderedDict
 
 import numpy as np
 import pandas as pd
 
 import jaqs.util as jutil
-from jaqs.data.align import align
+from jaqs.data.align import align, align_many
 from jaqs.data.py_expression_eval import Parser
+from jaqs.data.expr_graph import ExprGraph
+from jaqs.data.streaming import StreamingExpression
+from jaqs.data.batch import BatchEvaluator
+from jaqs.data.panel import DensePanel, FieldPanel, FramePanel, ShardedPanel, save_fields, hash_array, hash_index
+from jaqs.data.fetcher import FetchPlanner
+from jaqs.data.cache import ExprCache
+from jaqs.data.pit import PointInTimeStore
 
 
 class DataView(object):
@@ -32,18 +44,65 @@ class DataView(object):
     end_date : int
     fields : list
     freq : int
+    n_workers : int
+        Max number of queries sent to data_api at the same time. 1 means no concurrency.
+    chunk_size : int
+        Max number of symbols in one query. Non-positive means no limit.
+    chunk_days : int
+        Max number of calendar days in one daily query.
+        0 means chosen by chunk_size so that one query returns about MAX_ROWS_PER_QUERY rows.
+    n_retries : int
+        Times to retry a failed query.
+    snapshot_cache_size : int
+        Number of recent results of get_snapshot_arrays to keep. 0 means no cache.
+    storage : {'frame', 'dense', 'field', 'sharded'}
+        'frame' stores daily data in a MultiIndex DataFrame;
+        'dense' stores daily data in a DensePanel, and data_d is a thin adapter on top of it;
+        'field' stores daily and quarterly data in FieldPanels, i.e. one 2-D array per field, so that adding
+        or removing a field costs the size of one field. data_d and data_q are only built when accessed;
+        'sharded' stores daily data on disk in a ShardedPanel, for data larger than memory.
+        Data is prepared shard by shard, and formulas are evaluated shard by shard (time series functions)
+        or block by block of dates (cross section functions). data_d loads all data, avoid it.
+    memory_budget : int
+        Approximate max megabytes of daily data in memory at once for 'sharded' storage,
+        used to decide shard_size and number of dates evaluated at once by cross section functions.
+    shard_size : int
+        Number of symbols in one shard. 0 means chosen by memory_budget.
+    shard_path : str
+        Folder of shards. Default a new temporary folder.
+    expr_cache : ExprCache or None
+        On-disk cache of results of daily formulas, see set_expr_cache. Default None, no cache.
+    dtype_policy : {'default', 'compact'}
+        'default' stores all daily data as float64 or object.
+        'compact' stores daily float fields as float32, except those in exact_fields and quarterly fields;
+        for 'dense' storage, labels (trade_status and group fields) are also stored as integer codes
+        with a shared dictionary, and index_member as bool.
+    exact_fields : set
+        Daily fields which are kept float64 in 'compact' dtype_policy, eg. volume and market value.
     market_daily_fields, reference_daily_fields : list
+    custom_formulas : list of dict
+        Formulas added by add_formula: field_name, formula, is_quarterly, formula_func_name_style and within_index.
     data_d : pd.DataFrame
         All daily frequency data will be merged and stored here.
         index is date, columns is symbol-field MultiIndex
     data_q : pd.DataFrame
         All quarterly frequency data will be merged and stored here.
         index is date, columns is symbol-field MultiIndex
+        If a report is restated, data_q keeps its first announced version (the smallest ann_date),
+        whatever the order returned by the data server. Restated versions take effect in daily data
+        on their own ann_date.
     
     """
     def __init__(self):
         self.data_api = None
         
+        self.storage = 'frame'
+        self.dtype_policy = 'default'
+        self._data_d = None
+        self._panel_d = None
+        self._data_q = None
+        self._panel_q = None
+        
         self.universe = ""
         self.symbol = []
         self.start_date = 0
@@ -53,17 +112,34 @@ class DataView(object):
         self.fields = []
         self.freq = 1
         self.all_price = True
+        self.n_workers = 4
+        self.chunk_size = 300
+        self.chunk_days = 0
+        self.n_retries = 2
+        self.memory_budget = 2048
+        self.shard_size = 0
+        self.shard_path = ""
+        self.expr_cache = None
 
         self.meta_data_list = ['start_date', 'end_date',
                                'extended_start_date_d', 'extended_start_date_q',
-                               'freq', 'fields', 'symbol', 'universe',
-                               'custom_daily_fields', 'custom_quarterly_fields']
+                               'freq', 'fields', 'symbol', 'universe', 'all_price',
+                               'custom_daily_fields', 'custom_quarterly_fields', 'custom_formulas', 'storage',
+                               'dtype_policy']
         self.adjust_mode = 'post'
         
+        # {'data_d' or 'data_q': {field: content hash}}. A field without hash has been changed since it was hashed.
+        self._field_hashes = {'data_d': dict(), 'data_q': dict()}
         self.data_d = None
         self.data_q = None
         self._data_benchmark = None
         self._data_inst = None
+        # {statement type: PointInTimeStore} of all announced versions of quarterly data. Not saved.
+        self._pit_stores = OrderedDict()
+        # index of daily data for get_snapshot_arrays, rebuilt after daily data is changed
+        self._snapshot_panel = None
+        self._snapshot_cache = OrderedDict()
+        self.snapshot_cache_size = 8
         # self._data_group = None
         
         common_list = {'symbol', 'start_date', 'end_date'}
@@ -85,6 +161,11 @@ class DataView(object):
              "float_share", "price_div_dps", "free_share", "np_parent_comp_ttm",
              "np_parent_comp_lyr", "net_assets", "ncf_oper_ttm", "ncf_oper_lyr", "oper_rev_ttm",
              "oper_rev_lyr", "limit_status"}
+        # large numbers and dates lose precision in float32
+        self.exact_fields = {'volume', 'turnover', 'oi', 'total_mv', 'float_mv', 'total_share', 'float_share',
+                             'free_share', 'np_parent_comp_ttm', 'np_parent_comp_lyr', 'net_assets',
+                             'ncf_oper_ttm', 'ncf_oper_lyr', 'oper_rev_ttm', 'oper_rev_lyr', 'index_weight',
+                             'adjust_factor', 'ann_date'}
         self.fin_stat_income = \
             {"symbol", "ann_date", "start_date", "end_date",
              "comp_type_code", "comp_type_code", "act_ann_date", "start_actdate",
@@ -211,15 +292,156 @@ class DataView(object):
              "qfa_yoyprofit","qfa_cgrprofit","qfa_yoynetprofit","qfa_cgrnetprofit","yoy_equity","rd_expense","waa_roe"}
         self .custom_daily_fields = []
         self .custom_quarterly_fields = []
+        # formulas added by add_formula, in the order they are added. Used to re-calculate them in extend.
+        self.custom_formulas = []
         
         # co nst
         self .ANN_DATE_FIELD_NAME = 'ann_date'
         self .REPORT_DATE_FIELD_NAME = 'report_date'
         self.TRADE_STATUS_FIELD_NAME = 'trade_status'
         self.TRADE_DATE_FIELD_NAME = 'trade_date'
+        # content hashes of saved data, next to meta_data.json
+        self.MANIFEST_FILE_NAME = 'manifest.json'
+        # about rows returned by one query, used to decide chunk_days
+        self.MAX_ROWS_PER_QUERY = 200000
     
     # --------------------------------------------------------------------------------------------------------
     # Properties
+    @property
+    def data_d(self):
+        """
+        All daily data, index is date, columns is symbol-field MultiIndex.
+        For 'dense' storage, this is an adapter DataFrame built on top of the DensePanel.
+        For 'field' storage, this is built from the FieldPanel on first access after data is changed.
+        For 'sharded' storage, this loads all shards into memory.
+        
+        Returns
+        -------
+        pd.DataFrame or None
+
+        """
+        if self._data_d is None and self._panel_d is not None:
+            self._data_d = self._panel_d.to_frame()
+        return self._data_d
+    
+    @data_d.setter
+    def data_d(self, df_new):
+        self._clear_snapshot_cache()
+        self._mark_changed(is_quarterly=False)
+        if df_new is not None and self.storage == 'dense':
+            if self.dtype_policy == 'compact':
+                fields = set(df_new.columns.get_level_values(level=1))
+                extra_dtypes = {field: self._compact_dtype(field) for field in fields}
+                extra_dtypes = {field: dtype for field, dtype in extra_dtypes.items() if dtype is not None}
+                self._panel_d = DensePanel.from_frame(df_new, dtype=np.float32, extra_dtypes=extra_dtypes)
+            else:
+                self._panel_d = DensePanel.from_frame(df_new)
+            self._data_d = None
+        elif df_new is not None and self.storage == 'field':
+            if self.dtype_policy == 'compact':
+                df_new = self._compact_frame(df_new)
+            self._panel_d = FieldPanel.from_frame(df_new)
+            self._data_d = None
+        elif df_new is not None and self.storage == 'sharded':
+            if self.dtype_policy == 'compact':
+                df_new = self._compact_frame(df_new)
+            shard_size = self._get_shard_size(len(df_new.index), len(set(df_new.columns.get_level_values(1))))
+            self._panel_d = ShardedPanel.from_frame(self._new_shard_folder(), df_new, shard_size)
+            self._data_d = None
+        else:
+            if df_new is not None and self.dtype_policy == 'compact':
+                df_new = self._compact_frame(df_new)
+            self._panel_d = None
+            self._data_d = df_new
+
+    def _compact_dtype(self, field_name):
+        """
+        dtype of a daily field in 'compact' dtype_policy.
+        
+        Returns
+        -------
+        np.dtype or 'category' or None
+            None means float32.
+
+        """
+        if field_name in self.group_fields or field_name == self.TRADE_STATUS_FIELD_NAME:
+            return 'category'
+        if field_name == 'index_member':
+            return np.bool_
+        if field_name in self.exact_fields or self._is_quarter_field(field_name):
+            return np.float64
+        return None
+
+    def _compact_frame(self, df):
+        """Convert float64 columns of a MultiIndex DataFrame to float32, if they are not exact fields."""
+        dtypes = df.dtypes
+        fields = dtypes.index.get_level_values(level=1)
+        compact_fields = {field for field in set(fields) if self._compact_dtype(field) is None}
+        mask = np.array([dtype == np.float64 and field in compact_fields
+                         for dtype, field in zip(dtypes.values, fields)], dtype=bool)
+        if not mask.any():
+            return df
+        return df.astype({col: np.float32 for col in dtypes.index[mask]})
+
+    def _has_daily_data(self):
+        """Whether daily data exists, without building data_d from panel."""
+        return self._data_d is not None or self._panel_d is not None
+
+    def _new_shard_folder(self):
+        if not self.shard_path:
+            self.shard_path = tempfile.mkdtemp(prefix='jaqs_shards_')
+        return self.shard_path
+
+    def _budget_count(self, bytes_per_item):
+        """Number of items (symbols or dates) of bytes_per_item each which fit in memory_budget."""
+        # pandas operations make a few temporary copies of their inputs
+        n_copies = 4
+        return max(int(self.memory_budget * 1024 ** 2 // (bytes_per_item * n_copies)), 1)
+
+    def _get_shard_size(self, n_dates, n_fields):
+        """Number of symbols in one shard, see shard_size and memory_budget."""
+        if self.shard_size > 0:
+            return self.shard_size
+        return self._budget_count(max(n_dates * n_fields * 8, 1))
+    
+    @property
+    def panel_d(self):
+        """
+        Panel of daily data. DensePanel for 'dense' storage, ShardedPanel for 'sharded' storage,
+        FieldPanel for 'field' storage or DataView loaded from 'npy' format.
+        
+        Returns
+        -------
+        DensePanel or FieldPanel or ShardedPanel or None
+
+        """
+        return self._panel_d
+    
+    @property
+    def data_q(self):
+        """
+        All quarterly data, index is report date, columns is symbol-field MultiIndex.
+        For DataView loaded from 'npy' format, it will be built from memory-mapped fields on first access.
+        
+        Returns
+        -------
+        pd.DataFrame or None
+
+        """
+        if self._data_q is None and self._panel_q is not None:
+            self._data_q = self._panel_q.to_frame()
+        return self._data_q
+    
+    @data_q.setter
+    def data_q(self, df_new):
+        self._mark_changed(is_quarterly=True)
+        if df_new is not None and self.storage == 'field':
+            self._panel_q = FieldPanel.from_frame(df_new, index_name=self.REPORT_DATE_FIELD_NAME)
+            self._data_q = None
+        else:
+            self._panel_q = None
+            self._data_q = df_new
+    
     @property
     def data_benchmark(self):
         return self._data_benchmark
@@ -237,7 +459,7 @@ class DataView(object):
     
     @data_benchmark.setter
     def data_benchmark(self, df_new):
-        if self.data_d is not None and df_new.shape[0] != self.data_d.shape[0]:
+        if self._has_daily_data() and df_new.shape[0] != len(self.dates):
             raise ValueError("You must provide a DataFrame with the same shape of data_benchmark.")
         self._data_benchmark = df_new
 
@@ -252,7 +474,9 @@ class DataView(object):
             dtype: int
 
         """
-        if self.data_d is not None:
+        if self._panel_d is not None:
+            res = self._panel_d.dates
+        elif self.data_d is not None:
             res = self.data_d.index.values
         elif self.data_api is not None:
             res = self.data_api.get_trade_date_range(self.extended_start_date_d, self.end_date)
@@ -410,6 +634,20 @@ class DataView(object):
         self.end_date = props['end_date']
         self.all_price = props.get('all_price', True)
         self.freq = props.get('freq', 1)
+        self.n_workers = props.get('n_workers', 4)
+        self.chunk_size = props.get('chunk_size', 300)
+        self.chunk_days = props.get('chunk_days', 0)
+        self.n_retries = props.get('n_retries', 2)
+        self.storage = props.get('storage', 'frame')
+        if self.storage not in ('frame', 'dense', 'field', 'sharded'):
+            raise NotImplementedError("storage = {}".format(self.storage))
+        self.memory_budget = props.get('memory_budget', 2048)
+        self.shard_size = props.get('shard_size', 0)
+        self.shard_path = props.get('shard_path', "")
+        self.set_expr_cache(props.get('expr_cache_path', ""), props.get('expr_cache_max_size_mb', None))
+        self.dtype_policy = props.get('dtype_policy', 'default')
+        if self.dtype_policy not in ('default', 'compact'):
+            raise NotImplementedError("dtype_policy = {}".format(self.dtype_policy))
     
         # get and filter fields
         fields = props.get('fields', [])
@@ -441,45 +679,310 @@ class DataView(object):
         print("Initialize config success.")
 
     def prepare_data(self):
-        """Prepare data for the FIRST time."""
-        # prepare benchmark and group
+        """
+        Prepare data for the FIRST time.
+        Independent queries are sent concurrently by at most self.n_workers threads.
+        Large queries are split into chunks, see self.chunk_size and self.chunk_days.
+        
+        """
+        if self.storage == 'sharded':
+            self._prepare_data_sharded()
+            return
+
         print("Query data...")
-        data_d, data_q = self._prepare_daily_quarterly(self.fields)
+        planner = self._new_planner()
+        self._add_query_data_tasks(planner, self.symbol, self.fields)
+        # adj_factor depends on instrument info, so they are queried one after another in one task
+        planner.add('inst_adj', self._query_inst_and_adj_factor)
+        if self.universe:
+            planner.add('benchmark', self._prepare_benchmark)
+            planner.add('comp_info', self._query_comp_info, self.extended_start_date_d, self.end_date)
+        group_fields = self._get_fields('group', self.fields)
+        for field in group_fields:
+            planner.add(field, self._query_group, field, self.extended_start_date_q, self.end_date)
+        self._pit_stores = OrderedDict()
+        daily_list, quarterly_list, res = self._collect_query_data(planner.iter_run(), self.fields,
+                                                                   pit_stores=self._pit_stores)
+        data_d, data_q = self._process_daily_quarterly(daily_list, quarterly_list)
         self.data_d, self.data_q = data_d, data_q
         self._align_and_merge_q_into_d()
     
-        print("Query instrument info...")
-        self._prepare_inst_info()
-    
-        print("Query adj_factor...")
-        self._prepare_adj_factor()
+        df_adj = res['inst_adj']
+        if df_adj is not None:
+            self.append_df(df_adj, 'adjust_factor', is_quarterly=False)
     
         if self.universe:
-            print("Query benchmark...")
-            self._data_benchmark = self._prepare_benchmark()
-            print("Query benchmar member info...")
-            self._prepare_comp_info()
+            self._data_benchmark = res['benchmark']
+            df_member, df_weights = res['comp_info']
+            self.append_df(df_member, 'index_member', is_quarterly=False)
+            self.append_df(df_weights, 'index_weight', is_quarterly=False)
     
-        group_fields = self._get_fields('group', self.fields)
-        if group_fields:
-            print("Query groups (industry)...")
-            self._prepare_group(group_fields)
+        for field in group_fields:
+            self.append_df(res[field], field, is_quarterly=False)
     
         print("Data has been successfully prepared.")
 
+    def _new_shard_view(self, symbols):
+        """A DataView of 'frame' storage with the same config, for a part of symbols."""
+        dv = copy.copy(self)
+        dv.storage = 'frame'
+        dv.symbol = list(symbols)
+        dv.fields = list(self.fields)
+        dv.custom_daily_fields = list(self.custom_daily_fields)
+        dv.custom_quarterly_fields = list(self.custom_quarterly_fields)
+        dv.custom_formulas = []
+        dv._data_d, dv._panel_d, dv._data_q, dv._panel_q = None, None, None, None
+        dv._pit_stores = OrderedDict()
+        dv._clear_snapshot_cache()
+        return dv
+
+    def _prepare_data_sharded(self):
+        """
+        Prepare data for 'sharded' storage. Each shard of symbols is prepared by a DataView of 'frame' storage,
+        then saved to disk and released before the next one, so only one shard of daily data is in memory.
+        Quarterly data of all shards are merged in memory, they are much smaller than daily data.
+        
+        """
+        dates = self.dates
+        n_fields = len(self.fields) + len(self.group_fields) + 3
+        shard_size = self._get_shard_size(len(dates), n_fields)
+        chunks = [self.symbol[i: i + shard_size] for i in range(0, len(self.symbol), shard_size)]
+        print("Prepare data of {:d} shards...".format(len(chunks)))
+
+        self._pit_stores = OrderedDict()
+        list_q, list_inst = [], []
+        shard_views = []
+
+        def iter_panels():
+            for i, symbols in enumerate(chunks):
+                print("Prepare shard {:d} / {:d}...".format(i + 1, len(chunks)))
+                dv = self._new_shard_view(symbols)
+                dv.prepare_data()
+                if dv.data_q is not None:
+                    list_q.append(dv.data_q)
+                if dv.data_inst is not None:
+                    list_inst.append(dv.data_inst)
+                for type_, store in dv._pit_stores.items():
+                    self._pit_stores.setdefault(type_, PointInTimeStore()).add(store._df)
+                del shard_views[:]
+                shard_views.append(dv)
+                yield FieldPanel.from_frame(dv.data_d.reindex(index=dates))
+
+        self._panel_d = ShardedPanel.from_panels(self._new_shard_folder(), iter_panels(),
+                                                 index_name=self.TRADE_DATE_FIELD_NAME)
+        self._data_d = None
+        self._clear_snapshot_cache()
+        self._mark_changed(is_quarterly=False)
+
+        dv = shard_views[0]
+        self.fields = dv.fields
+        self.custom_daily_fields = dv.custom_daily_fields
+        self.custom_quarterly_fields = dv.custom_quarterly_fields
+        self._data_benchmark = dv.data_benchmark
+        if list_inst:
+            self._data_inst = pd.concat(list_inst, axis=0)
+        if list_q:
+            data_q = pd.concat(list_q, axis=1).sort_index(axis=1, level=['symbol', 'field'])
+            data_q.index.name = self.REPORT_DATE_FIELD_NAME
+            self.data_q = data_q
+        else:
+            self.data_q = None
+
+        print("Data has been successfully prepared.")
+
+    def extend(self, end_date, data_api=None):
+        """
+        Extend prepared (or loaded) data to a later end_date. Only data of new trade dates will be queried.
+
+        Daily fields, adjust factor, index member / weight and groups are queried for new dates only.
+        Newly announced quarterly data are merged into data_q, then expanded to new dates.
+        Formulas added by add_formula are re-calculated on new dates, using as many previous dates as they need.
+
+        Parameters
+        ----------
+        end_date : int
+        data_api : RemoteDataService, optional
+
+        Returns
+        -------
+        bool
+            whether extend successfully.
+
+        Notes
+        -----
+        Symbols are not changed. Custom data added by append_df will be NaN on new dates.
+
+        """
+        if data_api is not None:
+            self.data_api = data_api
+        if self.data_api is None:
+            print("Extend failed. No data_api available. Please specify one in parameter.")
+            return False
+        if not self._has_daily_data():
+            raise ValueError("Please prepare data first.")
+        if end_date <= self.end_date:
+            print("Extend failed: end_date [{:d}] must be later than [{:d}].".format(end_date, self.end_date))
+            return False
+
+        old_dates = self.dates
+        new_dates = self.data_api.get_trade_date_range(old_dates[-1], end_date)
+        new_dates = new_dates[new_dates > old_dates[-1]]
+        if len(new_dates) == 0:
+            self.end_date = end_date
+            print("No new trade dates.")
+            return True
+        start_date = new_dates[0]
+
+        print("Query data of new dates...")
+        df_new = self._query_new_dates(new_dates, start_date, end_date)
+
+        if self._panel_d is not None:
+            self._panel_d.append_dates(df_new)
+            self._clear_cached_frame(is_quarterly=False)
+            self._mark_changed(is_quarterly=False)
+        else:
+            df_new = df_new.reindex(columns=self.data_d.columns)
+            self.data_d = pd.concat([self.data_d, df_new], axis=0)
+
+        if self.universe and self._data_benchmark is not None:
+            df_bench = self._prepare_benchmark(start_date, end_date)
+            df_bench = pd.concat([self._data_benchmark, df_bench], axis=0)
+            self._data_benchmark = df_bench.loc[~df_bench.index.duplicated(keep='first')]
+        self.end_date = end_date
+
+        print("Re-calculate formulas...")
+        for dic in self.custom_formulas:
+            self._extend_formula(dic, n_old=len(old_dates))
+
+        print("Data has been successfully extended to {:d}.".format(end_date))
+        return True
+
+    def _query_new_dates(self, new_dates, start_date, end_date):
+        """
+        Query data of all fields of DataView on new_dates. Merge new quarterly data into data_q.
+
+        Returns
+        -------
+        pd.DataFrame
+            index is new_dates, columns is symbol-field MultiIndex
+
+        """
+        special_fields = {'adjust_factor', 'index_member', 'index_weight'} | self.group_fields
+        formula_fields = {dic['field_name'] for dic in self.custom_formulas}
+        query_fields = [field for field in set(self.fields)
+                        if (self._is_predefined_field(field)
+                            and field not in special_fields
+                            and field not in formula_fields
+                            and field not in self.custom_daily_fields
+                            and field not in self.custom_quarterly_fields)]
+
+        planner = self._new_planner()
+        self._add_query_data_tasks(planner, self.symbol, query_fields,
+                                   start_date_d=start_date, start_date_q=start_date, end_date=end_date)
+        if 'adjust_factor' in self.fields:
+            planner.add('adjust_factor', self._query_adj_factor, start_date, end_date)
+        if 'index_member' in self.fields or 'index_weight' in self.fields:
+            planner.add('comp_info', self._query_comp_info, start_date, end_date)
+        group_fields = self._get_fields('group', self.fields)
+        for field in group_fields:
+            planner.add(field, self._query_group, field, start_date, end_date)
+
+        df_list = []
+        # revisions are added to point-in-time stores, if any (they are not saved with DataView)
+        daily_list, quarterly_list, res = self._collect_query_data(planner.iter_run(), query_fields,
+                                                                   pit_stores=self._pit_stores or None)
+        data_d, data_q = self._process_daily_quarterly(daily_list, quarterly_list, dates=new_dates)
+        if data_d is not None:
+            df_list.append(data_d)
+        if self.data_q is not None:
+            if data_q is not None:
+                # existing values were announced earlier and are kept
+                data_q = self.data_q.combine_first(data_q)
+                data_q = data_q.sort_index(axis=1, level=['symbol', 'field'])
+                data_q.index.name = self.REPORT_DATE_FIELD_NAME
+                self.data_q = data_q
+            df_list.append(self._expand_quarterly(self.data_q, new_dates))
+
+        dic_special = OrderedDict()
+        if 'adjust_factor' in res:
+            dic_special['adjust_factor'] = res['adjust_factor']
+        if 'comp_info' in res:
+            dic_special['index_member'], dic_special['index_weight'] = res['comp_info']
+        for field in group_fields:
+            dic_special[field] = res[field]
+        for field, df in dic_special.items():
+            if df is None:
+                continue
+            df = df.reindex(index=new_dates)
+            df.columns = pd.MultiIndex.from_product([df.columns, [field]], names=['symbol', 'field'])
+            df_list.append(df)
+
+        df_new = self._merge_data(df_list, index_name=self.TRADE_DATE_FIELD_NAME)
+        df_new = df_new.reindex(index=new_dates)
+        df_new.index.name = self.TRADE_DATE_FIELD_NAME
+        return df_new
+
+    def _extend_formula(self, dic, n_old):
+        """
+        Re-calculate a formula added by add_formula after new dates are appended.
+
+        Parameters
+        ----------
+        dic : dict
+            Element of self.custom_formulas.
+        n_old : int
+            Number of dates before extension.
+
+        """
+        field_name = dic['field_name']
+        parser = Parser()
+        parser.set_capital(dic['formula_func_name_style'])
+        expr = parser.parse(dic['formula'])
+        var_list = expr.variables()
+
+        if isinstance(self._panel_d, ShardedPanel) and not dic['is_quarterly']:
+            self._evaluate_formula_sharded(parser, field_name, within_index=dic['within_index'])
+            return
+
+        lookback = parser.lookback()
+        use_quarterly = dic['is_quarterly'] or any([self._is_quarter_field(var) for var in var_list])
+        if use_quarterly or lookback is None:
+            # quarterly data may be restated and unbounded functions depend on all data: re-calculate all.
+            df_eval = self._evaluate_formula(parser, var_list, within_index=dic['within_index'])
+            if dic['is_quarterly']:
+                self._set_field_data(df_eval, field_name, is_quarterly=True)
+                df_eval = align(df_eval, self._get_ann_df(), self.dates)
+            self._set_field_data(df_eval, field_name, is_quarterly=False)
+            return
+
+        dates = self.dates
+        df_eval = self._evaluate_formula(parser, var_list, within_index=dic['within_index'], start_date=dates[n_old])
+
+        df_field = self.get_ts(field_name, start_date=dates[0], end_date=dates[-1]).copy()
+        new_dates = dates[n_old:]
+        df_field.loc[new_dates, :] = df_eval.reindex(index=new_dates, columns=df_field.columns).values
+        self._set_field_data(df_field, field_name, is_quarterly=False)
+
     @staticmethod
     def _process_index_co(df, index_name):
         df = df.astype(dtype={index_name: int})
         df = df.drop_duplicates(subset=['symbol', index_name])
         return df
 
-    def _prepare_daily_quarterly(self, fields):
+    def _prepare_daily_quarterly(self, fields, dates=None, start_date_d=0, start_date_q=0, end_date=0,
+                                 pit_stores=None):
         """
         Query and process data from data_api.
         
         Parameters
         ----------
         fields : list
+        dates : np.ndarray, optional
+            Index of daily data. Default self.dates.
+        start_date_d, start_date_q, end_date : int, optional
+            Date range to query. Default self.extended_start_date_d, self.extended_start_date_q and self.end_date.
+        pit_stores : dict, optional
+            See _collect_query_data.
 
         Returns
         -------
@@ -492,125 +995,241 @@ class DataView(object):
     
         # query data
         print("Query data - query...")
-        daily_list, quarterly_list = self._query_data(self.symbol, fields)
-    
-        def pivot_and_sort(df, index_name):
-            df = self._process_index_co(df, index_name)
-            df = df.pivot(index=index_name, columns='symbol')
-            df.columns = df.columns.swaplevel()
-            col_names = ['symbol', 'field']
-            df.columns.names = col_names
-            df = df.sort_index(axis=1, level=col_names)
-            df.index.name = index_name
-            return df
+        daily_list, quarterly_list = self._query_data(self.symbol, fields,
+                                                      start_date_d=start_date_d, start_date_q=start_date_q,
+                                                      end_date=end_date, pit_stores=pit_stores)
+        return self._process_daily_quarterly(daily_list, quarterly_list, dates=dates)
+
+    def _process_daily_quarterly(self, daily_list, quarterly_list, dates=None):
+        """
+        Merge query results of _query_data and fill missing dates and symbols.
+        
+        Returns
+        -------
+        merge_d : pd.DataFrame or None
+        merge_q : pd.DataFrame or None
+
+        """
+        if dates is None:
+            dates = self.dates
     
         multi_daily = None
         multi_quarterly = None
         if daily_list:
-            daily_list_pivot = [pivot_and_sort(df, self.TRADE_DATE_FIELD_NAME) for df in daily_list]
-            multi_daily = self._merge_data(daily_list_pivot, self.TRADE_DATE_FIELD_NAME)
+            multi_daily = self._merge_data(daily_list, self.TRADE_DATE_FIELD_NAME)
             # use self.dates as index because original data have weekends
-            multi_daily = self._fill_missing_idx_col(multi_daily, index=self.dates, symbols=self.symbol)
+            multi_daily = self._fill_missing_idx_col(multi_daily, index=dates, symbols=self.symbol)
             print("Query data - daily fields prepared.")
         if quarterly_list:
-            quarterly_list_pivot = [pivot_and_sort(df, self.REPORT_DATE_FIELD_NAME) for df in quarterly_list]
-            multi_quarterly = self._merge_data(quarterly_list_pivot, self.REPORT_DATE_FIELD_NAME)
+            multi_quarterly = self._merge_data(quarterly_list, self.REPORT_DATE_FIELD_NAME)
             multi_quarterly = self._fill_missing_idx_col(multi_quarterly, index=None, symbols=self.symbol)
             print("Query data - quarterly fields prepared.")
     
         return multi_daily, multi_quarterly
 
-    def _query_data(self, symbol, fields):
+    def _query_data(self, symbol, fields, start_date_d=0, start_date_q=0, end_date=0, pit_stores=None):
         """
-        Query data using different APIs, then store them in dict.
-        period, start_date and end_date are fixed.
-        Keys of dict are securitites.
+        Query data using different APIs concurrently.
         
         Parameters
         ----------
         symbol : list of str
         fields : list of str
+        start_date_d : int, optional
+            Start date of daily data. Default self.extended_start_date_d.
+        start_date_q : int, optional
+            Start date (announcement date) of quarterly data. Default self.extended_start_date_q.
+        end_date : int, optional
+            Default self.end_date.
+        pit_stores : dict, optional
+            See _collect_query_data.
 
         Returns
         -------
-        daily_list : list
-        quarterly_list : list
+        daily_list : list of pd.DataFrame
+            Pivoted, index is trade_date, columns is symbol-field MultiIndex.
+        quarterly_list : list of pd.DataFrame
+            Pivoted, index is report_date, columns is symbol-field MultiIndex.
 
         """
-        sep = ','
-        symbol_str = sep.join(symbol)
-    
-        if self.freq == 1:
-            daily_list = []
-            quarterly_list = []
-        
-            # TODO : use fields = {field: kwargs} to enable params
-            fields_market_daily = self._get_fields('market_daily', fields, append=True)
-            if fields_market_daily:
-                print("NOTE: price adjust method is [{:s} adjust]".format(self.adjust_mode))
-                # no adjust prices and other market daily fields
-                df_daily, msg1 = self.data_api.daily(symbol_str, start_date=self.extended_start_date_d, end_date=self.end_date,
-                                                     adjust_mode=None, fields=sep.join(fields_market_daily))
-                if msg1 != '0,':
-                    print(msg1)
-            
-                if self.all_price:
-                    adj_cols = ['open', 'high', 'low', 'close', 'vwap']
-                    # adjusted prices
-                    df_daily_adjust, msg11 = self.data_api.daily(symbol_str, start_date=self.extended_start_date_d, end_date=self.end_date,
-                                                                 adjust_mode=self.adjust_mode, fields=','.join(adj_cols))
-                    if msg11 != '0,':
-                        print(msg11)
-                
-                    df_daily = pd.merge(df_daily, df_daily_adjust, how='outer',
-                                        on=['symbol', 'trade_date'], suffixes=('', '_adj'))
-                daily_list.append(df_daily.loc[:, fields_market_daily])
-        
-            fields_ref_daily = self._get_fields('ref_daily', fields, append=True)
-            if fields_ref_daily:
-                df_ref_daily, msg2 = self.data_api.query_lb_dailyindicator(symbol_str, self.extended_start_date_d, self.end_date,
-                                                                           sep.join(fields_ref_daily))
-                if msg2 != '0,':
-                    print(msg2)
-                daily_list.append(df_ref_daily.loc[:, fields_ref_daily])
-        
-            fields_income = self._get_fields('income', fields, append=True)
-            if fields_income:
-                df_income, msg3 = self.data_api.query_lb_fin_stat('income', symbol_str, self.extended_start_date_q, self.end_date,
-                                                                  sep.join(fields_income), drop_dup_cols=['symbol', self.REPORT_DATE_FIELD_NAME])
-                if msg3 != '0,':
-                    print(msg3)
-                quarterly_list.append(df_income.loc[:, fields_income])
-        
-            fields_balance = self._get_fields('balance_sheet', fields, append=True)
-            if fields_balance:
-                df_balance, msg3 = self.data_api.query_lb_fin_stat('balance_sheet', symbol_str, self.extended_start_date_q, self.end_date,
-                                                                   sep.join(fields_balance), drop_dup_cols=['symbol', self.REPORT_DATE_FIELD_NAME])
-                if msg3 != '0,':
-                    print(msg3)
-                quarterly_list.append(df_balance.loc[:, fields_balance])
-        
-            fields_cf = self._get_fields('cash_flow', fields, append=True)
-            if fields_cf:
-                df_cf, msg3 = self.data_api.query_lb_fin_stat('cash_flow', symbol_str, self.extended_start_date_q, self.end_date,
-                                                              sep.join(fields_cf), drop_dup_cols=['symbol', self.REPORT_DATE_FIELD_NAME])
-                if msg3 != '0,':
-                    print(msg3)
-                quarterly_list.append(df_cf.loc[:, fields_cf])
-        
-            fields_fin_ind = self._get_fields('fin_indicator', fields, append=True)
-            if fields_fin_ind:
-                df_fin_ind, msg4 = self.data_api.query_lb_fin_stat('fin_indicator', symbol_str,
-                                                                   self.extended_start_date_q, self.end_date,
-                                                                   sep.join(fields_cf), drop_dup_cols=['symbol', self.REPORT_DATE_FIELD_NAME])
-                if msg4 != '0,':
-                    print(msg4)
-                quarterly_list.append(df_fin_ind.loc[:, fields_fin_ind])
+        planner = self._new_planner()
+        self._add_query_data_tasks(planner, symbol, fields,
+                                   start_date_d=start_date_d, start_date_q=start_date_q, end_date=end_date)
+        daily_list, quarterly_list, _ = self._collect_query_data(planner.iter_run(), fields, pit_stores=pit_stores)
+        return daily_list, quarterly_list
+
+    def _new_planner(self):
+        return FetchPlanner(self.n_workers, n_retries=self.n_retries)
+
+    def _split_query(self, symbol, start_date, end_date, split_dates=True):
+        """
+        Split a query into chunks of at most self.chunk_size symbols and self.chunk_days calendar days.
+
+        Returns
+        -------
+        symbol_chunks : list of str
+            Comma separated symbols.
+        date_chunks : list of tuple
+            [(start_date, end_date)]
+
+        """
+        chunk_size = self.chunk_size if self.chunk_size > 0 else max(len(symbol), 1)
+        symbol_chunks = [','.join(symbol[i: i + chunk_size]) for i in range(0, len(symbol), chunk_size)]
     
-        else:
-            raise NotImplementedError("freq = {}".format(self.freq))
+        date_chunks = [(start_date, end_date)]
+        if split_dates:
+            chunk_days = self.chunk_days
+            if not chunk_days:
+                n_symbols = min(chunk_size, len(symbol))
+                # about 245 trade days in 365 calendar days
+                chunk_days = max(self.MAX_ROWS_PER_QUERY // max(n_symbols, 1) * 365 // 245, 30)
+            date_chunks = jutil.split_date_range(start_date, end_date, chunk_days)
+        return symbol_chunks, date_chunks
+
+    def _add_query_data_tasks(self, planner, symbol, fields, start_date_d=0, start_date_q=0, end_date=0):
+        """
+        Add queries of fields to planner. Parameters are the same with _query_data.
+        Each query is split into chunks by _split_query, named (query type, symbol chunk No., date chunk No.).
+        Use _collect_query_data to get results.
+        
+        Parameters
+        ----------
+        planner : FetchPlanner
+
+        """
+        sep = ','
+        if not start_date_d:
+            start_date_d = self.extended_start_date_d
+        if not start_date_q:
+            start_date_q = self.extended_start_date_q
+        if not end_date:
+            end_date = self.end_date
     
-        return daily_list, quarterly_list
+        if self.freq != 1:
+            raise NotImplementedError("freq = {}. Use IntradayDataView for minute bars.".format(self.freq))
+        
+        symbol_chunks, date_chunks = self._split_query(symbol, start_date_d, end_date)
+        
+        # TODO : use fields = {field: kwargs} to enable params
+        fields_market_daily = self._get_fields('market_daily', fields, append=True)
+        if fields_market_daily:
+            print("NOTE: price adjust method is [{:s} adjust]".format(self.adjust_mode))
+            adj_cols = ['open', 'high', 'low', 'close', 'vwap']
+            for i, symbol_str in enumerate(symbol_chunks):
+                for j, (start, end) in enumerate(date_chunks):
+                    # no adjust prices and other market daily fields
+                    planner.add(('market_daily', i, j), self.data_api.daily, symbol_str,
+                                start_date=start, end_date=end,
+                                adjust_mode=None, fields=sep.join(fields_market_daily))
+                    if self.all_price:
+                        # adjusted prices, added right after its no adjust partner to be merged when it arrives
+                        planner.add(('market_daily_adjust', i, j), self.data_api.daily, symbol_str,
+                                    start_date=start, end_date=end,
+                                    adjust_mode=self.adjust_mode, fields=sep.join(adj_cols))
+        
+        fields_ref_daily = self._get_fields('ref_daily', fields, append=True)
+        if fields_ref_daily:
+            for i, symbol_str in enumerate(symbol_chunks):
+                for j, (start, end) in enumerate(date_chunks):
+                    planner.add(('ref_daily', i, j), self.data_api.query_lb_dailyindicator, symbol_str, start, end,
+                                sep.join(fields_ref_daily))
+        
+        # quarterly data are small, only split by symbol
+        symbol_chunks, _ = self._split_query(symbol, start_date_q, end_date, split_dates=False)
+        for type_ in ['income', 'balance_sheet', 'cash_flow', 'fin_indicator']:
+            fields_type = self._get_fields(type_, fields, append=True)
+            if fields_type:
+                for i, symbol_str in enumerate(symbol_chunks):
+                    # keep all announced versions of the same report
+                    planner.add((type_, i, 0), self.data_api.query_lb_fin_stat, type_, symbol_str, start_date_q,
+                                end_date, sep.join(fields_type),
+                                drop_dup_cols=['symbol', self.REPORT_DATE_FIELD_NAME, self.ANN_DATE_FIELD_NAME])
+
+    def _pivot_and_sort(self, df, index_name):
+        df = self._process_index_co(df, index_name)
+        df = df.pivot(index=index_name, columns='symbol')
+        df.columns = df.columns.swaplevel()
+        col_names = ['symbol', 'field']
+        df.columns.names = col_names
+        df = df.sort_index(axis=1, level=col_names)
+        df.index.name = index_name
+        return df
+
+    def _collect_query_data(self, results, fields, pit_stores=None):
+        """
+        Select fields from results of queries added by _add_query_data_tasks and pivot them.
+        Each chunk is pivoted as soon as it arrives, so raw results do not stay in memory all together.
+        For quarterly data, the first announced version of each report is pivoted.
+        
+        Parameters
+        ----------
+        results : iterable of tuple
+            (name, result) of queries, eg. FetchPlanner.iter_run()
+        fields : list of str
+        pit_stores : dict, optional
+            {statement type: PointInTimeStore}. If provided, all versions of quarterly data are added to them,
+            new stores are created for new statement types.
+
+        Returns
+        -------
+        daily_list : list of pd.DataFrame
+        quarterly_list : list of pd.DataFrame
+        others : OrderedDict
+            {name: result} of other queries in results.
+
+        """
+        types_daily = ['market_daily', 'ref_daily']
+        types_quarterly = ['income', 'balance_sheet', 'cash_flow', 'fin_indicator']
+        chunks = {type_: OrderedDict() for type_ in types_daily + types_quarterly}
+        others = OrderedDict()
+        raw_quarterly = {type_: [] for type_ in types_quarterly}
+        df_no_adjust = None
+        
+        for name, res in results:
+            if not (isinstance(name, tuple) and len(name) == 3):
+                others[name] = res
+                continue
+            
+            type_, i, j = name
+            df, msg = res
+            if msg != '0,':
+                print(msg)
+            if type_ == 'market_daily' and self.all_price:
+                # wait for adjusted prices, which come next
+                df_no_adjust = df
+                continue
+            if type_ == 'market_daily_adjust':
+                df = pd.merge(df_no_adjust, df, how='outer', on=['symbol', 'trade_date'], suffixes=('', '_adj'))
+                df_no_adjust = None
+                type_ = 'market_daily'
+            
+            df = df.loc[:, self._get_fields(type_, fields, append=True)]
+            if len(df) == 0:
+                continue
+            if type_ in ['market_daily', 'ref_daily']:
+                index_name = self.TRADE_DATE_FIELD_NAME
+            else:
+                index_name = self.REPORT_DATE_FIELD_NAME
+                if pit_stores is not None:
+                    raw_quarterly[type_].append(df)
+                df = df.sort_values(by=['symbol', self.REPORT_DATE_FIELD_NAME, self.ANN_DATE_FIELD_NAME], axis=0)
+            chunks[type_].setdefault(i, []).append(self._pivot_and_sort(df, index_name))
+        
+        def concat_chunks(dic):
+            # date chunks of the same symbols, then symbol chunks
+            dfs = [pd.concat(l, axis=0) if len(l) > 1 else l[0] for l in dic.values()]
+            df = pd.concat(dfs, axis=1) if len(dfs) > 1 else dfs[0]
+            return df.sort_index(axis=0).sort_index(axis=1, level=['symbol', 'field'])
+        
+        daily_list = [concat_chunks(chunks[type_]) for type_ in types_daily if chunks[type_]]
+        quarterly_list = [concat_chunks(chunks[type_]) for type_ in types_quarterly if chunks[type_]]
+        
+        if pit_stores is not None:
+            for type_ in types_quarterly:
+                if raw_quarterly[type_]:
+                    store = pit_stores.setdefault(type_, PointInTimeStore())
+                    store.add(pd.concat(raw_quarterly[type_], axis=0))
+        return daily_list, quarterly_list, others
 
     '''
     @staticmethod
@@ -859,39 +1478,79 @@ class DataView(object):
         else:
             return df
 
+    def _expand_quarterly(self, data_q, dates):
+        """
+        Expand all fields of quarterly data to daily frequency of dates, using announcement dates.
+        Fields in point-in-time stores are expanded with restatements taking effect on their own ann_date.
+        Other fields (eg. custom fields, or all fields of a loaded DataView) use the ann_date in data_q.
+        
+        Returns
+        -------
+        pd.DataFrame
+            index is dates, columns is symbol-field MultiIndex
+
+        """
+        symbols = np.unique(data_q.columns.get_level_values(level='symbol'))
+        fields = set(data_q.columns.get_level_values(level='field'))
+        df_list = []
+        for store in self._pit_stores.values():
+            fields_store = [field for field in [self.ANN_DATE_FIELD_NAME] + store.fields if field in fields]
+            for field, df in store.expand(dates, fields_store, symbols).items():
+                df.columns = pd.MultiIndex.from_product([df.columns, [field]], names=['symbol', 'field'])
+                df_list.append(df)
+            fields = fields - set(fields_store)
+        
+        if fields:
+            df_ref_ann = data_q.loc[:, pd.IndexSlice[:, self.ANN_DATE_FIELD_NAME]].copy()
+            df_ref_ann.columns = df_ref_ann.columns.droplevel(level='field')
+            # by column multiindex fields, all fields share the same announcement dates
+            df_list_q = [df for field, df in data_q.groupby(level=1, axis=1) if field in fields]
+            df_list.extend(align_many(df_list_q, df_ref_ann, dates))
+        df_quarterly_expanded = pd.concat(df_list, axis=1)
+        df_quarterly_expanded = df_quarterly_expanded.sort_index(axis=1, level=['symbol', 'field'])
+        df_quarterly_expanded.index.name = self.TRADE_DATE_FIELD_NAME
+        return df_quarterly_expanded
+
     def _align_and_merge_q_into_d(self):
         data_d, data_q = self.data_d, self.data_q
         if data_d is not None and data_q is not None:
-            df_ref_ann = data_q.loc[:, pd.IndexSlice[:, self.ANN_DATE_FIELD_NAME]].copy()
-            df_ref_ann.columns = df_ref_ann.columns.droplevel(level='field')
-        
-            dic_expanded = dict()
-            for field_name, df in data_q.groupby(level=1, axis=1):  # by column multiindex fields
-                df_expanded = align(df, df_ref_ann, self.dates)
-                dic_expanded[field_name] = df_expanded
-            df_quarterly_expanded = pd.concat(dic_expanded.values(), axis=1)
-            df_quarterly_expanded.index.name = self.TRADE_DATE_FIELD_NAME
+            df_quarterly_expanded = self._expand_quarterly(data_q, self.dates)
         
             data_d_merge = self._merge_data([data_d, df_quarterly_expanded], index_name=self.TRADE_DATE_FIELD_NAME)
             data_d = data_d_merge.loc[data_d.index, :]
         self.data_d = data_d
 
-    def _prepare_adj_factor(self):
-        """Query and append daily adjust factor for prices."""
+    def _query_adj_factor(self, start_date, end_date):
+        """Query daily adjust factor of stocks. Return None if there is no stock."""
         mask_stocks = self.data_inst['inst_type'] == 1
         if mask_stocks.sum() == 0:
-            return
+            return None
         symbol_stocks = self.data_inst.loc[mask_stocks].index.values
         symbol_str = ','.join(symbol_stocks)
         df_adj = self.data_api.get_adj_factor_daily(symbol_str,
-                                                    start_date=self.extended_start_date_d, end_date=self.end_date, div=False)
+                                                    start_date=start_date, end_date=end_date, div=False)
+        return df_adj
+
+    def _query_inst_and_adj_factor(self):
+        """Query instrument info, then adjust factor of stocks."""
+        self._prepare_inst_info()
+        return self._query_adj_factor(self.extended_start_date_d, self.end_date)
+
+    def _prepare_adj_factor(self):
+        """Query and append daily adjust factor for prices."""
+        df_adj = self._query_adj_factor(self.extended_start_date_d, self.end_date)
+        if df_adj is None:
+            return
         self.append_df(df_adj, 'adjust_factor', is_quarterly=False)
 
+    def _query_comp_info(self, start_date, end_date):
+        df = self.data_api.get_index_comp_df(self.universe, start_date, end_date)
+        df_weights = self.data_api.get_index_weights_daily(self.universe, start_date, end_date)
+        return df, df_weights
+
     def _prepare_comp_info(self):
-        df = self.data_api.get_index_comp_df(self.universe, self.extended_start_date_d, self.end_date)
+        df, df_weights = self._query_comp_info(self.extended_start_date_d, self.end_date)
         self.append_df(df, 'index_member', is_quarterly=False)
-    
-        df_weights = self.data_api.get_index_weights_daily(self.universe, self.extended_start_date_d, self.end_date)
         self.append_df(df_weights, 'index_weight', is_quarterly=False)
 
     def _prepare_inst_info(self):
@@ -902,23 +1561,31 @@ class DataView(object):
                                             inst_type="")
         self._data_inst = res
 
-    def _prepare_group(self, group_fields):
+    def _query_group(self, field, start_date, end_date):
         data_map = {'sw1': ('SW', 1),
                     'sw2': ('SW', 2),
                     'sw3': ('SW', 3),
                     'sw4': ('SW', 4),
                     'zz1': ('ZZ', 1),
                     'zz2': ('ZZ', 2)}
+        type_, level = data_map[field]
+        df = self.data_api.get_industry_daily(symbol=','.join(self.symbol),
+                                              start_date=start_date, end_date=end_date,
+                                              type_=type_, level=level)
+        return df
+
+    def _prepare_group(self, group_fields):
         for field in group_fields:
-            type_, level = data_map[field]
-            df = self.data_api.get_industry_daily(symbol=','.join(self.symbol),
-                                                  start_date=self.extended_start_date_q, end_date=self.end_date,
-                                                  type_=type_, level=level)
+            df = self._query_group(field, self.extended_start_date_q, self.end_date)
             self.append_df(df, field, is_quarterly=False)
 
-    def _prepare_benchmark(self):
+    def _prepare_benchmark(self, start_date=0, end_date=0):
+        if not start_date:
+            start_date = self.extended_start_date_d
+        if not end_date:
+            end_date = self.end_date
         df_bench, msg = self.data_api.daily(self.universe,
-                                            start_date=self.extended_start_date_d, end_date=self.end_date,
+                                            start_date=start_date, end_date=end_date,
                                             adjust_mode=self.adjust_mode, fields='trade_date,symbol,close,vwap,volume,turnover')
         if msg != '0,':
             raise ValueError("msg = '{:s}'".format(msg))
@@ -970,17 +1637,17 @@ class DataView(object):
             print("Field name [{}] not valid, ignore.".format(field_name))
             return False
 
-        merge_d, merge_q = self._prepare_daily_quarterly([field_name])
+        merge_d, merge_q = self._prepare_daily_quarterly([field_name], pit_stores=self._pit_stores or None)
     
         if self._is_daily_field(field_name):
-            if self.data_d is None:
+            if not self._has_daily_data():
                 raise ValueError("Please prepare [{:s}] first.".format(field_name))
-            merge, _ = self._prepare_daily_quarterly([field_name])
+            merge = merge_d
             is_quarterly = False
         else:
             if self.data_q is None:
                 raise ValueError("Please prepare [{:s}] first.".format(field_name))
-            _, merge = self._prepare_daily_quarterly([field_name])
+            merge = merge_q
             is_quarterly = True
         
         merge = merge.loc[:, pd.IndexSlice[:, field_name]]
@@ -988,15 +1655,14 @@ class DataView(object):
         self.append_df(merge, field_name, is_quarterly=is_quarterly)  # whether contain only trade days is decided by existing data.
         
         if is_quarterly:
-            df_ann = merge_q.loc[:, pd.IndexSlice[:, self.ANN_DATE_FIELD_NAME]]
-            df_ann.columns = df_ann.columns.droplevel(level='field')
-            df_expanded = align(merge, df_ann, self.dates)
+            df_expanded = self._expand_quarterly(merge_q, self.dates).loc[:, pd.IndexSlice[:, field_name]]
+            df_expanded.columns = df_expanded.columns.droplevel(level='field')
             self.append_df(df_expanded, field_name, is_quarterly=False)
         return True
     
     def add_formula(self, field_name, formula, is_quarterly,
                     formula_func_name_style='camel', data_api=None,
-                    within_index=True):
+                    within_index=True, start_date=0, chunk_size=None, profiler=None, n_threads=1):
         """
         Add a new field, which is calculated using existing fields.
         
@@ -1012,6 +1678,16 @@ class DataView(object):
         data_api : RemoteDataService, optional
         within_index : bool
             When do cross-section operatioins, whether just do within index components.
+        start_date : int, optional
+            Only evaluate daily formula since start_date, using data since the lookback of the formula before it
+            (see Parser.lookback). Values of earlier dates are NaN. Default all dates.
+        chunk_size : int, optional
+            Evaluate daily formula chunk_size dates at a time, to limit memory use on long histories.
+        profiler : ExprProfiler, optional
+            Records time, size and NaN ratio of each sub-expression, see jaqs.data.expr_graph.ExprProfiler.
+        n_threads : int, optional
+            Number of threads evaluating independent sub-expressions of the formula at the same time.
+            Default 1, evaluate them one by one.
         
         """
         if data_api is not None:
@@ -1026,7 +1702,6 @@ class DataView(object):
         
         expr = parser.parse(formula)
         
-        var_df_dic = dict()
         var_list = expr.variables()
         
         # TODO
@@ -1043,30 +1718,447 @@ class DataView(object):
                     if not success:
                         return
         
+        if isinstance(self._panel_d, ShardedPanel) and not is_quarterly:
+            # result is written to shards directly
+            self._evaluate_formula_sharded(parser, field_name, within_index=within_index, profiler=profiler)
+            self._add_field(field_name, is_quarterly=False)
+            self.custom_formulas.append({'field_name': field_name, 'formula': formula, 'is_quarterly': False,
+                                         'formula_func_name_style': formula_func_name_style,
+                                         'within_index': within_index})
+            return
+        
+        if is_quarterly:
+            df_eval = self._evaluate_formula(parser, var_list, within_index=within_index, profiler=profiler,
+                                             n_threads=n_threads)
+        else:
+            cache_key = None
+            if self.expr_cache is not None:
+                graph = ExprGraph(parser)
+                cache_key = self._formula_cache_key(graph, graph.add(field_name, expr), var_list,
+                                                    within_index=within_index, start_date=start_date)
+            df_eval = self._get_cached_formula(cache_key)
+            if df_eval is None:
+                df_eval = self._evaluate_formula(parser, var_list, within_index=within_index,
+                                                 start_date=start_date, chunk_size=chunk_size, profiler=profiler,
+                                                 n_threads=n_threads)
+                df_eval = self._reindex_daily_result(df_eval)
+                self._put_cached_formula(cache_key, df_eval)
+        
+        self.append_df(df_eval, field_name, is_quarterly=is_quarterly)
+        
+        if is_quarterly:
+            df_ann = self._get_ann_df()
+            df_expanded = align(df_eval, df_ann, self.dates)
+            self.append_df(df_expanded, field_name, is_quarterly=False)
+        
+        self.custom_formulas.append({'field_name': field_name, 'formula': formula, 'is_quarterly': is_quarterly,
+                                     'formula_func_name_style': formula_func_name_style,
+                                     'within_index': within_index})
+    
+    def add_formulas(self, formulas, is_quarterly,
+                     formula_func_name_style='camel', data_api=None,
+                     within_index=True, start_date=0, chunk_size=None, profiler=None, n_processes=1, n_threads=1):
+        """
+        Add several new fields at once, each calculated using existing fields.
+        Variables of all formulas are read once, and all results are appended in one step.
+        Formulas are compiled into one ExprGraph, so sub-expressions they share are evaluated only once,
+        and intermediate results are dropped as soon as no formula needs them.
+        With n_processes > 1, independent formulas are evaluated by a pool of processes instead,
+        which share variables as read-only memory-mapped arrays (see jaqs.data.batch.BatchEvaluator).
+        
+        Parameters
+        ----------
+        formulas : dict or list of tuple
+            {field_name: formula} or [(field_name, formula)]. A formula may use fields added by formulas before it.
+        is_quarterly : bool
+            Whether df is quarterly data (like quarterly financial statement) or daily data.
+        formula_func_name_style : {'upper', 'lower'}, optional
+        data_api : RemoteDataService, optional
+        within_index : bool
+            When do cross-section operatioins, whether just do within index components.
+        start_date : int, optional
+        chunk_size : int, optional
+            See add_formula. The lookback is the largest one of all formulas.
+        profiler : ExprProfiler, optional
+            Not used by a pool of processes.
+        n_processes : int, optional
+            Number of worker processes. Default 1, evaluate in this process.
+        n_threads : int, optional
+            Number of threads evaluating independent sub-expressions at the same time in this process,
+            see add_formula. Not used by a pool of processes.
+        
+        """
+        if data_api is not None:
+            self.data_api = data_api
+        formulas = list(formulas.items()) if isinstance(formulas, dict) else list(formulas)
+        
+        if isinstance(self._panel_d, ShardedPanel) and not is_quarterly:
+            # each formula is split into stages and evaluated shard by shard
+            for field_name, formula in formulas:
+                self.add_formula(field_name, formula, is_quarterly, formula_func_name_style=formula_func_name_style,
+                                 within_index=within_index, profiler=profiler)
+            return
+        
+        parser = Parser()
+        parser.set_capital(formula_func_name_style)
+        graph = ExprGraph(parser)
+        roots = dict()
+        for field_name, formula in formulas:
+            if field_name in self.fields or field_name in graph.names:
+                print("Add formula failed: name [{:s}] exist. Try another name.".format(field_name))
+                return
+            roots[field_name] = graph.add(field_name, parser.parse(formula))
+        
+        var_list = graph.variables()
+        if not self.fields:
+            self.fields.extend(var_list)
+            self.prepare_data()
+        else:
+            for var in var_list:
+                if var not in self.fields:
+                    print("Variable [{:s}] is not recognized (it may be wrong)," \
+                          "try to fetch from the server...".format(var))
+                    success = self.add_field(var)
+                    if not success:
+                        return
+        
+        if is_quarterly:
+            start_date, chunk_size = 0, None
+        
+        # cached results of formulas which are not used by other formulas of the batch
+        cache_keys = dict()
+        dic_cached = dict()
+        if self.expr_cache is not None and not is_quarterly:
+            # results of other formulas are inlined in graph, so keys only depend on fields
+            used = set()
+            for _, formula in formulas:
+                used.update(parser.parse(formula).variables())
+            for field_name, _ in formulas:
+                cache_keys[field_name] = self._formula_cache_key(graph, roots[field_name],
+                                                                 graph.variables([field_name]),
+                                                                 within_index=within_index, start_date=start_date)
+                df_cached = None if field_name in used else self._get_cached_formula(cache_keys[field_name])
+                if df_cached is not None:
+                    dic_cached[field_name] = df_cached
+        formulas_eval = [(field_name, formula) for field_name, formula in formulas if field_name not in dic_cached]
+        if dic_cached and formulas_eval:
+            graph = ExprGraph(parser)
+            for field_name, formula in formulas_eval:
+                graph.add(field_name, parser.parse(formula))
+            var_list = graph.variables()
+        
+        if not formulas_eval:
+            dic_eval = dict()
+        elif n_processes > 1:
+            if profiler is not None:
+                print("Profiler is not used when formulas are evaluated by a pool of processes.")
+            values, kwargs = self._formula_inputs(graph, var_list, within_index=within_index,
+                                                  start_date=start_date, chunk_size=chunk_size)
+            evaluator = BatchEvaluator(n_processes=n_processes, formula_func_name_style=formula_func_name_style)
+            dic_eval = evaluator.evaluate(formulas_eval, values, **kwargs)
+        else:
+            dic_eval = self._evaluate_formula(graph, var_list, within_index=within_index,
+                                              start_date=start_date, chunk_size=chunk_size, profiler=profiler,
+                                              n_threads=n_threads)
+        
+        dic_daily = OrderedDict()
+        df_ann = self._get_ann_df() if is_quarterly else None
+        for field_name, formula in formulas:
+            if field_name in dic_cached:
+                dic_daily[field_name] = dic_cached[field_name]
+                continue
+            df_eval = dic_eval.pop(field_name)
+            if is_quarterly:
+                self.append_df(df_eval, field_name, is_quarterly=True)
+                df_eval = align(df_eval, df_ann, self.dates)
+            dic_daily[field_name] = self._reindex_daily_result(df_eval)
+            self._put_cached_formula(cache_keys.get(field_name, None), dic_daily[field_name])
+        self._append_dfs(dic_daily, is_quarterly=False)
+        
+        for field_name, formula in formulas:
+            self.custom_formulas.append({'field_name': field_name, 'formula': formula, 'is_quarterly': is_quarterly,
+                                         'formula_func_name_style': formula_func_name_style,
+                                         'within_index': within_index})
+    
+    def set_expr_cache(self, path, max_size_mb=None):
+        """
+        Store results of daily formulas on local disk, so that add_formula and add_formulas
+        do not evaluate a formula again when neither it nor its inputs have changed, even in another process.
+        Results are keyed by the canonical formula (function names are case insensitive), content hashes of
+        the fields it uses (see get_field_hash), dates and symbols, start_date and index_member if within_index.
+        Results of quarterly formulas and of 'sharded' storage are not cached.
+        
+        Parameters
+        ----------
+        path : str or None
+            Folder of cache files. None to disable cache.
+        max_size_mb : float, optional
+            Least recently used results will be removed when total size exceeds this. Default no limit.
+
+        """
+        if not path:
+            self.expr_cache = None
+            return
+        max_size = None if max_size_mb is None else int(max_size_mb * 1024 * 1024)
+        self.expr_cache = ExprCache(path, max_size=max_size)
+
+    def _formula_cache_key(self, graph, node_id, var_list, within_index=True, start_date=0):
+        """
+        Key of the daily result of a formula in expr_cache.
+        
+        Parameters
+        ----------
+        graph : ExprGraph
+        node_id : int
+            Root node of the formula in graph.
+        var_list : list of str
+            Variables of the formula.
+        within_index : bool
+        start_date : int
+
+        Returns
+        -------
+        str
+
+        """
+        use_quarterly = any([self._is_quarter_field(var) for var in var_list])
+        inputs = {var: self.get_field_hash(var, is_quarterly=self._is_quarter_field(var)) for var in var_list}
+        index = {'data_d': hash_index(self._saved_panel(False))}
+        if use_quarterly:
+            # start_date is ignored, and quarterly values are expanded by announcement dates
+            start_date = 0
+            index['data_q'] = hash_index(self._saved_panel(True))
+            inputs[self.ANN_DATE_FIELD_NAME] = self.get_field_hash(self.ANN_DATE_FIELD_NAME, is_quarterly=True)
+        if not start_date or start_date <= self.extended_start_date_d:
+            start_date = 0
+        index_member = None
+        if within_index and 'index_member' in self.fields:
+            index_member = self.get_field_hash('index_member')
+        return self.expr_cache.make_key('formula', formula=graph.to_string(node_id, lower_functions=True),
+                                        inputs=inputs, index=index, index_member=index_member,
+                                        extended_start_date=self.extended_start_date_d, start_date=start_date)
+
+    def _get_cached_formula(self, key):
+        """Daily result of a formula in expr_cache, or None."""
+        if key is None:
+            return None
+        arr = self.expr_cache.get(key)
+        dates = self.dates
+        dates = dates[dates >= self.extended_start_date_d]
+        if arr is None or arr.shape != (len(dates), len(self.symbol)):
+            return None
+        # copy, so that data does not depend on the file, which may be evicted
+        return pd.DataFrame(np.array(arr), index=dates, columns=self.symbol)
+
+    def _put_cached_formula(self, key, df_eval):
+        if key is None or not isinstance(df_eval, pd.DataFrame) or not ExprCache.can_store(df_eval.values):
+            return
+        if not df_eval.columns.equals(pd.Index(self.symbol)):
+            return
+        self.expr_cache.put(key, df_eval.values)
+
+    def _reindex_daily_result(self, df_eval):
+        """Reindex daily result of _evaluate_formula, which may start later, to dates since extended start date."""
+        if not isinstance(df_eval, (pd.DataFrame, pd.Series)):
+            return df_eval
+        dates = self.dates
+        return df_eval.reindex(index=dates[dates >= self.extended_start_date_d])
+
+    def streaming_formula(self, formula, formula_func_name_style='camel', within_index=True):
+        """
+        Create a StreamingExpression of formula, warmed up with daily data of existing fields,
+        so that a live trading strategy can evaluate the formula on each new date without recomputing history.
+        Quarterly fields are used as expanded to trade dates.
+
+        Parameters
+        ----------
+        formula : str
+        formula_func_name_style : {'upper', 'lower'}, optional
+        within_index : bool
+            When do cross-section operatioins, whether just do within index components.
+
+        Returns
+        -------
+        StreamingExpression
+            Its last_date is the last date of this DataView.
+
+        """
+        expr = StreamingExpression(formula, self.symbol, formula_func_name_style=formula_func_name_style)
+        for var in expr.variables:
+            if var not in self.fields:
+                raise KeyError("Variable [{:s}] is not a field of this DataView.".format(var))
+
+        # only the last rows needed are read
+        start_date = self.extended_start_date_d
+        if expr.lookback is not None:
+            dates = self.dates
+            start_date = max(start_date, dates[max(len(dates) - expr.lookback - 1, 0)])
+        values = {var: self.get_ts(var, start_date=start_date, end_date=self.end_date) for var in expr.variables}
+        index_member = None
+        if within_index and 'index_member' in self.fields:
+            index_member = self.get_ts('index_member', start_date=start_date, end_date=self.end_date)
+        expr.warm_up(values, index_member=index_member)
+        return expr
+
+    def _evaluate_formula(self, parser, var_list, within_index=True, start_date=0, chunk_size=None,
+                          profiler=None, n_threads=1):
+        """
+        Evaluate the formula parsed by parser, using data of existing fields.
+        See _formula_inputs for parameters.
+        
+        Parameters
+        ----------
+        parser : Parser or ExprGraph
+            Parser which has parsed the formula, or graph of several formulas.
+        var_list : list of str
+        within_index : bool
+        start_date : int, optional
+        chunk_size : int, optional
+        profiler : ExprProfiler, optional
+        n_threads : int, optional
+
+        Returns
+        -------
+        df_eval : pd.DataFrame or OrderedDict
+            {field_name: pd.DataFrame} if parser is an ExprGraph.
+
+        """
+        var_df_dic, kwargs = self._formula_inputs(parser, var_list, within_index=within_index,
+                                                  start_date=start_date, chunk_size=chunk_size)
+        return parser.evaluate(var_df_dic, profiler=profiler, n_threads=n_threads, **kwargs)
+
+    def _formula_inputs(self, parser, var_list, within_index=True, start_date=0, chunk_size=None):
+        """
+        Read data of variables of a formula from existing fields.
+        
+        Parameters
+        ----------
+        parser : Parser or ExprGraph
+            Parser which has parsed the formula, or graph of several formulas.
+        var_list : list of str
+            Variables of the formula.
+        within_index : bool
+            When do cross-section operatioins, whether just do within index components.
+        start_date : int, optional
+            Only evaluate daily results since start_date. Daily data is read since lookback rows before it
+            (see Parser.lookback). Default self.extended_start_date_d.
+            Ignored if quarterly fields are used, since they are not indexed by trade dates.
+        chunk_size : int, optional
+            Evaluate chunk_size dates at a time, see Parser.evaluate. Ignored if quarterly fields are used.
+
+        Returns
+        -------
+        var_df_dic : dict
+            {variable: pd.DataFrame}
+        kwargs : dict
+            Other keyword arguments of Parser.evaluate: ann_dts, trade_dts, index_member, start_date and chunk_size.
+
+        """
+        eval_start_date = None
+        use_quarterly = any([self._is_quarter_field(var) for var in var_list])
+        if start_date and start_date > self.extended_start_date_d and not use_quarterly:
+            eval_start_date = start_date
+            lookback = parser.lookback()
+            if lookback is None:
+                start_date = self.extended_start_date_d
+            else:
+                dates = self.dates
+                start_date = max(dates[max(np.searchsorted(dates, start_date) - lookback, 0)],
+                                 self.extended_start_date_d)
+        else:
+            start_date = self.extended_start_date_d
+        if use_quarterly:
+            chunk_size = None
+        
+        var_df_dic = dict()
         for var in var_list:
             if self._is_quarter_field(var):
                 df_var = self.get_ts_quarter(var, start_date=self.extended_start_date_q)
+            elif (var in self.group_fields and isinstance(self._panel_d, DensePanel)
+                  and self._panel_d.is_categorical(var)):
+                # codes group the same way as labels, but are much faster to compare
+                df_var = self._panel_d.get_codes(var, start_date=start_date, end_date=self.end_date)
             else:
                 # must use extended date. Default is start_date
-                df_var = self.get_ts(var, start_date=self.extended_start_date_d, end_date=self.end_date)
+                df_var = self.get_ts(var, start_date=start_date, end_date=self.end_date)
             
             var_df_dic[var] = df_var
         
         # TODO: send ann_date into expr.evaluate. We assume that ann_date of all fields of a symbol is the same
         df_ann = self._get_ann_df()
-        if within_index:
-            df_index_member = self.get_ts('index_member', start_date=self.extended_start_date_d, end_date=self.end_date)
-            df_eval = parser.evaluate(var_df_dic, ann_dts=df_ann, trade_dts=self.dates, index_member=df_index_member)
+        trade_dts = self.dates
+        trade_dts = trade_dts[trade_dts >= start_date]
+        if within_index and 'index_member' in self.fields:
+            df_index_member = self.get_ts('index_member', start_date=start_date, end_date=self.end_date)
         else:
-            df_eval = parser.evaluate(var_df_dic, ann_dts=df_ann, trade_dts=self.dates)
-        
-        self.append_df(df_eval, field_name, is_quarterly=is_quarterly)
+            df_index_member = None
+        kwargs = {'ann_dts': df_ann, 'trade_dts': trade_dts, 'index_member': df_index_member,
+                  'start_date': eval_start_date, 'chunk_size': chunk_size}
+        return var_df_dic, kwargs
+
+    def _evaluate_formula_sharded(self, parser, field_name, within_index=True, profiler=None):
+        """
+        Evaluate the formula parsed by parser on ShardedPanel, and write the result to field field_name.
+        The formula is split into stages (see Parser.split_stages): stages of time series functions are evaluated
+        shard by shard, stages of cross section functions are evaluated block by block of dates,
+        whose results are transposed into shards. Intermediate results are stored in temporary fields.
+        Quarterly fields are used as expanded to trade dates.
         
-        if is_quarterly:
-            df_ann = self._get_ann_df()
-            df_expanded = align(df_eval, df_ann, self.dates)
-            self.append_df(df_expanded, field_name, is_quarterly=False)
-            
+        Parameters
+        ----------
+        parser : Parser
+            Parser which has parsed the formula.
+        field_name : str
+        within_index : bool
+            When do cross-section operatioins, whether just do within index components.
+        profiler : ExprProfiler, optional
+            Records each stage evaluated on each shard or block of dates.
+
+        """
+        panel = self._panel_d
+        dates = panel.dates
+        row_start = np.searchsorted(dates, self.extended_start_date_d)
+        use_index = within_index and 'index_member' in self.fields
+        
+        def evaluate(expr, symbols, start_date, end_date):
+            var_df_dic = {var: panel.get_ts(var, symbol=symbols, start_date=start_date, end_date=end_date)
+                          for var in expr.variables()}
+            index_member = None
+            if use_index:
+                index_member = panel.get_ts('index_member', symbol=symbols, start_date=start_date, end_date=end_date)
+            return parser.evaluate(var_df_dic, index_member=index_member, tokens=expr.tokens, profiler=profiler)
+        
+        def iter_blocks(expr):
+            n_rows = self._budget_count(len(panel.symbols) * (len(expr.variables()) + 2) * 8)
+            for start in range(row_start, len(dates), n_rows):
+                sl = slice(start, min(start + n_rows, len(dates)))
+                df = evaluate(expr, None, dates[sl][0], dates[sl][-1])
+                yield sl, df.reindex(index=dates[sl], columns=panel.symbols).values
+        
+        stages = parser.split_stages(prefix='_{}_stage'.format(field_name))
+        try:
+            for name, expr, by_symbol, by_date in stages:
+                name = field_name if name is None else name
+                if by_symbol:
+                    for i, shard in enumerate(panel.shards):
+                        df = evaluate(expr, list(shard.symbols), dates[row_start], dates[-1])
+                        arr = np.full((len(dates), len(shard.symbols)), np.nan)
+                        arr[row_start:] = df.reindex(index=dates[row_start:], columns=shard.symbols).values
+                        panel.set_shard_field(i, name, arr)
+                elif by_date:
+                    panel.write_rows(name, iter_blocks(expr))
+                else:
+                    # registered functions may need all data
+                    panel.set_field(name, evaluate(expr, None, dates[row_start], dates[-1]))
+        finally:
+            for name, _, _, _ in stages[:-1]:
+                if name in panel.all_fields:
+                    panel.remove_field(name)
+            panel.release()
+        self._clear_snapshot_cache()
+        self._mark_changed(False, field_name)
+    
+
     def append_df(self, df, field_name, is_quarterly=False):
         """
         Append DataFrame to existing multi-index DataFrame and add corresponding field name.
@@ -1087,10 +2179,82 @@ class DataView(object):
         else:
             raise ValueError("Data to be appended must be pandas format. But we have {}".format(type(df)))
     
+        self._set_field_data(df, field_name, is_quarterly)
+        self._add_field(field_name, is_quarterly)
+
+    def _append_dfs(self, dic, is_quarterly=False):
+        """
+        Append several DataFrames and add corresponding field names, see append_df.
+        With frame storage, data is merged once instead of once for each field.
+        
+        Parameters
+        ----------
+        dic : OrderedDict
+            {field_name: pd.DataFrame}
+        is_quarterly : bool
+
+        """
+        panel = self._panel_q if is_quarterly else self._panel_d
+        the_data = None if panel is not None else (self.data_q if is_quarterly else self.data_d)
+        if the_data is None or len(dic) < 2:
+            for field_name, df in dic.items():
+                self.append_df(df, field_name, is_quarterly=is_quarterly)
+            return
+        
+        exist_fields = the_data.columns.get_level_values(1)
+        dropped = [field_name for field_name in dic if field_name in exist_fields]
+        if dropped:
+            the_data = the_data.drop(dropped, axis=1, level=1)
+        exist_symbols = the_data.columns.levels[0]
+        df_list = []
+        for field_name, df in dic.items():
+            if isinstance(df, pd.Series):
+                df = pd.DataFrame(df)
+            elif not isinstance(df, pd.DataFrame):
+                raise ValueError("Data to be appended must be pandas format. But we have {}".format(type(df)))
+            df = df.reindex(columns=exist_symbols)
+            df.columns = pd.MultiIndex.from_product([exist_symbols, [field_name]])
+            df_list.append(df)
+        
+        merge = the_data.join(pd.concat(df_list, axis=1), how='left')
+        merge.sort_index(axis=1, level=['symbol', 'field'], inplace=True)
+        self._set_frame_keep_hashes(merge, is_quarterly)
+        for field_name in dic:
+            self._mark_changed(is_quarterly, field_name)
+            self._add_field(field_name, is_quarterly)
+
+    def _set_field_data(self, df, field_name, is_quarterly=False):
+        """
+        Add or overwrite data of a field, without registering the field name.
+        
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Index is date, column is symbol.
+        field_name : str
+        is_quarterly : bool
+
+        """
+        panel = self._panel_q if is_quarterly else self._panel_d
+        if panel is not None:
+            if not is_quarterly and self.dtype_policy == 'compact' and isinstance(panel, DensePanel):
+                panel.set_field(field_name, df, dtype=self._compact_dtype(field_name))
+            elif not is_quarterly and self.dtype_policy == 'compact' and isinstance(panel, FieldPanel):
+                # the same as frame storage: only float fields are converted
+                panel.set_field(field_name, df,
+                                dtype=np.float32 if self._compact_dtype(field_name) is None else None)
+            else:
+                panel.set_field(field_name, df)
+            self._clear_cached_frame(is_quarterly)
+            self._mark_changed(is_quarterly, field_name)
+            return
+        
         if is_quarterly:
             the_data = self.data_q
         else:
             the_data = self.data_d
+        if field_name in the_data.columns.get_level_values(1):
+            the_data = the_data.drop(field_name, axis=1, level=1)
     
         exist_symbols = the_data.columns.levels[0]
         if len(df.columns) < len(exist_symbols):
@@ -1103,12 +2267,93 @@ class DataView(object):
         merge = the_data.join(df, how='left')  # left: keep index of existing data unchanged
         merge.sort_index(axis=1, level=['symbol', 'field'], inplace=True)
     
+        self._set_frame_keep_hashes(merge, is_quarterly)
+        self._mark_changed(is_quarterly, field_name)
+
+    def _set_frame_keep_hashes(self, df, is_quarterly):
+        """Set data_d or data_q to df where only some fields are changed, hashes of other fields are kept."""
+        key = 'data_q' if is_quarterly else 'data_d'
+        hashes = self._field_hashes[key]
         if is_quarterly:
-            self.data_q = merge
+            self.data_q = df
         else:
-            self.data_d = merge
-        self._add_field(field_name, is_quarterly)
+            self.data_d = df
+        self._field_hashes[key] = hashes
+
+    def _mark_changed(self, is_quarterly, field_name=None):
+        """Forget hash of a changed field, or hashes of all fields if field_name is None."""
+        key = 'data_q' if is_quarterly else 'data_d'
+        if field_name is None:
+            self._field_hashes[key] = dict()
+        else:
+            self._field_hashes[key].pop(field_name, None)
+
+    def _saved_panel(self, is_quarterly):
+        """Panel of daily or quarterly data whose field arrays are what is saved in 'npy' format, or None."""
+        if is_quarterly:
+            if self._panel_q is not None:
+                return self._panel_q
+            return None if self._data_q is None else FieldPanel.from_frame(self._data_q, lazy=True)
+        if self._panel_d is None and self._data_d is None:
+            return None
+        return self._get_snapshot_panel()
+
+    def _update_hashes(self, is_quarterly):
+        """
+        Hash fields which have been changed since they were hashed.
+        
+        Returns
+        -------
+        dict
+            {field: hash} of all fields.
 
+        """
+        key = 'data_q' if is_quarterly else 'data_d'
+        panel = self._saved_panel(is_quarterly)
+        if panel is None:
+            self._field_hashes[key] = dict()
+            return dict()
+        hashes = self._field_hashes[key]
+        fields = list(panel.all_fields)
+        for field, arr in panel.field_arrays([field for field in fields if field not in hashes]):
+            hashes[field] = hash_array(arr)
+        self._field_hashes[key] = {field: hashes[field] for field in fields}
+        return dict(self._field_hashes[key])
+
+    def get_field_hash(self, field_name, is_quarterly=False):
+        """
+        Content hash of a field. Hashes are cached and only re-computed after the field is changed,
+        so consumers can compare it with the hash they used last time to skip work on unchanged inputs.
+        Only changes made through DataView (append_df, add_formula, remove_field, extend, ...) are tracked,
+        not those made to data_d or data_q in place.
+        
+        Parameters
+        ----------
+        field_name : str
+        is_quarterly : bool
+        
+        Returns
+        -------
+        str
+
+        """
+        hashes = self._update_hashes(is_quarterly)
+        if field_name not in hashes:
+            raise KeyError("Field [{:s}] does not exist.".format(field_name))
+        return hashes[field_name]
+
+    def _clear_cached_frame(self, is_quarterly):
+        """Drop the DataFrame built from panel, it will be rebuilt on next access."""
+        if is_quarterly:
+            self._data_q = None
+        else:
+            self._data_d = None
+            self._clear_snapshot_cache()
+
+    def _clear_snapshot_cache(self):
+        self._snapshot_panel = None
+        self._snapshot_cache = OrderedDict()
+    
     def remove_field(self, field_names):
         """
         Query and append new field to DataView.
@@ -1146,12 +2391,23 @@ class DataView(object):
                 return
         
             # remove field data
-            self.data_d = self.data_d.drop(field_name, axis=1, level=1)
+            if self._panel_d is not None:
+                self._panel_d.remove_field(field_name)
+                self._clear_cached_frame(is_quarterly=False)
+            else:
+                self._set_frame_keep_hashes(self.data_d.drop(field_name, axis=1, level=1), is_quarterly=False)
+            self._mark_changed(False, field_name)
             if is_quarterly:
-                self.data_q = self.data_q.drop(field_name, axis=1, level=1)
+                if self._panel_q is not None:
+                    self._panel_q.remove_field(field_name)
+                    self._clear_cached_frame(is_quarterly=True)
+                else:
+                    self._set_frame_keep_hashes(self.data_q.drop(field_name, axis=1, level=1), is_quarterly=True)
+                self._mark_changed(True, field_name)
         
             # remove fields name from list
             self.fields.remove(field_name)
+            self.custom_formulas = [dic for dic in self.custom_formulas if dic['field_name'] != field_name]
             if is_quarterly:
                 self.custom_quarterly_fields.remove(field_name)
             else:
@@ -1197,6 +2453,11 @@ class DataView(object):
         if not end_date:
             end_date = self.end_date
     
+        if self._panel_d is not None:
+            symbol = None if isinstance(symbol, slice) else symbol
+            fields = None if isinstance(fields, slice) else fields
+            return self._panel_d.get(symbol=symbol, start_date=start_date, end_date=end_date, fields=fields)
+        
         res = self.data_d.loc[pd.IndexSlice[start_date: end_date], pd.IndexSlice[symbol, fields]]
     
         return res
@@ -1220,6 +2481,12 @@ class DataView(object):
             symbol as index, field as columns
 
         """
+        if self._panel_d is not None:
+            sep = ','
+            return self._panel_d.get_snapshot(snapshot_date,
+                                              symbol=symbol.split(sep) if symbol else None,
+                                              fields=fields.split(sep) if fields else None)
+        
         res = self.get(symbol=symbol, start_date=snapshot_date, end_date=snapshot_date, fields=fields)
         if res is None:
             print("No data. for date={}, fields={}, symbol={}".format(snapshot_date, fields, symbol))
@@ -1230,6 +2497,53 @@ class DataView(object):
     
         return res
     
+    def _get_snapshot_panel(self):
+        if self._panel_d is not None:
+            return self._panel_d
+        if self.data_d is None:
+            raise ValueError("Please prepare data first.")
+        if self._snapshot_panel is None or self._snapshot_panel.df is not self.data_d:
+            # only position maps are built, values are read from data_d
+            self._snapshot_panel = FramePanel(self.data_d)
+        return self._snapshot_panel
+
+    def get_snapshot_arrays(self, snapshot_date, symbol="", fields=""):
+        """
+        Get snapshot of given fields and symbol at snapshot_date as plain arrays.
+        This is a fast version of get_snapshot for daily loops: dates, symbols and fields are located
+        by pre-built position maps and no DataFrame is built.
+        Recent results are cached (see snapshot_cache_size), so arrays are shared, do not modify them.
+        Cached results are dropped when data is changed through DataView, not when data_d is modified in place.
+        
+        Parameters
+        ----------
+        snapshot_date : int
+            Date of snapshot.
+        symbol : str, optional
+            Separated by ',' default "" (all securities).
+        fields : str, optional
+            Separated by ',' default "" (all fields).
+
+        Returns
+        -------
+        res : OrderedDict
+            {'symbol': np.ndarray, field: np.ndarray}, symbols are sorted.
+
+        """
+        key = (snapshot_date, symbol, fields)
+        res = self._snapshot_cache.pop(key, None)
+        if res is None:
+            sep = ','
+            res = self._get_snapshot_panel().get_snapshot_arrays(snapshot_date,
+                                                                 symbol=symbol.split(sep) if symbol else None,
+                                                                 fields=fields.split(sep) if fields else None)
+        if self.snapshot_cache_size > 0:
+            # most recently used at the end
+            self._snapshot_cache[key] = res
+            while len(self._snapshot_cache) > self.snapshot_cache_size:
+                self._snapshot_cache.popitem(last=False)
+        return res
+    
     def _get_ann_df(self):
         """
         Query announcement date of financial statements of all securities.
@@ -1241,6 +2555,8 @@ class DataView(object):
             If no quarterly data available, return None.
         
         """
+        if self._data_q is None and self._panel_q is not None:
+            return self._panel_q.get_ts(self.ANN_DATE_FIELD_NAME)
         if self.data_q is None:
             return None
         df_ann = self.data_q.loc[:, pd.IndexSlice[:, self.ANN_DATE_FIELD_NAME]]
@@ -1261,6 +2577,9 @@ class DataView(object):
         if not end_date:
             end_date = self.end_date
     
+        if self._data_q is None and self._panel_q is not None:
+            return self._panel_q.get_ts(field, symbol=symbol)
+        
         df_ref_quarterly = self.data_q.loc[:, pd.IndexSlice[symbol, field]]
         df_ref_quarterly.columns = df_ref_quarterly.columns.droplevel(level='field')
     
@@ -1287,6 +2606,11 @@ class DataView(object):
             Index is int date, column is symbol.
 
         """
+        if self._panel_d is not None:
+            return self._panel_d.get_ts(field, symbol=symbol.split(',') if symbol else None,
+                                        start_date=start_date if start_date else self.start_date,
+                                        end_date=end_date if end_date else self.end_date)
+        
         res = self.get(symbol, start_date=start_date, end_date=end_date, fields=field)
         if res is None:
             print("No data. for start_date={}, end_date={}, field={}, symbol={}".format(start_date,
@@ -1320,54 +2644,217 @@ class DataView(object):
         
         return res
         
-    def load_dataview(self, folder_path='.'):
+    def load_dataview(self, folder_path='.', storage=None, verify=False):
         """
         Load data from local file.
+        Fields saved in 'npy' format are checked against manifest written by save_dataview: fields missing
+        from manifest, or saved with different dates or symbols, are reported as stale.
         
         Parameters
         ----------
         folder_path : str, optional
             Folder path to store hd5 file and meta data.
+        storage : {'frame', 'dense', 'field', 'sharded'}, optional
+            Override the storage engine recorded in meta data.
+        verify : bool, optional
+            Also hash content of all fields and compare with manifest. Raise ValueError if any field is stale.
+            Only for 'npy' format.
             
         """
         meta_data = jutil.read_json(os.path.join(folder_path, 'meta_data.json'))
-        dic = self._load_h5(os.path.join(folder_path, 'data.hd5'))
-        self.data_d = dic.get('/data_d', None)
-        self.data_q = dic.get('/data_q', None)
-        self._data_benchmark = dic.get('/data_benchmark', None)
-        self._data_inst = dic.get('/data_inst', None)
         self.__dict__.update(meta_data)
+        if storage is not None:
+            self.storage = storage
+        
+        if os.path.exists(os.path.join(folder_path, 'data.hd5')):
+            dic = self._load_h5(os.path.join(folder_path, 'data.hd5'))
+            self.data_d = dic.get('/data_d', None)
+            self.data_q = dic.get('/data_q', None)
+            self._data_benchmark = dic.get('/data_benchmark', None)
+            self._data_inst = dic.get('/data_inst', None)
+        else:
+            self._load_npy(folder_path, verify)
         
         print("Dataview loaded successfully.")
 
-    def save_dataview(self, folder_path):
+    def _read_manifest(self, folder_path, file_format):
+        """Manifest saved in folder_path, empty if there is none or it is for another file_format."""
+        manifest = jutil.read_json(os.path.join(folder_path, self.MANIFEST_FILE_NAME))
+        if not manifest or manifest.get('file_format') != file_format:
+            return dict()
+        return manifest
+
+    @staticmethod
+    def _check_manifest(manifest, panels, verify):
+        """
+        Compare saved panels with manifest.
+        
+        Parameters
+        ----------
+        manifest : dict
+            Nothing is checked if empty, e.g. data saved by an older version.
+        panels : dict
+            {'data_d' or 'data_q': FieldPanel or None} of saved data.
+        verify : bool
+            Whether to compare hashes of content. Raise ValueError if any field is stale.
+        
+        Returns
+        -------
+        dict
+            {'data_d' or 'data_q': {field: hash}} of fields which are not found stale.
+
+        """
+        res = dict()
+        if not manifest:
+            return res
+        
+        stale = []
+        for key, panel in panels.items():
+            if panel is None:
+                continue
+            hashes = manifest.get(key, dict())
+            if manifest.get(key + '_index') != hash_index(panel):
+                hashes = dict()
+            fields = [field for field in panel.all_fields if field in hashes]
+            stale.extend(['{}/{}'.format(key, field) for field in panel.all_fields if field not in hashes])
+            if verify:
+                for field, arr in panel.field_arrays(fields):
+                    if hash_array(arr) != hashes[field]:
+                        stale.append('{}/{}'.format(key, field))
+            res[key] = {field: hashes[field] for field in fields if '{}/{}'.format(key, field) not in stale}
+        
+        if stale:
+            msg = "Saved data does not match manifest, stale fields: {}".format(', '.join(stale))
+            if verify:
+                raise ValueError(msg)
+            print("Warning: " + msg)
+        return res
+
+    def _load_npy(self, folder_path, verify=False):
+        """
+        Load DataView saved in 'npy' format. Only index files are read here,
+        each field will be memory-mapped when it is first accessed.
+        
+        """
+        panel_d = FieldPanel.load(os.path.join(folder_path, 'data_d'))
+        panel_q = FieldPanel.load(os.path.join(folder_path, 'data_q'))
+        hashes = self._check_manifest(self._read_manifest(folder_path, 'npy'),
+                                      {'data_d': panel_d, 'data_q': panel_q}, verify)
+        if self.storage == 'dense' and panel_d is not None:
+            self.data_d = panel_d.to_frame()
+        elif self.storage == 'sharded' and panel_d is not None:
+            shard_size = self._get_shard_size(len(panel_d.dates), len(panel_d.fields))
+            self._data_d = None
+            self._panel_d = ShardedPanel.from_panel(self._new_shard_folder(), panel_d, shard_size)
+            self._clear_snapshot_cache()
+        else:
+            self._data_d = None
+            self._panel_d = panel_d
+            self._clear_snapshot_cache()
+        
+        self._data_q = None
+        self._panel_q = panel_q
+        
+        # fields are used as they are saved, so hashes in manifest can be reused
+        self._field_hashes['data_d'] = hashes.get('data_d', dict()) if self._panel_d is panel_d else dict()
+        self._field_hashes['data_q'] = hashes.get('data_q', dict())
+        
+        self._data_benchmark = jutil.load_pickle(os.path.join(folder_path, 'data_benchmark.pic'))
+        self._data_inst = jutil.load_pickle(os.path.join(folder_path, 'data_inst.pic'))
+    
+    def save_dataview(self, folder_path, file_format='hd5'):
         """
-        Save data and meta_data_to_store to a single hd5 file.
-        Store at output/sub_folder
+        Save data and meta_data_to_store to folder_path, in one hd5 file or in one .npy file per field.
         
         Parameters
         ----------
         folder_path : str
             Path to store your data.
+        file_format : {'hd5', 'npy'}, optional
+            'hd5': all data in one compressed hd5 file, which is rewritten as a whole on each save;
+            'npy': one uncompressed, memory-mappable .npy file per field, which can be loaded lazily.
+            Only fields changed since the last save are written, see manifest.json.
+            'npy' is recommended for dataviews saved again after changes.
 
         """
         abs_folder = os.path.abspath(folder_path)
         meta_path = os.path.join(folder_path, 'meta_data.json')
-        data_path = os.path.join(folder_path, 'data.hd5')
-        
-        data_to_store = {'data_d': self.data_d, 'data_q': self.data_q,
-                         'data_benchmark': self.data_benchmark, 'data_inst': self.data_inst}
-        data_to_store = {k: v for k, v in data_to_store.items() if v is not None}
         meta_data_to_store = {key: self.__dict__[key] for key in self.meta_data_list}
 
         print("\nStore data...")
         jutil.save_json(meta_data_to_store, meta_path)
-        self._save_h5(data_path, data_to_store)
+        if file_format == 'hd5':
+            self._save_hd5_file(folder_path)
+        elif file_format == 'npy':
+            self._save_npy(folder_path)
+        else:
+            raise NotImplementedError("file_format = {}".format(file_format))
         
         print ("Dataview has been successfully saved to:\n"
                + abs_folder + "\n\n"
                + "You can load it with load_dataview('{:s}')".format(abs_folder))
 
+    @staticmethod
+    def _hash_object(obj):
+        return hashlib.sha1(pickle.dumps(obj, protocol=2)).hexdigest()
+
+    def _write_manifest(self, folder_path, manifest):
+        jutil.save_json(manifest, os.path.join(folder_path, self.MANIFEST_FILE_NAME))
+
+    def _remove_manifest(self, folder_path):
+        """Remove manifest before data files are changed, so that an interrupted save is not trusted."""
+        fp = os.path.join(folder_path, self.MANIFEST_FILE_NAME)
+        if os.path.exists(fp):
+            os.remove(fp)
+
+    def _save_hd5_file(self, folder_path):
+        """
+        Save all data to one hd5 file. The compressed file can not be updated field by field,
+        so it is always written as a whole and fields are not hashed. Use 'npy' format for delta saves.
+        
+        """
+        data_path = os.path.join(folder_path, 'data.hd5')
+        data_to_store = {'data_d': self.data_d, 'data_q': self.data_q,
+                         'data_benchmark': self.data_benchmark, 'data_inst': self.data_inst}
+        data_to_store = {k: v for k, v in data_to_store.items() if v is not None}
+        if os.path.exists(data_path):
+            print("Warning: {} is rewritten as a whole. Save with file_format='npy' "
+                  "to write only changed fields.".format(data_path))
+        
+        # a manifest of an earlier 'npy' save in the same folder does not describe this file
+        self._remove_manifest(folder_path)
+        self._save_h5(data_path, data_to_store)
+
+    def _save_npy(self, folder_path):
+        """
+        Save data_d and data_q field by field, see panel.save_fields.
+        Fields whose hashes are the same as those in manifest of folder_path are not written again.
+        
+        """
+        old_manifest = self._read_manifest(folder_path, 'npy')
+        self._remove_manifest(folder_path)
+        manifest = {'file_format': 'npy'}
+        
+        for key, is_quarterly in [('data_d', False), ('data_q', True)]:
+            panel = self._saved_panel(is_quarterly)
+            if panel is None:
+                continue
+            hashes = self._update_hashes(is_quarterly)
+            index_hash = hash_index(panel)
+            old_hashes = old_manifest.get(key, dict()) if old_manifest.get(key + '_index') == index_hash else dict()
+            skip = {field for field, hash_ in hashes.items() if old_hashes.get(field) == hash_}
+            save_fields(os.path.join(folder_path, key), panel, skip=skip)
+            manifest[key] = hashes
+            manifest[key + '_index'] = index_hash
+        
+        for name, data in [('data_benchmark', self.data_benchmark), ('data_inst', self.data_inst)]:
+            if data is not None:
+                fp = os.path.join(folder_path, name + '.pic')
+                manifest[name] = self._hash_object(data)
+                if old_manifest.get(name) != manifest[name] or not os.path.exists(fp):
+                    jutil.save_pickle(data, fp)
+        self._write_manifest(folder_path, manifest)
+    
     @staticmethod
     def _save_h5(fp, dic):
         """
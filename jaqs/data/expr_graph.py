@@ -0,0 +1,622 @@
+# encoding: utf-8
+"""
+Compile parsed expressions into a DAG in which equal sub-expressions are one node.
+
+Parser.parse produces a list of tokens in reverse polish notation, where a sub-expression used twice,
+like Ts_Mean(close, 20) in 'close / Ts_Mean(close, 20) - Ts_Mean(close, 20)', is evaluated twice.
+ExprGraph gives each distinct (operator, arguments) signature one node, so it is evaluated once,
+also when it is shared by several expressions added to the same graph.
+Nodes which do not depend on each other, like both arguments of 'Corr(Rank(a), Rank(b))', can be
+evaluated by a pool of threads at the same time, since heavy numpy and pandas operations release the GIL.
+
+"""
+from __future__ import print_function
+import sys
+import time
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import pandas as pd
+import six
+from six.moves import queue
+
+from jaqs.data.py_expression_eval import Expression, TNUMBER, TOP1, TOP2, TVAR, TFUNCALL
+
+
+class ExprGraph(object):
+    """
+    Hash-consed DAG of expressions parsed by one Parser.
+
+    Nodes are stored in the order they are created, so arguments of a node always come before it.
+    Each node is a tuple (type, op, args): type is a token type, op is the number, variable name,
+    operator or function name, and args is a tuple of node ids.
+
+    Attributes
+    ----------
+    parser : Parser
+        Provides operators and functions, and receives ann_dts, trade_dts and index_member during evaluation.
+    names : list of str
+        Names of added expressions.
+
+    Examples
+    --------
+    parser = Parser()
+    graph = ExprGraph(parser)
+    graph.add('a', parser.parse('Rank(Ts_Mean(close, 20))'))
+    graph.add('b', parser.parse('close / Ts_Mean(close, 20)'))
+    dic = graph.evaluate({'close': df_close})  # Ts_Mean(close, 20) is evaluated once
+
+    """
+    # operators whose arguments can be swapped without changing the result
+    COMMUTATIVE_OPS = {'+', '*'}
+
+    def __init__(self, parser):
+        self.parser = parser
+        self._nodes = []
+        self._node_ids = dict()
+        self._outputs = OrderedDict()
+
+    def __len__(self):
+        return len(self._nodes)
+
+    @property
+    def names(self):
+        return list(self._outputs.keys())
+
+    def _node(self, type_, op, args=()):
+        if type_ == TOP2 and op in self.COMMUTATIVE_OPS:
+            args = tuple(sorted(args))
+        # distinguish 1 from 1.0, since they may lead to results of different type
+        key = (type_, type(op).__name__, op, tuple(args))
+        node_id = self._node_ids.get(key, None)
+        if node_id is None:
+            node_id = len(self._nodes)
+            self._nodes.append((type_, op, tuple(args)))
+            self._node_ids[key] = node_id
+        return node_id
+
+    def add(self, name, expr=None):
+        """
+        Compile an expression and add it to the graph as name.
+        A variable which is the name of an expression added before refers to the result of that expression.
+
+        Parameters
+        ----------
+        name : str
+        expr : Expression or list of Token, optional
+            Default the last expression parsed by parser.
+
+        Returns
+        -------
+        int
+            Id of the root node of the expression.
+
+        """
+        if name in self._outputs:
+            raise ValueError("Expression [{}] already exists.".format(name))
+        if expr is None:
+            tokens = self.parser.tokens
+        elif isinstance(expr, Expression):
+            tokens = expr.tokens
+        else:
+            tokens = expr
+
+        # stack items: node id, ('func', name) or ('list', node ids)
+        nstack = []
+        for item in tokens:
+            type_ = item.type_
+            if type_ == TNUMBER:
+                nstack.append(self._node(TNUMBER, item.number_))
+            elif type_ == TVAR:
+                if item.index_ in self._outputs:
+                    nstack.append(self._outputs[item.index_])
+                elif item.index_ in self.parser.functions:
+                    nstack.append(('func', item.index_))
+                else:
+                    nstack.append(self._node(TVAR, item.index_))
+            elif type_ == TOP1:
+                nstack.append(self._node(TOP1, item.index_, (nstack.pop(),)))
+            elif type_ == TOP2:
+                n2 = nstack.pop()
+                n1 = nstack.pop()
+                if item.index_ == ',':
+                    is_list = isinstance(n1, tuple) and n1[0] == 'list'
+                    nstack.append(('list', n1[1] + [n2]) if is_list else ('list', [n1, n2]))
+                else:
+                    nstack.append(self._node(TOP2, item.index_, (n1, n2)))
+            elif type_ == TFUNCALL:
+                args = nstack.pop()
+                func = nstack.pop()
+                if not (isinstance(func, tuple) and func[0] == 'func'):
+                    # the name called is not a function, e.g. a misspelled one, Parser.evaluate raises the same
+                    if not isinstance(func, tuple) and self._nodes[func][0] == TVAR:
+                        raise Exception('undefined variable: ' + self._nodes[func][1])
+                    raise Exception('invalid Expression')
+                func_name = func[1]
+                args = args[1] if isinstance(args, tuple) and args[0] == 'list' else [args]
+                nstack.append(self._node(TFUNCALL, func_name, args))
+            else:
+                raise Exception('invalid Expression')
+        if len(nstack) != 1 or isinstance(nstack[0], tuple):
+            raise Exception('invalid Expression (parity)')
+
+        self._outputs[name] = nstack[0]
+        return nstack[0]
+
+    def _needed_nodes(self, names):
+        """Ids of nodes which are needed to evaluate expressions of names, in the order of evaluation."""
+        needed = set()
+        stack = [self._outputs[name] for name in names]
+        while stack:
+            node_id = stack.pop()
+            if node_id not in needed:
+                needed.add(node_id)
+                stack.extend(self._nodes[node_id][2])
+        return sorted(needed)
+
+    def variables(self, names=None):
+        """Variables used by expressions of names (default all expressions)."""
+        names = self.names if names is None else names
+        return [self._nodes[i][1] for i in self._needed_nodes(names) if self._nodes[i][0] == TVAR]
+
+    def to_string(self, node_id, lower_functions=False):
+        """
+        Canonical formula of a node. Equal sub-expressions have the same string.
+        With lower_functions, function names are in lower case, so that the string does not depend on
+        formula_func_name_style (see Parser.set_capital).
+
+        """
+        type_, op, args = self._nodes[node_id]
+        if type_ == TNUMBER:
+            return repr(op)
+        elif type_ == TVAR:
+            return op
+        args = [self.to_string(i, lower_functions=lower_functions) for i in args]
+        if type_ == TOP1:
+            return '({}{})'.format(op, args[0]) if op == '-' else '{}({})'.format(op, args[0])
+        elif type_ == TOP2:
+            return '({}{}{})'.format(args[0], op, args[1])
+        return '{}({})'.format(op.lower() if lower_functions else op, ', '.join(args))
+
+    def lookback(self, names=None):
+        """
+        Number of previous rows needed to evaluate expressions of names (default all) exactly on later rows.
+        Windows of nested time series functions are added up, e.g. 'Delta(Ts_Mean(close, 5), 2)' needs 6 rows.
+        Windows are given by parser.function_lookback.
+
+        Returns
+        -------
+        int or None
+            None if a result depends on the whole history (e.g. Ewma, or functions with unknown window).
+
+        """
+        names = self.names if names is None else names
+        lookback_map = {k.lower(): v for k, v in self.parser.function_lookback.items()}
+
+        # {node id: (is_number, value)}. value is the number itself or the lookback of data
+        res = dict()
+        for node_id in self._needed_nodes(names):
+            type_, op, args = self._nodes[node_id]
+            if type_ == TNUMBER:
+                res[node_id] = (True, op)
+                continue
+            if type_ == TVAR:
+                res[node_id] = (False, 0)
+                continue
+            items = [res[arg] for arg in args]
+            if type_ in (TOP1, TOP2):
+                if all(is_num for is_num, _ in items):
+                    ops = self.parser.ops1 if type_ == TOP1 else self.parser.ops2
+                    res[node_id] = (True, ops[op](*[value for _, value in items]))
+                else:
+                    res[node_id] = (False, _max_lookback(items))
+                continue
+
+            rule = lookback_map.get(op.lower(), None)
+            base = _max_lookback(items)
+            if rule is None or base is None:
+                res[node_id] = (False, None)
+                continue
+            pos, offset, default = rule
+            if pos is None:
+                extra = 0
+            elif pos < len(items):
+                is_num, window = items[pos]
+                extra = int(window) + offset if is_num else None
+            else:
+                extra = default + offset
+            res[node_id] = (False, None if extra is None else base + max(extra, 0))
+
+        return _max_lookback([res[self._outputs[name]] for name in names])
+
+    def evaluate(self, values, names=None, ann_dts=None, trade_dts=None, index_member=None,
+                 start_date=None, chunk_size=None, profiler=None, n_threads=1):
+        """
+        Evaluate expressions. Each node is evaluated once, and its result is dropped as soon as
+        all nodes using it are evaluated, so only results still to be used are kept in memory.
+        With n_threads > 1, a node is evaluated by a pool of threads as soon as its arguments are ready.
+        Results are the same as those evaluated one by one, since each node gets the same arguments.
+
+        When start_date or chunk_size is given, variables indexed by trade dates are sliced to
+        the rows needed (see lookback), and evaluation walks dates in blocks of chunk_size rows,
+        each with lookback previous rows in front of it.
+        Expressions whose lookback is None are evaluated on all rows.
+
+        Parameters
+        ----------
+        values : dict
+            Key is variable name, value is pd.DataFrame (index is date, column is symbol)
+        names : list of str, optional
+            Names of expressions to evaluate. Default all expressions.
+        ann_dts, trade_dts, index_member
+            See Parser.evaluate.
+        start_date : int, optional
+            Only evaluate results since start_date. Earlier dates are not in results.
+        chunk_size : int, optional
+            Number of result rows evaluated at once. Default all rows.
+        profiler : ExprProfiler, optional
+            Records time, size and NaN ratio of the result of each node. Nodes are evaluated one by one.
+        n_threads : int, optional
+            Number of threads evaluating independent nodes at the same time. Default 1, one by one.
+
+        Returns
+        -------
+        OrderedDict
+            {name: result}
+
+        """
+        names = self.names if names is None else list(names)
+        if profiler is not None and n_threads > 1:
+            print("Nodes are evaluated one by one when profiled.")
+            n_threads = 1
+        if start_date is None and chunk_size is None:
+            return self._evaluate(values, names, ann_dts, trade_dts, index_member, profiler, n_threads)
+
+        dates = trade_dts
+        if dates is None:
+            dates = np.unique(np.concatenate([df.index.values for df in values.values()
+                                              if isinstance(df, (pd.DataFrame, pd.Series))]))
+        dates = np.asarray(dates)
+        lookback = self.lookback(names)
+        row_start = np.searchsorted(dates, start_date) if start_date else 0
+        if lookback is None:
+            if chunk_size:
+                print("Expressions depend on the whole history and are evaluated at once.")
+            dic = self._evaluate(values, names, ann_dts, trade_dts, index_member, profiler, n_threads)
+            return OrderedDict([(name, _slice_dates(res, dates[row_start], dates[-1]) if row_start else res)
+                                for name, res in dic.items()])
+
+        n_dates = len(dates)
+        chunk_size = chunk_size or max(n_dates - row_start, 1)
+        blocks = OrderedDict([(name, []) for name in names])
+        for row in range(row_start, n_dates, chunk_size):
+            begin, end = dates[max(row - lookback, 0)], dates[min(row + chunk_size, n_dates) - 1]
+            block_values = {k: _slice_dates(v, begin, end, dates) for k, v in values.items()}
+            block_trade_dts = None if trade_dts is None else dates[(dates >= begin) & (dates <= end)]
+            block_member = None if index_member is None else _slice_dates(index_member, begin, end, dates)
+            dic = self._evaluate(block_values, names, ann_dts, block_trade_dts, block_member, profiler, n_threads)
+            for name, res in dic.items():
+                blocks[name].append(_slice_dates(res, dates[row], end))
+
+        res = OrderedDict()
+        for name, block_list in blocks.items():
+            if not block_list:
+                res[name] = None
+            elif isinstance(block_list[0], (pd.DataFrame, pd.Series)):
+                res[name] = pd.concat(block_list, axis=0) if len(block_list) > 1 else block_list[0]
+            else:
+                res[name] = block_list[-1]
+        return res
+
+    def _evaluate(self, values, names, ann_dts, trade_dts, index_member, profiler=None, n_threads=1):
+        parser = self.parser
+        parser.ann_dts = ann_dts
+        parser.trade_dts = trade_dts
+        parser.index_member = index_member
+        values = values or {}
+
+        order = self._needed_nodes(names)
+        n_users = dict.fromkeys(order, 0)
+        for node_id in order:
+            for arg in self._nodes[node_id][2]:
+                n_users[arg] += 1
+
+        output_nodes = {self._outputs[name] for name in names}
+        results = dict()
+        outputs = dict()
+
+        def finish(node_id, res):
+            results[node_id] = res
+            if node_id in output_nodes:
+                outputs[node_id] = res
+            for arg in self._nodes[node_id][2]:
+                n_users[arg] -= 1
+                if n_users[arg] == 0:
+                    del results[arg]
+
+        if n_threads > 1:
+            self._evaluate_threaded(order, values, results, finish, n_threads)
+            return OrderedDict([(name, outputs[self._outputs[name]]) for name in names])
+
+        if profiler is not None:
+            profiler.begin_run(self, names, order)
+        for node_id in order:
+            type_, op, args = self._nodes[node_id]
+            if profiler is not None:
+                profiler.begin_node()
+            res = self._apply(node_id, values, [results[arg] for arg in args])
+            if profiler is not None:
+                profiler.end_node(node_id, res)
+            finish(node_id, res)
+        if profiler is not None:
+            profiler.end_run()
+
+        return OrderedDict([(name, outputs[self._outputs[name]]) for name in names])
+
+    def _apply(self, node_id, values, arg_values):
+        """Evaluate a node given results of its arguments."""
+        type_, op, _ = self._nodes[node_id]
+        if type_ == TNUMBER:
+            return op
+        elif type_ == TVAR:
+            if op not in values:
+                raise Exception('undefined variable: ' + op)
+            return values[op]
+        elif type_ == TOP1:
+            return self.parser.ops1[op](*arg_values)
+        elif type_ == TOP2:
+            return self.parser.ops2[op](*arg_values)
+        return self.parser.functions[op](*arg_values)
+
+    def _evaluate_threaded(self, order, values, results, finish, n_threads):
+        """
+        Evaluate nodes of order with a pool of threads. A node is submitted as soon as all its arguments
+        are evaluated, numbers and variables are evaluated in the calling thread.
+        finish(node_id, res) is always called in the calling thread, so results need no lock.
+        The exception of a failed node is raised after running nodes are finished.
+
+        """
+        n_waiting = dict()
+        users = {node_id: [] for node_id in order}
+        for node_id in order:
+            args = set(self._nodes[node_id][2])
+            n_waiting[node_id] = len(args)
+            for arg in args:
+                users[arg].append(node_id)
+
+        done = queue.Queue()
+
+        def run(node_id, arg_values):
+            try:
+                done.put((node_id, self._apply(node_id, values, arg_values), None))
+            except Exception:
+                done.put((node_id, None, sys.exc_info()))
+
+        pool = ThreadPool(n_threads)
+        try:
+            ready = [node_id for node_id in order if n_waiting[node_id] == 0]
+            n_running = 0
+            error = None
+            while ready or n_running:
+                for node_id in ready:
+                    type_, _, args = self._nodes[node_id]
+                    if type_ in (TNUMBER, TVAR):
+                        done.put((node_id, self._apply(node_id, values, []), None))
+                    else:
+                        pool.apply_async(run, (node_id, [results[arg] for arg in args]))
+                    n_running += 1
+                ready = []
+
+                node_id, res, exc_info = done.get()
+                n_running -= 1
+                if exc_info is not None:
+                    error = error or exc_info
+                if error is not None:
+                    # wait for running nodes, submit no more
+                    continue
+                finish(node_id, res)
+                for user in users[node_id]:
+                    n_waiting[user] -= 1
+                    if n_waiting[user] == 0:
+                        ready.append(user)
+            if error is not None:
+                six.reraise(*error)
+        finally:
+            pool.close()
+            pool.join()
+
+
+class ExprProfiler(object):
+    """
+    Record wall time, result shape, result bytes and NaN ratio of each node evaluated by ExprGraph.
+    One profiler can be passed to many evaluations (e.g. add_formula of a whole alpha library),
+    to find the operators which take most of the time.
+
+    Parameters
+    ----------
+    trace_memory : bool
+        Also record peak memory allocated while evaluating each node, using tracemalloc (Python 3 only).
+        This makes evaluation much slower.
+
+    Examples
+    --------
+    profiler = ExprProfiler()
+    dv.add_formula('alpha1', 'Rank(Ts_Rank(close, 20))', is_quarterly=False, profiler=profiler)
+    print(profiler.summary())
+    profiler.save_folded('alpha.folded')  # input of flamegraph.pl
+
+    """
+    COLUMNS = ['run', 'outputs', 'node', 'op', 'expr', 'time', 'shape', 'bytes', 'peak_bytes', 'nan_ratio']
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.records = []
+        self._runs = []
+        self._start = None
+        self._started_tracing = False
+        if trace_memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                raise NotImplementedError("trace_memory needs tracemalloc of Python 3.")
+            self._tracemalloc = tracemalloc
+
+    def begin_run(self, graph, names, order):
+        """Called by ExprGraph before a group of nodes is evaluated."""
+        args = {node_id: graph._nodes[node_id][2] for node_id in order}
+        labels = {node_id: self._label(graph._nodes[node_id]) for node_id in order}
+        exprs = {node_id: graph.to_string(node_id) for node_id in order}
+        roots = OrderedDict([(name, graph._outputs[name]) for name in names])
+        outputs = dict()
+        for name, node_id in roots.items():
+            outputs.setdefault(node_id, []).append(name)
+        self._runs.append({'roots': roots, 'args': args, 'labels': labels, 'exprs': exprs, 'outputs': outputs,
+                           'times': dict()})
+
+    def end_run(self):
+        """Called by ExprGraph after a group of nodes is evaluated."""
+        if self.trace_memory and self._started_tracing:
+            self._tracemalloc.stop()
+            self._started_tracing = False
+
+    def begin_node(self):
+        if self.trace_memory:
+            if not self._tracemalloc.is_tracing():
+                self._tracemalloc.start()
+                self._started_tracing = True
+            if hasattr(self._tracemalloc, 'reset_peak'):
+                self._tracemalloc.reset_peak()
+            self._traced_before = self._tracemalloc.get_traced_memory()[0]
+        self._start = time.time()
+
+    def end_node(self, node_id, res):
+        elapsed = time.time() - self._start
+        peak = np.nan
+        if self.trace_memory:
+            peak = self._tracemalloc.get_traced_memory()[1] - self._traced_before
+        run = self._runs[-1]
+        run['times'][node_id] = run['times'].get(node_id, 0.0) + elapsed
+
+        if isinstance(res, (pd.DataFrame, pd.Series)):
+            arr = res.values
+        else:
+            arr = np.asarray(res)
+        if arr.dtype.kind == 'f':
+            nan_ratio = np.isnan(arr).mean() if arr.size else np.nan
+        elif arr.dtype.kind == 'O':
+            nan_ratio = pd.isnull(arr).mean() if arr.size else np.nan
+        else:
+            nan_ratio = 0.0
+        self.records.append({'run': len(self._runs) - 1,
+                             'outputs': ','.join(run['outputs'].get(node_id, [])),
+                             'node': node_id,
+                             'op': run['labels'][node_id],
+                             'expr': run['exprs'][node_id],
+                             'time': elapsed,
+                             'shape': arr.shape,
+                             'bytes': arr.nbytes,
+                             'peak_bytes': peak,
+                             'nan_ratio': nan_ratio})
+
+    @staticmethod
+    def _label(node):
+        type_, op, _ = node
+        if type_ == TNUMBER:
+            return 'number'
+        elif type_ == TVAR:
+            return 'var'
+        return str(op)
+
+    def report(self):
+        """
+        Records of all evaluated nodes.
+
+        Returns
+        -------
+        pd.DataFrame
+            Columns are run (index of evaluation), outputs (names of expressions whose result is the node),
+            node (id in the graph), op, expr (canonical formula of the node), time (seconds), shape,
+            bytes (of the result), peak_bytes (NaN unless trace_memory) and nan_ratio (of the result).
+
+        """
+        return pd.DataFrame(self.records, columns=self.COLUMNS)
+
+    def summary(self, by='op'):
+        """
+        Total time and bytes of records grouped by op (or another column of report), slowest first.
+
+        Returns
+        -------
+        pd.DataFrame
+
+        """
+        df = self.report()
+        gp = df.groupby(by)
+        res = pd.DataFrame({'count': gp.size(), 'time': gp['time'].sum(), 'bytes': gp['bytes'].sum(),
+                            'nan_ratio': gp['nan_ratio'].mean()})
+        res.loc[:, 'time_ratio'] = res['time'] / df['time'].sum()
+        return res.sort_values('time', ascending=False)
+
+    def folded(self):
+        """
+        Flame graph input in folded stack format: one line 'output;op;op... microseconds' per node,
+        whose path goes from an expression to the node. A node shared by several expressions is
+        counted once, under the first of them.
+
+        Returns
+        -------
+        str
+
+        """
+        lines = OrderedDict()
+        for run in self._runs:
+            visited = set()
+            for name, root in run['roots'].items():
+                stack = [(root, [name])]
+                while stack:
+                    node_id, path = stack.pop()
+                    if node_id in visited:
+                        continue
+                    visited.add(node_id)
+                    label = run['labels'][node_id]
+                    if label == 'var':
+                        label = run['exprs'][node_id]
+                    path = path + [label.replace(';', ':').replace(' ', '')]
+                    key = ';'.join(path)
+                    lines[key] = lines.get(key, 0) + run['times'].get(node_id, 0.0)
+                    stack.extend([(arg, path) for arg in reversed(run['args'][node_id])])
+        return '\n'.join(['{} {:d}'.format(key, int(round(t * 1e6))) for key, t in lines.items()
+                          if not key.endswith(';number')])
+
+    def save_folded(self, path):
+        """Write folded stacks (see folded) to a file."""
+        with open(path, 'w') as f:
+            f.write(self.folded() + '\n')
+
+
+def _max_lookback(items):
+    """Max lookback of non-number items (is_number, value). None if any of them is unbounded."""
+    res = 0
+    for is_num, value in items:
+        if is_num:
+            continue
+        if value is None:
+            return None
+        res = max(res, value)
+    return res
+
+
+def _slice_dates(obj, begin, end, dates=None):
+    """
+    Rows of obj from begin to end (both included).
+    If dates is given, obj is sliced only if it is indexed by them (e.g. quarterly data is not).
+    Numbers are returned as they are.
+
+    """
+    if not isinstance(obj, (pd.DataFrame, pd.Series)):
+        return obj
+    index = obj.index.values
+    if dates is not None and not np.in1d(index, dates).all():
+        return obj
+    return obj.loc[(index >= begin) & (index <= end)]
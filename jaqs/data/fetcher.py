@@ -0,0 +1,140 @@
+# encoding: utf-8
+"""
+Run independent data queries concurrently.
+
+Queries to the data server are network-bound, so a thread pool is enough to overlap them.
+DataApi matches each response to its request by call id, so one connection can be shared by threads.
+
+"""
+from __future__ import print_function
+import time
+from collections import OrderedDict, deque
+from multiprocessing.pool import ThreadPool
+
+
+class FetchPlanner(object):
+    """
+    Collect independent queries, run them in a thread pool and return results in the order they are added.
+
+    Attributes
+    ----------
+    n_workers : int
+        Max number of queries running at the same time. 1 means run in the calling thread one by one.
+    n_retries : int
+        Times to retry a failed query before giving up.
+    retry_wait : float
+        Seconds to wait before the first retry, doubled for each next retry.
+
+    Examples
+    --------
+    planner = FetchPlanner(n_workers=4)
+    planner.add('daily', ds.daily, symbol, start_date, end_date, fields='close')
+    planner.add('inst', ds.query_inst_info, symbol)
+    res = planner.run()
+    df_daily, msg = res['daily']
+
+    """
+    def __init__(self, n_workers=4, n_retries=0, retry_wait=1.0):
+        self.n_workers = n_workers
+        self.n_retries = n_retries
+        self.retry_wait = retry_wait
+        self._tasks = OrderedDict()
+
+    def __len__(self):
+        return len(self._tasks)
+
+    def add(self, name, func, *args, **kwargs):
+        """
+        Add a query. Queries must not depend on each other.
+
+        Parameters
+        ----------
+        name : str or tuple
+            Unique name, used as key of result.
+        func : callable
+        args, kwargs
+            Arguments passed to func.
+
+        """
+        if name in self._tasks:
+            raise ValueError("Task [{}] already exists.".format(name))
+        self._tasks[name] = (func, args, kwargs)
+
+    def _call(self, item):
+        name, (func, args, kwargs) = item
+        wait = self.retry_wait
+        for i in range(self.n_retries + 1):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                if i == self.n_retries:
+                    raise
+                print("Query [{}] failed: {}. Retry in {:.1f} seconds...".format(name, e, wait))
+                time.sleep(wait)
+                wait *= 2
+
+    def iter_run(self):
+        """
+        Run all added queries, then clear them. Results are yielded in the order queries are added,
+        as soon as they (and all queries added before them) are finished,
+        so that the caller can process and release each result before the others arrive.
+        At most n_workers queries are running or waiting to be consumed at the same time:
+        the next query is started after a result is taken by the caller.
+        If a query still fails after retries, no more queries are started, and its exception is raised
+        when its result is reached.
+
+        Yields
+        ------
+        name : str or tuple
+        result : return value of func
+
+        """
+        tasks, self._tasks = self._tasks, OrderedDict()
+        items = list(tasks.items())
+        if self.n_workers <= 1 or len(items) <= 1:
+            for item in items:
+                yield item[0], self._call(item)
+            return
+
+        failed = []
+
+        def call(item):
+            try:
+                return self._call(item)
+            except Exception:
+                failed.append(item[0])
+                raise
+
+        pool = ThreadPool(min(self.n_workers, len(items)))
+        pending = deque()
+        i_next = 0
+        try:
+            while True:
+                while i_next < len(items) and len(pending) < self.n_workers and not failed:
+                    pending.append(pool.apply_async(call, (items[i_next],)))
+                    i_next += 1
+                if not pending:
+                    break
+                name = items[i_next - len(pending)][0]
+                r = pending.popleft().get()
+                yield name, r
+                # do not keep the result while waiting for the next one
+                del r
+        finally:
+            # queries not started will never be, running ones are waited for
+            pool.terminate()
+            pool.join()
+
+    def run(self):
+        """
+        Run all added queries, then clear them.
+        If any query fails, no more queries are started and the exception of the first failed query
+        (in adding order) is raised.
+
+        Returns
+        -------
+        res : OrderedDict
+            {name: return value of func}, in the order queries are added.
+
+        """
+        return OrderedDict(self.iter_run())
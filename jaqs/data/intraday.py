@@ -0,0 +1,418 @@
+# encoding: utf-8
+"""
+Minute bar data for intraday research.
+
+Bars are queried day by day from RemoteDataService.bar and stored day by day: one FieldPanel for each trade date,
+whose index is the combined datetime (%Y%m%d%H%M%S, see jutil.combine_date_time).
+Prices are stored as float32: a month (21 days x 240 bars) of 1-minute bars of 300 symbols takes about 6 MB
+per price field and 12 MB per float64 field (volume, turnover, oi), about 66 MB for all market bar fields.
+
+"""
+from __future__ import print_function
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import jaqs.util as jutil
+from jaqs.data.py_expression_eval import Parser
+from jaqs.data.panel import FieldPanel
+from jaqs.data.fetcher import FetchPlanner
+
+
+class IntradayDataView(object):
+    """
+    Prepare minute bar data of a group of symbols during a date range. Support add formula and daily fields.
+
+    Attributes
+    ----------
+    symbol : list of str
+    start_date, end_date : int
+    freq : {'1m', '5m', '15m'}
+        Bar type.
+    fields : list of str
+    n_workers : int
+        Max number of queries sent to data_api at the same time.
+    chunk_size : int
+        Max number of symbols in one query.
+    n_retries : int
+        Times to retry a failed query.
+    exact_fields : set
+        Fields stored as float64. Other float fields are stored as float32.
+    custom_formulas : list of dict
+        Formulas added by add_formula: field_name, formula, session_reset and formula_func_name_style.
+
+    Examples
+    --------
+    dv = IntradayDataView()
+    dv.init_from_config({'symbol': '600030.SH,000001.SZ', 'start_date': 20170801, 'end_date': 20170831,
+                         'freq': '1m', 'fields': 'close,volume'}, data_api=ds)
+    dv.prepare_data()
+    dv.add_formula('ret5', 'Delta(close, 5) / Delay(close, 5)')
+    dv.add_daily_field('close_1d', dv_daily.get_ts('close'), available_time=150000)
+    df = dv.get_ts('ret5')  # index is datetime, columns is symbol
+
+    """
+    DATETIME_FIELD_NAME = 'datetime'
+
+    def __init__(self):
+        self.data_api = None
+
+        self.symbol = []
+        self.universe = ""
+        self.start_date = 0
+        self.end_date = 0
+        self.freq = '1m'
+        self.fields = []
+        self.n_workers = 4
+        self.chunk_size = 300
+        self.n_retries = 2
+        self.custom_formulas = []
+
+        self.market_bar_fields = {'open', 'high', 'low', 'close', 'volume', 'turnover', 'vwap', 'oi'}
+        self.exact_fields = {'volume', 'turnover', 'oi'}
+
+        # {trade_date: FieldPanel}, in order of dates
+        self._days = OrderedDict()
+
+    # --------------------------------------------------------------------------------------------------------
+    # Properties
+    @property
+    def dates(self):
+        """
+        Trade dates which have bars.
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        return np.array(list(self._days.keys()), dtype=np.int64)
+
+    @property
+    def datetimes(self):
+        """
+        Datetime (%Y%m%d%H%M%S) index of all bars.
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        if not self._days:
+            return np.array([], dtype=np.int64)
+        return np.concatenate([panel.dates for panel in self._days.values()])
+
+    @property
+    def nbytes(self):
+        """Bytes of all stored data."""
+        return sum([panel.nbytes for panel in self._days.values()])
+
+    def get_day(self, trade_date):
+        """
+        Get bars of a trade date.
+
+        Returns
+        -------
+        FieldPanel
+            Index is datetime.
+
+        """
+        return self._days[trade_date]
+
+    def _field_dtype(self, field_name):
+        return np.float64 if field_name in self.exact_fields else np.float32
+
+    # --------------------------------------------------------------------------------------------------------
+    # Prepare data
+    def init_from_config(self, props, data_api):
+        """
+        Initialize date range, symbols, fields and bar type.
+
+        Parameters
+        ----------
+        props : dict
+            start_date, end_date, symbol or universe, fields, freq, etc.
+        data_api : RemoteDataService
+
+        """
+        self.data_api = data_api
+
+        sep = ','
+        self.start_date = props['start_date']
+        self.end_date = props['end_date']
+        self.freq = props.get('freq', '1m')
+        self.n_workers = props.get('n_workers', 4)
+        self.chunk_size = props.get('chunk_size', 300)
+        self.n_retries = props.get('n_retries', 2)
+
+        fields = props.get('fields', "")
+        if fields:
+            fields = fields.split(sep)
+            self.fields = [field for field in fields if field in self.market_bar_fields]
+            if len(self.fields) < len(fields):
+                print("Field name [{}] not valid, ignore.".format(set.difference(set(fields), set(self.fields))))
+        else:
+            self.fields = sorted(self.market_bar_fields)
+
+        universe = props.get('universe', "")
+        symbol = props.get('symbol', "")
+        if symbol and universe:
+            raise ValueError("Please use either [symbol] or [universe].")
+        if not (symbol or universe):
+            raise ValueError("One of [symbol] or [universe] must be provided.")
+        if universe:
+            self.universe = universe
+            self.symbol = sorted(data_api.get_index_comp(self.universe, self.start_date, self.end_date))
+        else:
+            self.symbol = sorted(symbol.split(sep))
+
+        print("Initialize config success.")
+
+    def prepare_data(self):
+        """
+        Query bars day by day. Queries are sent concurrently, and bars of each day are converted to
+        a FieldPanel as soon as all queries of that day arrive.
+
+        """
+        print("Query data...")
+        sep = ','
+        dates = self.data_api.get_trade_date_range(self.start_date, self.end_date)
+        symbol_chunks = [sep.join(self.symbol[i: i + self.chunk_size])
+                         for i in range(0, len(self.symbol), max(self.chunk_size, 1))]
+        query_fields = sep.join(['date', 'time', 'trade_date'] + self.fields)
+
+        planner = FetchPlanner(n_workers=self.n_workers, n_retries=self.n_retries)
+        for date in dates:
+            for i, symbol_str in enumerate(symbol_chunks):
+                planner.add((date, i), self.data_api.bar, symbol_str, trade_date=date, freq=self.freq,
+                            fields=query_fields)
+
+        self._days = OrderedDict()
+        df_list = []
+        for (date, i), (df, msg) in planner.iter_run():
+            if msg != '0,':
+                raise ValueError("Query bar of {} failed: msg = '{:s}'".format(date, msg))
+            df_list.append(df)
+            if i == len(symbol_chunks) - 1:
+                panel = self._bars_to_panel(pd.concat(df_list, axis=0))
+                if panel is not None:
+                    self._days[date] = panel
+                df_list = []
+
+        print("Data has been successfully prepared: {:d} days, {:.1f} MB.".format(len(self._days),
+                                                                                 self.nbytes / 1024. ** 2))
+
+    def _bars_to_panel(self, df):
+        """Convert bars of one trade date returned by data_api.bar to a FieldPanel. None if there is no bar."""
+        if df is None or len(df) == 0:
+            return None
+        df = df.assign(datetime=jutil.combine_date_time(df['date'].values, df['time'].values))
+        df = df.drop_duplicates(subset=[self.DATETIME_FIELD_NAME, 'symbol']).set_index(
+            [self.DATETIME_FIELD_NAME, 'symbol'])
+        datetimes = np.unique(df.index.get_level_values(level=0))
+
+        data = dict()
+        for field in self.fields:
+            if field in df.columns:
+                df_field = df[field].unstack(level='symbol').reindex(index=datetimes, columns=self.symbol)
+                data[field] = df_field.values.astype(self._field_dtype(field))
+            else:
+                data[field] = np.full((len(datetimes), len(self.symbol)), np.nan, dtype=self._field_dtype(field))
+        return FieldPanel(datetimes, self.symbol, data=data, index_name=self.DATETIME_FIELD_NAME)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Add / remove fields
+    def _set_field(self, field_name, dic):
+        """Set data of field_name for each day. dic is {trade_date: DataFrame}."""
+        for date, panel in self._days.items():
+            df = dic[date]
+            if all([dt.kind == 'f' for dt in df.dtypes]):
+                panel.set_field(field_name, df, dtype=self._field_dtype(field_name))
+            else:
+                panel.set_field(field_name, df)
+        if field_name not in self.fields:
+            self.fields.append(field_name)
+
+    def append_df(self, df, field_name):
+        """
+        Add or overwrite a field.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Index is datetime (%Y%m%d%H%M%S), columns is symbol.
+        field_name : str
+
+        """
+        df = df.sort_index()
+        dic = dict()
+        for date, panel in self._days.items():
+            dic[date] = df.loc[panel.dates[0]: panel.dates[-1]]
+        self._set_field(field_name, dic)
+
+    def add_daily_field(self, field_name, df, available_time=0):
+        """
+        Broadcast a daily field to bars by as-of join: each bar gets the latest daily value available at its datetime.
+
+        Parameters
+        ----------
+        field_name : str
+        df : pd.DataFrame
+            Index is trade date, columns is symbol, e.g. result of DataView.get_ts.
+        available_time : int
+            Time (%H%M%S) when the value of a trade date becomes available.
+            Default 0: available before the session of its trade date begins, e.g. adjust factor or group.
+            Use 150000 for values known after the close, like daily close price: bars of a trade date then
+            get the value of the previous trade date, and no look-ahead happens.
+
+        """
+        df = df.sort_index().reindex(columns=self.symbol)
+        keys = jutil.combine_date_time(df.index.values, available_time)
+        values = df.values
+
+        dic = dict()
+        for date, panel in self._days.items():
+            idx = np.searchsorted(keys, panel.dates, side='right') - 1
+            arr = values[np.maximum(idx, 0)]
+            if arr.dtype.kind in 'biu':
+                arr = arr.astype(float)
+            arr[idx < 0] = np.nan
+            dic[date] = pd.DataFrame(arr, index=panel.dates, columns=self.symbol)
+        self._set_field(field_name, dic)
+
+    def add_formula(self, field_name, formula, session_reset=True, formula_func_name_style='camel'):
+        """
+        Add a new field, which is calculated using existing fields.
+
+        Parameters
+        ----------
+        field_name : str
+        formula : str
+        session_reset : bool
+            If True, time series functions are calculated within each trading day, so that their windows
+            do not cross the overnight gap, e.g. Delay(close, 1) is NaN for the first bar of each day.
+            If False, windows continue from previous days.
+        formula_func_name_style : {'camel', 'lower'}, optional
+
+        """
+        if field_name in self.fields:
+            print("Add formula failed: name [{:s}] exist. Try another name.".format(field_name))
+            return
+
+        parser = Parser()
+        parser.set_capital(formula_func_name_style)
+        expr = parser.parse(formula)
+        var_list = expr.variables()
+        for var in var_list:
+            if var not in self.fields:
+                raise ValueError("Variable [{:s}] does not exist.".format(var))
+
+        self._set_field(field_name, self._evaluate_formula(parser, var_list, session_reset))
+        self.custom_formulas.append({'field_name': field_name, 'formula': formula, 'session_reset': session_reset,
+                                     'formula_func_name_style': formula_func_name_style})
+
+    def _evaluate_formula(self, parser, var_list, session_reset=True):
+        """
+        Evaluate the formula parsed by parser day by day.
+        If windows continue from previous days, the last rows of previous days which the formula needs
+        (see Parser.lookback) are evaluated together with each day.
+
+        Returns
+        -------
+        dict
+            {trade_date: pd.DataFrame}
+
+        """
+        lookback = 0 if session_reset else parser.lookback()
+        if lookback is None:
+            # depends on all history
+            var_df_dic = {var: self.get_ts(var) for var in var_list}
+            df_eval = parser.evaluate(var_df_dic)
+            return {date: df_eval.loc[panel.dates] for date, panel in self._days.items()}
+
+        res = dict()
+        tails = {var: None for var in var_list}
+        for date, panel in self._days.items():
+            var_df_dic = dict()
+            for var in var_list:
+                df = panel.get_ts(var)
+                if lookback > 0:
+                    if tails[var] is not None:
+                        df = pd.concat([tails[var], df], axis=0)
+                    tails[var] = df.iloc[-lookback:]
+                var_df_dic[var] = df
+            df_eval = parser.evaluate(var_df_dic)
+            res[date] = df_eval.iloc[len(df_eval) - len(panel.dates):]
+        return res
+
+    def remove_field(self, field_name):
+        """
+        Remove a field.
+
+        Parameters
+        ----------
+        field_name : str
+
+        """
+        if field_name not in self.fields:
+            print("Field name [{:s}] does not exist.".format(field_name))
+            return
+        for panel in self._days.values():
+            panel.remove_field(field_name)
+        self.fields.remove(field_name)
+        self.custom_formulas = [dic for dic in self.custom_formulas if dic['field_name'] != field_name]
+
+    # --------------------------------------------------------------------------------------------------------
+    # Get data
+    def get_ts(self, field, symbol="", start_date=0, end_date=0):
+        """
+        Get bars of single field.
+
+        Parameters
+        ----------
+        field : str
+        symbol : str, optional
+            Separated by ',' default "" (all securities).
+        start_date, end_date : int, optional
+            Trade dates. Default all dates.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is datetime (%Y%m%d%H%M%S), column is symbol.
+
+        """
+        symbol = symbol.split(',') if symbol else None
+        df_list = [panel.get_ts(field, symbol=symbol) for date, panel in self._days.items()
+                   if (not start_date or date >= start_date) and (not end_date or date <= end_date)]
+        if not df_list:
+            raise ValueError("No data between {} and {}.".format(start_date, end_date))
+        if len(df_list) == 1:
+            return df_list[0]
+        return pd.concat(df_list, axis=0)
+
+    def get_snapshot(self, datetime, symbol="", fields=""):
+        """
+        Get snapshot of given fields and symbol at a bar.
+
+        Parameters
+        ----------
+        datetime : int
+            %Y%m%d%H%M%S
+        symbol : str, optional
+            Separated by ',' default "" (all securities).
+        fields : str, optional
+            Separated by ',' default "" (all fields).
+
+        Returns
+        -------
+        pd.DataFrame
+            symbol as index, field as columns
+
+        """
+        for panel in self._days.values():
+            if panel.dates[0] <= datetime <= panel.dates[-1]:
+                return panel.get_snapshot(datetime, symbol=symbol.split(',') if symbol else None,
+                                          fields=fields.split(',') if fields else None)
+        raise KeyError("No bar at {}.".format(datetime))
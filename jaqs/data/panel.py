@@ -0,0 +1,1355 @@
+# encoding: utf-8
+"""
+Array based storage engines for DataView.
+
+DataView keeps its daily data in a wide DataFrame whose columns are a (symbol, field) MultiIndex.
+Classes in this module hold the same data in plain numpy arrays and use integer lookup tables
+to locate dates, symbols and fields, so that most queries return views instead of copies.
+
+"""
+from __future__ import print_function
+import os
+import hashlib
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import jaqs.util as jutil
+
+
+def _is_numeric_dtype(dtype):
+    return issubclass(dtype.type, (np.floating, np.integer, np.bool_))
+
+
+def _to_slice(positions):
+    """Convert sorted positions to a slice if they are consecutive, so that indexing returns a view."""
+    positions = np.asarray(positions, dtype=int)
+    if len(positions) == 0:
+        return positions
+    if len(positions) == 1 or np.all(np.diff(positions) == 1):
+        return slice(positions[0], positions[-1] + 1)
+    return positions
+
+
+class BasePanel(object):
+    """
+    Common date / symbol / field lookup of panels.
+    
+    Attributes
+    ----------
+    dates : np.ndarray
+        dtype = int
+    symbols : np.ndarray
+    fields : np.ndarray
+    index_name : str
+        Name of the date index, 'trade_date' for daily data and 'report_date' for quarterly data.
+    
+    """
+    def __init__(self, dates, symbols, fields, index_name='trade_date'):
+        self.dates = np.asarray(dates)
+        self.symbols = np.asarray(symbols, dtype=object)
+        self.fields = np.asarray(fields, dtype=object)
+        self.index_name = index_name
+
+        self._date_pos = None
+        self._symbol_pos = None
+        self._field_pos = None
+        self._build_lookup()
+
+    def _build_lookup(self):
+        self._date_pos = {date: i for i, date in enumerate(self.dates)}
+        self._symbol_pos = {symbol: i for i, symbol in enumerate(self.symbols)}
+        self._field_pos = {field: i for i, field in enumerate(self.fields)}
+
+    # --------------------------------------------------------------------------------------------------------
+    # Lookup
+    def _date_slice(self, start_date=0, end_date=0):
+        start = 0 if not start_date else np.searchsorted(self.dates, start_date, side='left')
+        end = len(self.dates) if not end_date else np.searchsorted(self.dates, end_date, side='right')
+        return slice(start, end)
+
+    @staticmethod
+    def _lookup(names, pos_map, kind):
+        try:
+            return sorted([pos_map[name] for name in names])
+        except KeyError as e:
+            raise KeyError("{} {} does not exist.".format(kind, e))
+
+    def _symbol_index(self, symbol=None):
+        if symbol is None or len(symbol) == 0:
+            return slice(None)
+        return _to_slice(self._lookup(symbol, self._symbol_pos, 'symbol'))
+
+    def _field_index(self, fields=None):
+        if fields is None or len(fields) == 0:
+            return slice(None)
+        return _to_slice(self._lookup(fields, self._field_pos, 'field'))
+
+    def _insert_field_name(self, field):
+        """Add field name to sorted self.fields if it does not exist."""
+        if field not in self._field_pos:
+            self.fields = np.array(sorted(list(self.fields) + [field]), dtype=object)
+            self._field_pos = {f: i for i, f in enumerate(self.fields)}
+
+    def get_date_pos(self, date):
+        """Return row position of date. Raise KeyError if date is not in self.dates."""
+        return self._date_pos[date]
+
+    def _field_row(self, field, row, idx_symbol):
+        """Return values of field at row position of dates, for symbols at idx_symbol."""
+        raise NotImplementedError()
+
+    def get_snapshot_arrays(self, date, symbol=None, fields=None):
+        """
+        Get snapshot of given fields and symbol at date as plain arrays, without building a DataFrame.
+        Arrays are views of the panel whenever possible, do not modify them.
+
+        Parameters
+        ----------
+        date : int
+        symbol : list of str, optional
+        fields : list of str, optional
+            Default all fields.
+
+        Returns
+        -------
+        OrderedDict
+            {'symbol': np.ndarray, field: np.ndarray}, symbols are sorted.
+
+        """
+        row = self._date_pos[date]
+        idx_symbol = self._symbol_index(symbol)
+        if fields is None or len(fields) == 0:
+            fields = self.all_fields
+
+        res = OrderedDict()
+        res['symbol'] = self.symbols[idx_symbol]
+        for field in fields:
+            res[field] = self._field_row(field, row, idx_symbol)
+        return res
+
+    def _new_frame(self, arr, sl_date, idx_symbol):
+        res = pd.DataFrame(arr, index=self.dates[sl_date], columns=self.symbols[idx_symbol], copy=False)
+        res.index.name = self.index_name
+        res.columns.name = 'symbol'
+        return res
+
+    def _new_date_rows(self, df, fields):
+        """
+        Split df with (symbol, field) MultiIndex columns into {field: 2-D array} for dates later than self.dates.
+        Fields not in df are filled with NaN.
+
+        """
+        new_dates = df.index.values
+        if len(self.dates) and len(new_dates) and new_dates[0] <= self.dates[-1]:
+            raise ValueError("New dates must be later than {}.".format(self.dates[-1]))
+        if np.any(np.diff(new_dates) <= 0):
+            raise ValueError("New dates must be sorted and unique.")
+
+        df_fields = set(df.columns.get_level_values(1))
+        res = dict()
+        for field in fields:
+            if field in df_fields:
+                res[field] = df.xs(field, axis=1, level=1).reindex(columns=self.symbols).values
+            else:
+                res[field] = np.full((len(new_dates), len(self.symbols)), np.nan)
+        return new_dates, res
+
+
+CATEGORY = 'category'
+
+
+def _encode_labels(arr, categories):
+    """
+    Encode labels to int32 codes, -1 for missing values.
+    
+    Parameters
+    ----------
+    arr : np.ndarray
+    categories : np.ndarray
+        Existing labels, new labels will be appended.
+
+    Returns
+    -------
+    codes : np.ndarray
+        The same shape with arr.
+    categories : np.ndarray
+        dtype = object
+
+    """
+    arr = np.asarray(arr, dtype=object)
+    codes, uniques = pd.factorize(arr.ravel())
+    if len(uniques):
+        dic = {label: i for i, label in enumerate(categories)}
+        new_labels = [label for label in uniques if label not in dic]
+        categories = np.concatenate([categories, np.array(new_labels, dtype=object)]) if new_labels else categories
+        dic.update({label: i for i, label in enumerate(categories)})
+        mapping = np.array([dic[label] for label in uniques], dtype=np.int32)
+        codes = np.where(codes >= 0, mapping[np.maximum(codes, 0)], -1)
+    return codes.astype(np.int32).reshape(arr.shape), categories
+
+
+class DensePanel(BasePanel):
+    """
+    Daily data of DataView stored in one contiguous (date, symbol, field) float array.
+
+    Attributes
+    ----------
+    values : np.ndarray
+        shape = (n_dates, n_symbols, n_fields)
+    dates : np.ndarray
+        dtype = int
+    symbols : np.ndarray
+    fields : np.ndarray
+    extra : dict
+        {field: np.ndarray of shape (n_dates, n_symbols)}.
+        Fields that can not be converted to float (like trade_status) are stored here,
+        so are fields with their own dtype (see extra_dtypes).
+    extra_dtypes : dict
+        {field: dtype or 'category'}. A 'category' field is stored as int32 codes in extra,
+        with one dictionary of labels (see categories) shared by all dates and symbols.
+        A bool field is True where value is non-zero, NaN is False.
+    categories : dict
+        {field: np.ndarray of labels}. Labels are decoded when data is accessed, except by get_codes.
+
+    Notes
+    -----
+    Both symbols and fields are kept sorted, so the columns of the adapter DataFrame
+    have the same order with DataView.data_d.
+
+    """
+    def __init__(self, values, dates, symbols, fields, extra=None, extra_dtypes=None, categories=None):
+        super(DensePanel, self).__init__(dates, symbols, fields)
+        self.values = values
+        self.extra = extra if extra is not None else dict()
+        self.extra_dtypes = extra_dtypes if extra_dtypes is not None else dict()
+        self.categories = categories if categories is not None else dict()
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + sum([arr.nbytes for arr in self.extra.values()])
+
+    @property
+    def all_fields(self):
+        return sorted(list(self.fields) + list(self.extra.keys()))
+
+    def _field_row(self, field, row, idx_symbol):
+        pos = self._field_pos.get(field, None)
+        if pos is not None:
+            return self.values[row, idx_symbol, pos]
+        return self._get_extra(field, (row, idx_symbol))
+
+    def _get_extra(self, field, key=slice(None)):
+        """Get extra[field][key], labels are decoded for 'category' fields."""
+        if field not in self.extra:
+            raise KeyError("field {} does not exist.".format(field))
+        arr = self.extra[field][key]
+        if field in self.categories:
+            # code -1 selects the last one: NaN
+            arr = np.append(self.categories[field], np.nan)[arr]
+        return arr
+
+    def _convert_extra(self, field, arr, dtype=None):
+        """Convert values of field to the dtype of extra_dtypes[field], encode labels if necessary."""
+        if dtype is not None:
+            self.extra_dtypes[field] = dtype
+        dtype = self.extra_dtypes.get(field, None)
+        if dtype is None:
+            return np.asarray(arr).astype(object)
+        if dtype == CATEGORY:
+            codes, self.categories[field] = _encode_labels(arr, self.categories.get(field, np.array([], dtype=object)))
+            return codes
+        if np.dtype(dtype) == np.bool_:
+            return np.nan_to_num(np.asarray(arr, dtype=float)) != 0
+        return np.asarray(arr).astype(dtype)
+
+    def is_categorical(self, field):
+        return field in self.categories
+
+    def get_codes(self, field, symbol=None, start_date=0, end_date=0):
+        """
+        Get integer codes of a 'category' field. Codes group the same way as labels,
+        but are much faster to compare and sort.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is int date, column is symbol. Missing values are NaN.
+
+        """
+        if field not in self.categories:
+            raise KeyError("field {} is not categorical.".format(field))
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        arr = self.extra[field][sl_date, idx_symbol].astype(float)
+        arr[arr < 0] = np.nan
+        return self._new_frame(arr, sl_date, idx_symbol)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Conversion
+    @classmethod
+    def from_frame(cls, df, dtype=np.float64, extra_dtypes=None):
+        """
+        Build a DensePanel from a DataFrame with (symbol, field) MultiIndex columns.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index is date, columns is symbol-field MultiIndex
+        dtype : np.dtype, optional
+            dtype of the float array.
+        extra_dtypes : dict, optional
+            {field: dtype or 'category'}. These fields are stored in extra with their own dtype.
+
+        Returns
+        -------
+        DensePanel
+
+        """
+        dates = df.index.values
+        symbols = np.array(sorted(set(df.columns.get_level_values(0))), dtype=object)
+        all_fields = sorted(set(df.columns.get_level_values(1)))
+        extra_dtypes = dict(extra_dtypes) if extra_dtypes is not None else dict()
+
+        numeric_fields = []
+        extra_fields = []
+        for field in all_fields:
+            df_field = df.xs(field, axis=1, level=1).reindex(columns=symbols)
+            if field not in extra_dtypes and all([_is_numeric_dtype(dt) for dt in df_field.dtypes]):
+                numeric_fields.append(field)
+            else:
+                extra_fields.append(field)
+
+        values = np.empty((len(dates), len(symbols), len(numeric_fields)), dtype=dtype)
+        for j, field in enumerate(numeric_fields):
+            values[:, :, j] = df.xs(field, axis=1, level=1).reindex(columns=symbols).values
+
+        panel = cls(values, dates, symbols, numeric_fields,
+                    extra_dtypes={k: v for k, v in extra_dtypes.items() if k in extra_fields})
+        for field in extra_fields:
+            arr = df.xs(field, axis=1, level=1).reindex(columns=symbols).values
+            panel.extra[field] = panel._convert_extra(field, arr)
+        return panel
+
+    def to_frame(self):
+        """
+        Build the DataFrame adapter with (symbol, field) MultiIndex columns.
+        If there is no extra field, the DataFrame shares memory with self.values.
+
+        Returns
+        -------
+        pd.DataFrame
+
+        """
+        n_dates, n_symbols, n_fields = self.values.shape
+        cols = pd.MultiIndex.from_product([self.symbols, self.fields], names=['symbol', 'field'])
+        df = pd.DataFrame(self.values.reshape(n_dates, n_symbols * n_fields),
+                          index=self.dates, columns=cols, copy=False)
+
+        if self.extra:
+            dic_extra = {field: pd.DataFrame(self._get_extra(field), index=self.dates, columns=self.symbols)
+                         for field in self.extra}
+            df_extra = pd.concat(dic_extra, axis=1)
+            df_extra.columns = df_extra.columns.swaplevel()
+            df = pd.concat([df, df_extra], axis=1)
+            df = df.sort_index(axis=1, level=['symbol', 'field'])
+        df.columns.names = ['symbol', 'field']
+        df.index.name = 'trade_date'
+        return df
+
+    # --------------------------------------------------------------------------------------------------------
+    # Data access
+    def get_ts(self, field, symbol=None, start_date=0, end_date=0):
+        """
+        Get time series data of single field.
+        The result is a view of self.values when symbol is empty or consecutive.
+
+        Parameters
+        ----------
+        field : str
+        symbol : list of str, optional
+        start_date : int, optional
+        end_date : int, optional
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is int date, column is symbol.
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        if field in self._field_pos:
+            arr = self.values[sl_date, idx_symbol, self._field_pos[field]]
+        else:
+            arr = self._get_extra(field, (sl_date, idx_symbol))
+        return self._new_frame(arr, sl_date, idx_symbol)
+
+    def get_snapshot(self, date, symbol=None, fields=None):
+        """
+        Get snapshot of given fields and symbol at date.
+        The result is a view of self.values when symbol and fields are empty or consecutive.
+
+        Parameters
+        ----------
+        date : int
+        symbol : list of str, optional
+        fields : list of str, optional
+
+        Returns
+        -------
+        pd.DataFrame
+            symbol as index, field as columns
+
+        """
+        row = self._date_pos[date]
+        idx_symbol = self._symbol_index(symbol)
+
+        if fields is None or len(fields) == 0:
+            numeric_fields, extra_fields = list(self.fields), list(self.extra.keys())
+        else:
+            numeric_fields = [f for f in fields if f in self._field_pos]
+            extra_fields = [f for f in fields if f not in self._field_pos]
+
+        idx_field = self._field_index(numeric_fields)
+        res = pd.DataFrame(self.values[row, idx_symbol, idx_field],
+                           index=self.symbols[idx_symbol], columns=self.fields[idx_field], copy=False)
+        if extra_fields:
+            for field in extra_fields:
+                res[field] = self._get_extra(field, (row, idx_symbol))
+            res = res.reindex(columns=sorted(res.columns))
+        res.index.name = 'symbol'
+        res.columns.name = 'field'
+        return res
+
+    def get(self, symbol=None, start_date=0, end_date=0, fields=None):
+        """
+        Get data of given symbols, date range and fields.
+        The result is a view of self.values when neither symbol nor fields is specified.
+
+        Returns
+        -------
+        pd.DataFrame
+            index is date, columns are (symbol, fields) MultiIndex
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        if fields and any([f not in self._field_pos for f in fields]) or (not fields and self.extra):
+            # object fields involved, fall back to the DataFrame adapter
+            df = self.to_frame().iloc[sl_date]
+            sym = slice(None) if symbol is None or len(symbol) == 0 else list(symbol)
+            fld = slice(None) if fields is None or len(fields) == 0 else list(fields)
+            return df.loc[:, pd.IndexSlice[sym, fld]]
+
+        idx_field = self._field_index(fields)
+        arr = self.values[sl_date, idx_symbol, idx_field]
+        symbols, fields = self.symbols[idx_symbol], self.fields[idx_field]
+        cols = pd.MultiIndex.from_product([symbols, fields], names=['symbol', 'field'])
+        res = pd.DataFrame(arr.reshape(arr.shape[0], -1), index=self.dates[sl_date], columns=cols, copy=False)
+        res.index.name = 'trade_date'
+        return res
+
+    # --------------------------------------------------------------------------------------------------------
+    # Modification
+    def set_field(self, field, df, dtype=None):
+        """
+        Add or overwrite a field. df will be aligned to dates and symbols of the panel.
+
+        Parameters
+        ----------
+        field : str
+        df : pd.DataFrame
+            index is date, column is symbol.
+        dtype : np.dtype or 'category', optional
+            Store the field in extra with this dtype. Default keeps the dtype of an existing field,
+            or stores a new numeric field in the float array.
+
+        """
+        df = df.reindex(index=self.dates, columns=self.symbols)
+        if (dtype is not None or field in self.extra_dtypes
+                or not all([_is_numeric_dtype(dt) for dt in df.dtypes])):
+            if field in self._field_pos:
+                self.remove_field(field)
+            self.extra[field] = self._convert_extra(field, df.values, dtype=dtype)
+            return
+
+        if field in self._field_pos:
+            self.values[:, :, self._field_pos[field]] = df.values
+            return
+
+        self._pop_extra(field)
+        j = np.searchsorted(self.fields, field)
+        self.values = np.insert(self.values, j, df.values, axis=2)
+        self.fields = np.insert(self.fields, j, field)
+        self._build_lookup()
+
+    def append_dates(self, df):
+        """
+        Append data of new dates to the end of the panel.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index is date (must be later than existing dates), columns is symbol-field MultiIndex.
+            Fields not in df are filled with NaN, fields not in the panel are ignored.
+
+        """
+        new_dates, dic_rows = self._new_date_rows(df, self.all_fields)
+        new_values = np.empty((len(new_dates), len(self.symbols), len(self.fields)), dtype=self.values.dtype)
+        for j, field in enumerate(self.fields):
+            new_values[:, :, j] = dic_rows[field]
+        self.values = np.concatenate([self.values, new_values], axis=0)
+        for field, arr in self.extra.items():
+            self.extra[field] = np.concatenate([arr, self._convert_extra(field, dic_rows[field])], axis=0)
+
+        self.dates = np.concatenate([self.dates, new_dates])
+        self._build_lookup()
+
+    def field_arrays(self, fields=None):
+        """Iterate over (field, 2-D array) pairs of fields (default all fields). Arrays are views of self.values."""
+        for field in (self.all_fields if fields is None else fields):
+            if field in self.extra:
+                yield field, self._get_extra(field)
+            else:
+                yield field, self.values[:, :, self._field_pos[field]]
+
+    def _pop_extra(self, field):
+        self.extra.pop(field, None)
+        self.extra_dtypes.pop(field, None)
+        self.categories.pop(field, None)
+
+    def remove_field(self, field):
+        if field in self.extra:
+            self._pop_extra(field)
+            return
+        j = self._field_pos[field]
+        self.values = np.delete(self.values, j, axis=2)
+        self.fields = np.delete(self.fields, j)
+        self._build_lookup()
+
+
+class FieldPanel(BasePanel):
+    """
+    Data of DataView stored as a dict of {field: 2-D array}, all arrays share one date index and one symbol index.
+    
+    Arrays can be loaded lazily: if a loader is provided, a field is only loaded when it is first accessed.
+    
+    Attributes
+    ----------
+    dates : np.ndarray
+    symbols : np.ndarray
+    fields : np.ndarray
+        All fields, including those not loaded yet.
+    
+    """
+    def __init__(self, dates, symbols, data=None, loader=None, fields=None, index_name='trade_date'):
+        data = dict() if data is None else dict(data)
+        all_fields = sorted(set(fields if fields is not None else []) | set(data.keys()))
+        super(FieldPanel, self).__init__(dates, symbols, all_fields, index_name=index_name)
+        
+        self._arrays = data
+        self._loader = loader
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols), len(self.fields)
+
+    @property
+    def loaded_fields(self):
+        return sorted(self._arrays.keys())
+
+    @property
+    def all_fields(self):
+        return list(self.fields)
+
+    @property
+    def nbytes(self):
+        """Bytes of loaded arrays. Memory-mapped arrays are counted in full though they may not be in RAM."""
+        return sum([arr.nbytes for arr in self._arrays.values()])
+
+    def get_array(self, field):
+        """
+        Get the 2-D array of a field, load it if necessary.
+        
+        Returns
+        -------
+        np.ndarray
+            shape = (n_dates, n_symbols)
+
+        """
+        arr = self._arrays.get(field, None)
+        if arr is None:
+            if field not in self._field_pos or self._loader is None:
+                raise KeyError("field {} does not exist.".format(field))
+            arr = self._loader(field)
+            self._arrays[field] = arr
+        return arr
+
+    def _field_row(self, field, row, idx_symbol):
+        return self.get_array(field)[row, idx_symbol]
+
+    def field_arrays(self, fields=None):
+        """Iterate over (field, 2-D array) pairs of fields (default all fields)."""
+        for field in (self.fields if fields is None else fields):
+            yield field, self.get_array(field)
+
+    # --------------------------------------------------------------------------------------------------------
+    # Conversion
+    @classmethod
+    def from_frame(cls, df, index_name=None, lazy=False):
+        """
+        Build a FieldPanel from a DataFrame with (symbol, field) MultiIndex columns.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index is date, columns is symbol-field MultiIndex
+        index_name : str, optional
+            Default is the name of df.index.
+        lazy : bool, optional
+            If True, a field is copied out of df only when it is first accessed. df must not be modified then.
+
+        Returns
+        -------
+        FieldPanel
+
+        """
+        if index_name is None:
+            index_name = df.index.name if df.index.name else 'trade_date'
+        symbols = np.array(sorted(set(df.columns.get_level_values(0))), dtype=object)
+        fields = sorted(set(df.columns.get_level_values(1)))
+
+        def loader(field):
+            df_field = df.xs(field, axis=1, level=1).reindex(columns=symbols)
+            if all([_is_numeric_dtype(dt) for dt in df_field.dtypes]):
+                return df_field.values
+            else:
+                return df_field.values.astype(object)
+
+        if lazy:
+            return cls(df.index.values, symbols, loader=loader, fields=fields, index_name=index_name)
+        data = {field: loader(field) for field in fields}
+        return cls(df.index.values, symbols, data=data, index_name=index_name)
+
+    def to_frame(self):
+        """
+        Build a DataFrame with (symbol, field) MultiIndex columns. All fields will be loaded.
+
+        Returns
+        -------
+        pd.DataFrame
+
+        """
+        return self.get()
+
+    # --------------------------------------------------------------------------------------------------------
+    # Data access
+    def get_ts(self, field, symbol=None, start_date=0, end_date=0):
+        """
+        Get time series data of single field.
+        The result is a view of the field array when symbol is empty or consecutive.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is int date, column is symbol.
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        arr = self.get_array(field)[sl_date, idx_symbol]
+        return self._new_frame(arr, sl_date, idx_symbol)
+
+    def get_snapshot(self, date, symbol=None, fields=None):
+        """
+        Get snapshot of given fields and symbol at date.
+
+        Returns
+        -------
+        pd.DataFrame
+            symbol as index, field as columns
+
+        """
+        row = self._date_pos[date]
+        idx_symbol = self._symbol_index(symbol)
+        if fields is None or len(fields) == 0:
+            fields = self.fields
+        fields = self.fields[self._field_index(fields)]
+        
+        res = pd.DataFrame({field: self.get_array(field)[row, idx_symbol] for field in fields},
+                           index=self.symbols[idx_symbol], columns=fields)
+        res.index.name = 'symbol'
+        res.columns.name = 'field'
+        return res
+
+    def get(self, symbol=None, start_date=0, end_date=0, fields=None):
+        """
+        Get data of given symbols, date range and fields.
+
+        Returns
+        -------
+        pd.DataFrame
+            index is date, columns are (symbol, fields) MultiIndex
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        fields = self.fields[self._field_index(fields)]
+        symbols = self.symbols[idx_symbol]
+        dates = self.dates[sl_date]
+        
+        arrays = [self.get_array(field)[sl_date, idx_symbol] for field in fields]
+        if arrays and all([_is_numeric_dtype(arr.dtype) for arr in arrays]):
+            # (date, field, symbol) -> (date, symbol, field), in one copy
+            values = np.stack(arrays, axis=2) if len(arrays) > 1 else arrays[0][:, :, np.newaxis]
+            cols = pd.MultiIndex.from_product([symbols, fields], names=['symbol', 'field'])
+            res = pd.DataFrame(values.reshape(len(dates), -1), index=dates, columns=cols)
+        else:
+            dic = {field: pd.DataFrame(arr, index=dates, columns=symbols) for field, arr in zip(fields, arrays)}
+            res = pd.concat(dic, axis=1)
+            res.columns = res.columns.swaplevel()
+            res = res.sort_index(axis=1, level=[0, 1])
+            res.columns.names = ['symbol', 'field']
+        res.index.name = self.index_name
+        return res
+
+    # --------------------------------------------------------------------------------------------------------
+    # Modification
+    def set_field(self, field, df, dtype=None):
+        """
+        Add or overwrite a field. df will be aligned to dates and symbols of the panel.
+        Cost is proportional to the size of one field.
+
+        Parameters
+        ----------
+        field : str
+        df : pd.DataFrame
+            index is date, column is symbol.
+        dtype : np.dtype, optional
+            Convert float data to dtype. Other data are not converted.
+
+        """
+        df = df.reindex(index=self.dates, columns=self.symbols)
+        if all([_is_numeric_dtype(dt) for dt in df.dtypes]):
+            arr = df.values
+            if dtype is not None and arr.dtype.kind == 'f':
+                arr = arr.astype(dtype)
+        else:
+            arr = df.values.astype(object)
+        self._arrays[field] = arr
+        self._insert_field_name(field)
+
+    def append_dates(self, df):
+        """
+        Append data of new dates to the end of the panel. All fields will be loaded into memory.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index is date (must be later than existing dates), columns is symbol-field MultiIndex.
+            Fields not in df are filled with NaN, fields not in the panel are ignored.
+
+        """
+        new_dates, dic_rows = self._new_date_rows(df, self.fields)
+        for field in self.fields:
+            arr = self.get_array(field)
+            rows = dic_rows[field]
+            if arr.dtype == object:
+                rows = rows.astype(object)
+            self._arrays[field] = np.concatenate([arr, rows], axis=0)
+
+        self.dates = np.concatenate([self.dates, new_dates])
+        self._date_pos = {date: i for i, date in enumerate(self.dates)}
+
+    def remove_field(self, field):
+        if field not in self._field_pos:
+            raise KeyError("field {} does not exist.".format(field))
+        self._arrays.pop(field, None)
+        self.fields = np.array([f for f in self.fields if f != field], dtype=object)
+        self._field_pos = {f: i for i, f in enumerate(self.fields)}
+
+    # --------------------------------------------------------------------------------------------------------
+    # I/O
+    @classmethod
+    def load(cls, folder_path, mmap_mode='r'):
+        """
+        Load a panel saved by save_fields. Only index files are read, fields are memory-mapped on first access.
+
+        Parameters
+        ----------
+        folder_path : str
+        mmap_mode : {'r', 'c', None}, optional
+            Default 'r': read-only memory map, so that processes share one copy in page cache.
+
+        Returns
+        -------
+        FieldPanel or None
+            None if folder_path does not exist.
+
+        """
+        if not os.path.isdir(folder_path):
+            return None
+        index_info = jutil.read_json(os.path.join(folder_path, 'index.json'))
+        dates = np.load(os.path.join(folder_path, 'dates.npy'))
+        symbols = np.load(os.path.join(folder_path, 'symbols.npy'))
+        fields = index_info.get('fields', [])
+
+        def loader(field):
+            return load_field_array(os.path.join(folder_path, 'fields', field + '.npy'), mmap_mode=mmap_mode)
+
+        return cls(dates, symbols, loader=loader, fields=fields,
+                   index_name=index_info.get('index_name', 'trade_date'))
+
+
+class FramePanel(BasePanel):
+    """
+    Read-only view of a DataFrame with (symbol, field) MultiIndex columns, e.g. DataView.data_d.
+    Only position maps of dates, symbols and columns are built, values are read from the DataFrame
+    when accessed, so nothing is copied and changes made to the DataFrame in place are seen.
+
+    """
+    def __init__(self, df, index_name=None):
+        if index_name is None:
+            index_name = df.index.name if df.index.name else 'trade_date'
+        symbols = np.array(sorted(set(df.columns.get_level_values(0))), dtype=object)
+        fields = sorted(set(df.columns.get_level_values(1)))
+        super(FramePanel, self).__init__(df.index.values, symbols, fields, index_name=index_name)
+        self.df = df
+
+        # column position of each (field, symbol), -1 if the column does not exist
+        symbol_codes = self.symbols.searchsorted(df.columns.get_level_values(0).values.astype(object))
+        field_codes = np.array([self._field_pos[f] for f in df.columns.get_level_values(1)], dtype=int)
+        self._col_pos = np.full((len(self.fields), len(self.symbols)), -1, dtype=np.int64)
+        self._col_pos[field_codes, symbol_codes] = np.arange(len(df.columns))
+        # dtype of each field, object unless all its columns are numeric
+        dtypes = df.dtypes.values
+        self._dtypes = dict()
+        for field, pos in zip(self.fields, self._col_pos):
+            field_dtypes = list(dtypes[pos[pos >= 0]])
+            numeric = all([_is_numeric_dtype(dt) for dt in field_dtypes])
+            self._dtypes[field] = np.result_type(*field_dtypes) if numeric else np.dtype(object)
+
+    @property
+    def all_fields(self):
+        return list(self.fields)
+
+    def _take(self, values, field, idx_symbol):
+        """Values of field from values of all columns (along the last axis), for symbols at idx_symbol."""
+        pos = self._col_pos[self._field_pos[field]][idx_symbol]
+        missing = pos < 0
+        res = values[..., np.where(missing, 0, pos)]
+        dtype = self._dtypes[field]
+        if missing.any():
+            # missing symbols are NaN, as in a frame reindexed by symbols
+            if dtype.kind in 'biu':
+                dtype = np.dtype(np.float64)
+            res = res.astype(dtype)
+            res[..., missing] = np.nan
+        elif res.dtype != dtype:
+            res = res.astype(dtype)
+        return res
+
+    def _field_row(self, field, row, idx_symbol):
+        return self._take(self.df.iloc[row].values, field, idx_symbol)
+
+    def get_snapshot_arrays(self, date, symbol=None, fields=None):
+        """See BasePanel.get_snapshot_arrays. One row of the DataFrame is read for all fields."""
+        values = self.df.iloc[self._date_pos[date]].values
+        idx_symbol = self._symbol_index(symbol)
+        if fields is None or len(fields) == 0:
+            fields = self.all_fields
+
+        res = OrderedDict()
+        res['symbol'] = self.symbols[idx_symbol]
+        for field in fields:
+            if field not in self._field_pos:
+                raise KeyError("field {} does not exist.".format(field))
+            res[field] = self._take(values, field, idx_symbol)
+        return res
+
+    def get_array(self, field):
+        """Copy of the 2-D array of a field, shape = (n_dates, n_symbols)."""
+        if field not in self._field_pos:
+            raise KeyError("field {} does not exist.".format(field))
+        pos = self._col_pos[self._field_pos[field]]
+        valid = pos >= 0
+        dtype = self._dtypes[field]
+        if valid.all():
+            return self.df.iloc[:, pos].values.astype(dtype, copy=False)
+        if dtype.kind in 'biu':
+            dtype = np.dtype(np.float64)
+        res = np.full((len(self.dates), len(self.symbols)), np.nan, dtype=dtype)
+        res[:, valid] = self.df.iloc[:, pos[valid]].values
+        return res
+
+    def field_arrays(self, fields=None):
+        """Iterate over (field, 2-D array) pairs of fields (default all fields). One field is copied at a time."""
+        for field in (self.all_fields if fields is None else fields):
+            yield field, self.get_array(field)
+
+
+class ShardedPanel(BasePanel):
+    """
+    Data of DataView partitioned by symbol into shards, for data larger than memory.
+
+    Each shard is a FieldPanel saved by save_fields in a sub-folder, whose fields are memory-mapped on access.
+    Symbols of shards are consecutive parts of the sorted symbols, and all shards share one date index.
+    Queries gather rows or columns of a few fields from shards, modifications are written shard by shard,
+    so at most one shard, or one field of all shards, is in memory at a time.
+
+    Attributes
+    ----------
+    folder_path : str
+    shards : list of FieldPanel
+    fields : np.ndarray
+        Fields of all shards. A field which does not exist in a shard is NaN for symbols of that shard.
+
+    """
+    def __init__(self, folder_path, shards, index_name='trade_date'):
+        if not shards:
+            raise ValueError("At least one shard is required.")
+        dates = shards[0].dates
+        for shard in shards[1:]:
+            if not np.array_equal(shard.dates, dates):
+                raise ValueError("Dates of all shards must be the same.")
+        symbols = np.concatenate([shard.symbols for shard in shards])
+        if np.any(symbols[1:] <= symbols[:-1]):
+            raise ValueError("Symbols of shards must be sorted and unique.")
+        fields = sorted(set().union(*[shard.fields for shard in shards]))
+        super(ShardedPanel, self).__init__(dates, symbols, fields, index_name=index_name)
+
+        self.folder_path = folder_path
+        self.shards = list(shards)
+        self._bounds = np.cumsum([0] + [len(shard.symbols) for shard in shards])
+
+    @property
+    def shape(self):
+        return len(self.dates), len(self.symbols), len(self.fields)
+
+    @property
+    def n_shards(self):
+        return len(self.shards)
+
+    @property
+    def all_fields(self):
+        return list(self.fields)
+
+    def _shard_folder(self, i):
+        return os.path.join(self.folder_path, 'shard_{:05d}'.format(i))
+
+    def _field_path(self, i, field):
+        return os.path.join(self._shard_folder(i), 'fields', field + '.npy')
+
+    # --------------------------------------------------------------------------------------------------------
+    # Conversion
+    @classmethod
+    def from_panels(cls, folder_path, panels, index_name='trade_date'):
+        """
+        Save panels as shards one after another, then build a ShardedPanel on the saved shards.
+
+        Parameters
+        ----------
+        folder_path : str
+        panels : iterable of FieldPanel or DensePanel
+            Symbols of each panel must be later than those of the previous one. It can be a generator,
+            so that each panel can be released after it is saved.
+
+        Returns
+        -------
+        ShardedPanel
+
+        """
+        shards = []
+        for panel in panels:
+            shard_folder = os.path.join(folder_path, 'shard_{:05d}'.format(len(shards)))
+            save_fields(shard_folder, panel)
+            shards.append(FieldPanel.load(shard_folder))
+        return cls(folder_path, shards, index_name=index_name)
+
+    @classmethod
+    def from_frame(cls, folder_path, df, shard_size):
+        """
+        Split a DataFrame with (symbol, field) MultiIndex columns into shards of at most shard_size symbols.
+
+        Returns
+        -------
+        ShardedPanel
+
+        """
+        index_name = df.index.name if df.index.name else 'trade_date'
+        symbols = sorted(set(df.columns.get_level_values(0)))
+
+        def iter_panels():
+            for start in range(0, len(symbols), shard_size):
+                df_shard = df.loc[:, pd.IndexSlice[symbols[start: start + shard_size], :]]
+                yield FieldPanel.from_frame(df_shard, index_name=index_name)
+
+        return cls.from_panels(folder_path, iter_panels(), index_name=index_name)
+
+    @classmethod
+    def from_panel(cls, folder_path, panel, shard_size):
+        """
+        Split a FieldPanel (e.g. a memory-mapped one) into shards of at most shard_size symbols.
+
+        Returns
+        -------
+        ShardedPanel
+
+        """
+        def iter_panels():
+            for start in range(0, len(panel.symbols), shard_size):
+                sl = slice(start, start + shard_size)
+                yield FieldPanel(panel.dates, panel.symbols[sl], fields=panel.all_fields, index_name=panel.index_name,
+                                 loader=lambda field, sl=sl: panel.get_array(field)[:, sl])
+
+        return cls.from_panels(folder_path, iter_panels(), index_name=panel.index_name)
+
+    def to_frame(self):
+        """
+        Build a DataFrame with (symbol, field) MultiIndex columns. All data will be loaded into memory.
+
+        Returns
+        -------
+        pd.DataFrame
+
+        """
+        return self.get()
+
+    # --------------------------------------------------------------------------------------------------------
+    # Data access
+    def _shard_index(self, idx_symbol):
+        """Split index of symbols into [(shard number, index of symbols in the shard)]."""
+        positions = np.arange(len(self.symbols))[idx_symbol]
+        res = []
+        for i in range(len(self.shards)):
+            start, end = np.searchsorted(positions, self._bounds[i: i + 2])
+            if end > start:
+                res.append((i, _to_slice(positions[start: end] - self._bounds[i])))
+        return res
+
+    def _gather(self, field, key_date, idx_symbol):
+        """Values of field at key_date (slice of rows or a row), for symbols at idx_symbol."""
+        if field not in self._field_pos:
+            raise KeyError("field {} does not exist.".format(field))
+        n_rows = np.arange(len(self.dates))[key_date].shape
+        parts = []
+        for i, idx in self._shard_index(idx_symbol):
+            shard = self.shards[i]
+            if field in shard._field_pos:
+                parts.append(shard.get_array(field)[key_date, idx])
+            else:
+                parts.append(np.full(n_rows + (len(shard.symbols[idx]),), np.nan))
+        if not parts:
+            return np.empty(n_rows + (0,))
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts, axis=-1)
+
+    def get_array(self, field):
+        """
+        Get the 2-D array of a field, gathered from all shards.
+
+        Returns
+        -------
+        np.ndarray
+            shape = (n_dates, n_symbols)
+
+        """
+        return self._gather(field, slice(None), slice(None))
+
+    def _field_row(self, field, row, idx_symbol):
+        return self._gather(field, row, idx_symbol)
+
+    def field_arrays(self, fields=None):
+        """Iterate over (field, 2-D array) pairs of fields (default all fields). One field is gathered at a time."""
+        for field in (self.fields if fields is None else fields):
+            yield field, self.get_array(field)
+
+    def get_ts(self, field, symbol=None, start_date=0, end_date=0):
+        """
+        Get time series data of single field.
+        The result is a view of a shard when symbols are consecutive in one shard.
+
+        Returns
+        -------
+        pd.DataFrame
+            Index is int date, column is symbol.
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        return self._new_frame(self._gather(field, sl_date, idx_symbol), sl_date, idx_symbol)
+
+    def get_snapshot(self, date, symbol=None, fields=None):
+        """
+        Get snapshot of given fields and symbol at date.
+
+        Returns
+        -------
+        pd.DataFrame
+            symbol as index, field as columns
+
+        """
+        dic = self.get_snapshot_arrays(date, symbol=symbol, fields=self.fields[self._field_index(fields)])
+        symbols = dic.pop('symbol')
+        res = pd.DataFrame(dic, index=symbols, columns=list(dic.keys()))
+        res.index.name = 'symbol'
+        res.columns.name = 'field'
+        return res
+
+    def get(self, symbol=None, start_date=0, end_date=0, fields=None):
+        """
+        Get data of given symbols, date range and fields. All of them will be loaded into memory.
+
+        Returns
+        -------
+        pd.DataFrame
+            index is date, columns are (symbol, fields) MultiIndex
+
+        """
+        sl_date = self._date_slice(start_date, end_date)
+        idx_symbol = self._symbol_index(symbol)
+        fields = self.fields[self._field_index(fields)]
+        data = {field: self._gather(field, sl_date, idx_symbol) for field in fields}
+        panel = FieldPanel(self.dates[sl_date], self.symbols[idx_symbol], data=data, index_name=self.index_name)
+        return panel.get()
+
+    # --------------------------------------------------------------------------------------------------------
+    # Modification
+    def set_shard_field(self, i, field, arr):
+        """
+        Add or overwrite a field of shard i.
+
+        Parameters
+        ----------
+        i : int
+        field : str
+        arr : np.ndarray
+            shape = (n_dates, number of symbols of the shard)
+
+        """
+        shard = self.shards[i]
+        if arr.shape != (len(self.dates), len(shard.symbols)):
+            raise ValueError("Shape of array {} does not match shard {:d}.".format(arr.shape, i))
+        shard._arrays.pop(field, None)  # release memory map of the old file
+        save_field_array(self._field_path(i, field), arr)
+        shard._insert_field_name(field)
+        save_index(self._shard_folder(i), shard)
+        self._insert_field_name(field)
+
+    def set_field(self, field, df):
+        """
+        Add or overwrite a field. df will be aligned to dates and symbols of the panel.
+
+        Parameters
+        ----------
+        field : str
+        df : pd.DataFrame
+            index is date, column is symbol.
+
+        """
+        df = df.reindex(index=self.dates)
+        for i, shard in enumerate(self.shards):
+            df_shard = df.reindex(columns=shard.symbols)
+            if all([_is_numeric_dtype(dt) for dt in df_shard.dtypes]):
+                arr = df_shard.values
+            else:
+                arr = df_shard.values.astype(object)
+            self.set_shard_field(i, field, arr)
+
+    def write_rows(self, field, blocks, dtype=np.float64):
+        """
+        Add or overwrite a numeric field block by block of dates, e.g. results of cross section calculation.
+        Each block is split by shard into memory-mapped files, so that the field is transposed into shards
+        without being held in memory as a whole. Rows not in any block are NaN.
+
+        Parameters
+        ----------
+        field : str
+        blocks : iterable of (slice, np.ndarray)
+            Rows of dates and values of these rows for all symbols, shape = (number of rows, n_symbols).
+        dtype : np.dtype
+
+        """
+        arrays = []
+        for i, shard in enumerate(self.shards):
+            fp_tmp = self._field_path(i, field) + '.tmp'
+            jutil.create_dir(fp_tmp)
+            arr = np.lib.format.open_memmap(fp_tmp, mode='w+', dtype=dtype,
+                                            shape=(len(self.dates), len(shard.symbols)))
+            arr[:] = np.nan
+            arrays.append(arr)
+
+        for sl_date, values in blocks:
+            for i, arr in enumerate(arrays):
+                arr[sl_date] = values[:, self._bounds[i]: self._bounds[i + 1]]
+
+        for arr in arrays:
+            arr.flush()
+        # close memory maps before the files are renamed
+        arr, arrays = None, None
+
+        for i, shard in enumerate(self.shards):
+            shard._arrays.pop(field, None)
+            fp = self._field_path(i, field)
+            jutil.replace_file(fp + '.tmp', fp)
+            shard._insert_field_name(field)
+            save_index(self._shard_folder(i), shard)
+        self._insert_field_name(field)
+
+    def append_dates(self, df):
+        """
+        Append data of new dates to the end of the panel. Shards are loaded, extended and saved one by one.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            index is date (must be later than existing dates), columns is symbol-field MultiIndex.
+            Fields not in df are filled with NaN, fields not in the panel are ignored.
+
+        """
+        for i, shard in enumerate(self.shards):
+            shard.append_dates(df)
+            save_fields(self._shard_folder(i), shard)
+            self.shards[i] = FieldPanel.load(self._shard_folder(i))
+
+        self.dates = self.shards[0].dates
+        self._date_pos = {date: i for i, date in enumerate(self.dates)}
+
+    def remove_field(self, field):
+        if field not in self._field_pos:
+            raise KeyError("field {} does not exist.".format(field))
+        for i, shard in enumerate(self.shards):
+            if field in shard._field_pos:
+                shard.remove_field(field)
+                save_index(self._shard_folder(i), shard)
+                os.remove(self._field_path(i, field))
+        self.fields = np.array([f for f in self.fields if f != field], dtype=object)
+        self._field_pos = {f: i for i, f in enumerate(self.fields)}
+
+    def release(self):
+        """Drop arrays loaded from shards. Fields of objects are loaded in memory, not memory-mapped."""
+        for shard in self.shards:
+            shard._arrays.clear()
+
+
+def load_field_array(fp, mmap_mode='r'):
+    """
+    Load array of one field. Fields of objects (e.g. strings) are pickled, they are loaded in memory
+    and not memory-mapped.
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    with open(fp, 'rb') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            _, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            _, _, dtype = np.lib.format.read_array_header_2_0(f)
+    if dtype.hasobject:
+        return np.load(fp, allow_pickle=True)
+    
+    arr = np.load(fp, mmap_mode=mmap_mode)
+    if arr.dtype.kind == 'U':
+        # saved by old versions, which stored strings as fixed-width unicode
+        arr = np.array(arr, dtype=object)
+        arr[arr == ''] = np.nan
+    return arr
+
+
+def _object_repr(x):
+    return u'{}:{!r}'.format(type(x).__name__, x)
+
+
+def hash_array(arr):
+    """
+    SHA1 of the content of an array, including dtype and shape.
+    Objects are hashed by their types and reprs.
+
+    Returns
+    -------
+    str
+
+    """
+    arr = np.ascontiguousarray(arr)
+    sha1 = hashlib.sha1()
+    sha1.update('{}{}'.format(arr.dtype.str, arr.shape).encode('utf-8'))
+    if arr.dtype.hasobject:
+        for s in np.frompyfunc(_object_repr, 1, 1)(arr.ravel()):
+            sha1.update(s.encode('utf-8'))
+            sha1.update(b'\0')
+    else:
+        sha1.update(arr.view(np.uint8).ravel() if arr.size else b'')
+    return sha1.hexdigest()
+
+
+def hash_index(panel):
+    """SHA1 of dates and symbols of a panel."""
+    sha1 = hashlib.sha1()
+    sha1.update(hash_array(np.asarray(panel.dates, dtype=np.int64)).encode('utf-8'))
+    sha1.update(hash_array(np.asarray(panel.symbols, dtype=object)).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def save_field_array(fp, arr):
+    """
+    Save array of one field to a .npy file which can be memory-mapped.
+    Arrays of objects are pickled as they are, so that missing values and types of objects are kept.
+
+    """
+    jutil.create_dir(fp)
+    fp_tmp = fp + '.tmp'
+    with open(fp_tmp, 'wb') as f:
+        np.save(f, np.ascontiguousarray(arr), allow_pickle=True)
+    jutil.replace_file(fp_tmp, fp)
+
+
+def save_fields(folder_path, panel, skip=None):
+    """
+    Save a panel to a folder: one uncompressed .npy file for each field, and index files for dates and symbols.
+    Files of fields no longer in the panel are removed.
+    
+    Parameters
+    ----------
+    folder_path : str
+    panel : DensePanel or FieldPanel or ShardedPanel
+    skip : set, optional
+        Fields whose files in folder_path are up to date. They are not written again if their files exist.
+
+    """
+    jutil.create_dir(os.path.join(folder_path, 'index.json'))
+    fields = list(panel.all_fields)
+    field_folder = os.path.join(folder_path, 'fields')
+    if skip:
+        to_save = [field for field in fields
+                   if not (field in skip and os.path.exists(os.path.join(field_folder, field + '.npy')))]
+    else:
+        to_save = fields
+    for field, arr in panel.field_arrays(to_save):
+        save_field_array(os.path.join(field_folder, field + '.npy'), arr)
+    save_index(folder_path, panel, fields)
+    
+    existing = set(fields)
+    for fn in os.listdir(field_folder):
+        if fn.endswith('.npy') and fn[:-len('.npy')] not in existing:
+            os.remove(os.path.join(field_folder, fn))
+
+
+def save_index(folder_path, panel, fields=None):
+    """Save dates, symbols and field names of a panel saved by save_fields. Default fields are panel.fields."""
+    if fields is None:
+        fields = list(panel.fields)
+    jutil.create_dir(os.path.join(folder_path, 'index.json'))
+    np.save(os.path.join(folder_path, 'dates.npy'), np.asarray(panel.dates, dtype=np.int64))
+    np.save(os.path.join(folder_path, 'symbols.npy'), np.asarray(panel.symbols, dtype='U'))
+    jutil.save_json({'fields': fields, 'index_name': panel.index_name},
+                    os.path.join(folder_path, 'index.json'))
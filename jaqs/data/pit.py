@@ -0,0 +1,236 @@
+# encoding: utf-8
+"""
+Point-in-time store of financial statement data.
+
+A statement of one report_date may be announced several times: the original one and restated ones.
+The store keeps all of them, keyed by (symbol, report_date, ann_date), so that values can be looked up
+as they were known at any date, without look-ahead.
+
+"""
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+
+def _compact_date(date):
+    """Map int date (%Y%m%d) to a smaller int keeping order, so that two dates fit in one int64 key."""
+    date = np.asarray(date, dtype=np.int64)
+    return (date // 10000) * 372 + (date // 100 % 100) * 31 + date % 100
+
+
+class PointInTimeStore(object):
+    """
+    Bitemporal store of quarterly data.
+
+    Records are sorted by (symbol, ann_date, report_date). For each record, the store remembers which record
+    is "current" once it is announced: the latest revision of the latest report_date announced so far.
+    Therefore both single lookups and expansion to daily frequency are binary searches on announcement dates.
+
+    Attributes
+    ----------
+    fields : list of str
+        Value fields, not including symbol, report_date and ann_date.
+
+    Examples
+    --------
+    store = PointInTimeStore()
+    store.add(df_income)  # columns: symbol, report_date, ann_date, oper_rev, ...
+    store.get('600030.SH', 20161231, 20170410, 'oper_rev')  # oper_rev of report 20161231 known at 20170410
+    dic = store.expand(dates, ['oper_rev'], symbols)  # {'oper_rev': DataFrame of dates x symbols}
+
+    """
+    SYMBOL = 'symbol'
+    REPORT_DATE = 'report_date'
+    ANN_DATE = 'ann_date'
+    # upper bound of compact dates
+    _M = 10 ** 6
+
+    def __init__(self):
+        self._df = None
+        self._symbols = np.array([], dtype=object)
+        # index by announcement: sorted keys and the current record after each announcement
+        self._key_ann = np.array([], dtype=np.int64)
+        self._code = np.array([], dtype=np.int64)
+        self._cur_row = np.array([], dtype=np.int64)
+        # index by report: sorted keys and record number
+        self._key_report = np.array([], dtype=np.int64)
+        self._row_report = np.array([], dtype=np.int64)
+
+    def __len__(self):
+        return 0 if self._df is None else len(self._df)
+
+    @property
+    def fields(self):
+        if self._df is None:
+            return []
+        keys = {self.SYMBOL, self.REPORT_DATE, self.ANN_DATE}
+        return [col for col in self._df.columns if col not in keys]
+
+    @property
+    def symbols(self):
+        return list(self._symbols)
+
+    def add(self, df):
+        """
+        Add records. A record with the same (symbol, report_date, ann_date) as an existing one updates it:
+        new non-NaN values take precedence, and new fields are added.
+        Records without ann_date are dropped since we never know when they are available.
+
+        Parameters
+        ----------
+        df : pd.DataFrame
+            Must have columns symbol, report_date and ann_date.
+
+        """
+        keys = [self.SYMBOL, self.REPORT_DATE, self.ANN_DATE]
+        for col in keys:
+            if col not in df.columns:
+                raise ValueError("Column [{:s}] is required.".format(col))
+
+        df = df.dropna(subset=[self.ANN_DATE, self.REPORT_DATE])
+        df = df.astype(dtype={self.REPORT_DATE: np.int64, self.ANN_DATE: np.int64})
+        df = df.drop_duplicates(subset=keys, keep='last').set_index(keys)
+        if self._df is not None:
+            df = df.combine_first(self._df.set_index(keys))
+        df = df.reset_index()
+
+        df = df.sort_values(by=[self.SYMBOL, self.ANN_DATE, self.REPORT_DATE], axis=0, kind='mergesort')
+        self._df = df.reset_index(drop=True)
+        self._build_index()
+
+    def _build_index(self):
+        df = self._df
+        self._symbols, code = np.unique(df[self.SYMBOL].values.astype(str), return_inverse=True)
+        code = code.astype(np.int64)
+        ann = _compact_date(df[self.ANN_DATE].values)
+        report = _compact_date(df[self.REPORT_DATE].values)
+
+        # keys of different symbols do not overlap, so running max stays inside each symbol
+        self._code = code
+        self._key_ann = code * self._M + ann
+        key_report_sym = code * self._M + report
+        is_current = key_report_sym == np.maximum.accumulate(key_report_sym)
+        self._cur_row = np.maximum.accumulate(np.where(is_current, np.arange(len(df)), -1))
+
+        key_report = key_report_sym * self._M + ann
+        self._row_report = np.argsort(key_report, kind='mergesort')
+        self._key_report = key_report[self._row_report]
+
+    def _symbol_code(self, symbol):
+        symbol = np.asarray(symbol, dtype=str)
+        code = np.searchsorted(self._symbols, symbol)
+        code = np.minimum(code, max(len(self._symbols) - 1, 0))
+        found = (self._symbols[code] == symbol) if len(self._symbols) else np.zeros(symbol.shape, dtype=bool)
+        return code.astype(np.int64), found
+
+    def _select(self, rows, fields):
+        if rows < 0:
+            return pd.Series(index=fields, data=np.nan) if isinstance(fields, list) else np.nan
+        return self._df.loc[rows, fields]
+
+    def get(self, symbol, report_date, date, fields=None):
+        """
+        Get values of a report as they were known at date, i.e. its latest revision announced no later than date.
+
+        Parameters
+        ----------
+        symbol : str
+        report_date : int
+        date : int
+        fields : str or list of str, optional
+            Default all fields.
+
+        Returns
+        -------
+        value or pd.Series
+            NaN if the report has not been announced at date.
+
+        """
+        if fields is None:
+            fields = self.fields
+        row = -1
+        if len(self):
+            code, found = self._symbol_code(symbol)
+            if found:
+                prefix = int(code) * self._M + int(_compact_date(report_date))
+                pos = np.searchsorted(self._key_report, prefix * self._M + int(_compact_date(date)), side='right') - 1
+                if pos >= 0 and self._key_report[pos] // self._M == prefix:
+                    row = self._row_report[pos]
+        return self._select(row, fields)
+
+    def get_latest(self, symbol, date, fields=None):
+        """
+        Get the latest report known at date, with its latest revision.
+
+        Parameters
+        ----------
+        symbol : str
+        date : int
+        fields : str or list of str, optional
+            Default all fields and report_date, ann_date.
+
+        Returns
+        -------
+        value or pd.Series
+
+        """
+        if fields is None:
+            fields = [self.REPORT_DATE, self.ANN_DATE] + self.fields
+        row = self._current_rows(np.array([date]), [symbol])[0, 0]
+        return self._select(row, fields)
+
+    def _current_rows(self, dates, symbols):
+        """Record numbers known at each (date, symbol), -1 if nothing is announced. shape = (n_dates, n_symbols)"""
+        dates = np.asarray(dates, dtype=np.int64)
+        if not len(self):
+            return np.full((len(dates), len(symbols)), -1, dtype=np.int64)
+
+        code, found = self._symbol_code(symbols)
+        queries = code.reshape(1, -1) * self._M + _compact_date(dates).reshape(-1, 1)
+        pos = np.searchsorted(self._key_ann, queries, side='right') - 1
+        pos_clip = np.maximum(pos, 0)
+        valid = (pos >= 0) & (self._code[pos_clip] == code.reshape(1, -1)) & found.reshape(1, -1)
+        return np.where(valid, self._cur_row[pos_clip], -1)
+
+    def expand(self, dates, fields=None, symbols=None):
+        """
+        Expand fields to daily frequency. At each date, value of the latest report known at that date is used,
+        and a restatement takes effect from its own ann_date on, so no value is known before it is announced.
+        Only announcements are walked through, so extending to new dates does not need to re-align old dates.
+
+        Parameters
+        ----------
+        dates : array-like of int
+        fields : list of str, optional
+            Default all fields.
+        symbols : list of str, optional
+            Default all symbols in the store.
+
+        Returns
+        -------
+        dict
+            {field: pd.DataFrame}, index is dates, columns is symbols.
+
+        """
+        if fields is None:
+            fields = self.fields
+        if symbols is None:
+            symbols = self.symbols
+        dates = np.asarray(dates, dtype=np.int64)
+
+        rows = self._current_rows(dates, symbols)
+        missing = rows < 0
+        rows = np.where(missing, 0, rows)
+
+        res = dict()
+        for field in fields:
+            if len(self) and field in self._df.columns:
+                values = self._df[field].values[rows]
+                if missing.any():
+                    if values.dtype.kind in 'biu':
+                        values = values.astype(float)
+                    values[missing] = np.nan
+            else:
+                values = np.full(rows.shape, np.nan)
+            res[field] = pd.DataFrame(index=dates, columns=symbols, data=values)
+        return res
@@ -23,6 +23,8 @@ import pandas as pd
 
 from jaqs.data.align import align
 import jaqs.util.numeric as numeric
+import jaqs.util.rolling as rolling
+import jaqs.util.grouped as grouped
 
 TNUMBER = 0
 TOP1 = 1
@@ -283,6 +285,8 @@ class Parser(object):
             'GroupRank': self.group_rank,
             'ConditionRank': self.cond_rank,
             'Standardize': self.standardize,
+            'GroupStandardize': self.group_standardize,
+            'IndustryNeutral': self.industry_neutral,
             'Cutoff': self.cutoff,
             # 'GroupApply': self.group_apply,
             # time series
@@ -315,7 +319,56 @@ class Parser(object):
             'If': self.ifFunction,
             # test
         }
-        
+
+        # number of previous rows each function needs, used to evaluate an expression on part of the data.
+        # {name: (position of window argument, offset added to window, default window)}
+        # position None means the function needs no previous rows.
+        # Functions not listed here (like Ewma) depend on the whole history.
+        self.function_lookback = {
+            'Min': (None, 0, None),
+            'Max': (None, 0, None),
+            'Rank': (None, 0, None),
+            'Quantile': (None, 0, None),
+            'GroupQuantile': (None, 0, None),
+            'GroupRank': (None, 0, None),
+            'ConditionRank': (None, 0, None),
+            'Standardize': (None, 0, None),
+            'GroupStandardize': (None, 0, None),
+            'IndustryNeutral': (None, 0, None),
+            'Cutoff': (None, 0, None),
+            'Tail': (None, 0, None),
+            'Pow': (None, 0, None),
+            'SignedPower': (None, 0, None),
+            'If': (None, 0, None),
+            'Ts_Quantile': (1, -1, 3),
+            'Ts_Rank': (1, -1, None),
+            'Sum': (1, -1, None),
+            'Product': (1, -1, None),
+            'CountNans': (1, -1, None),
+            'StdDev': (1, -1, None),
+            'Covariance': (2, -1, None),
+            'Correlation': (2, -1, None),
+            'Corr': (2, -1, None),
+            'Delay': (1, 0, None),
+            'Delta': (1, 0, None),
+            'Return': (1, 0, 1),
+            'Ts_Mean': (1, -1, None),
+            'Ts_Min': (1, -1, None),
+            'Ts_Max': (1, -1, None),
+            'Ts_Skewness': (1, -1, None),
+            'Ts_Kurtosis': (1, -1, None),
+            'Decay_linear': (1, -1, None),
+            'Decay_exp': (2, -1, None),
+        }
+
+        # how functions can be evaluated on part of the data, see split_stages.
+        # cross section functions work on each date independently, element-wise functions on each value.
+        # Other built-in functions are time series functions, which work on each symbol independently.
+        self.cross_section_functions = {'Rank', 'Quantile', 'GroupQuantile', 'GroupRank', 'ConditionRank',
+                                        'Standardize', 'GroupStandardize', 'IndustryNeutral', 'Cutoff'}
+        self.elementwise_functions = {'Min', 'Max', 'Pow', 'SignedPower', 'If', 'Tail'}
+        self._builtin_functions = set(self.functions.keys())
+
         self.consts = {
             'E': math.e,
             'PI': math.pi,
@@ -519,22 +572,34 @@ class Parser(object):
         r = df.ewm(com=a, axis=0)
         return r.mean()
     
-    def corr(self, x, y, n):
+    @staticmethod
+    def _rolling(kernel, df, *args, **kwargs):
+        """Apply a kernel of jaqs.util.rolling to values of df, along dates."""
+        res = kernel(df.values, *args, **kwargs)
+        if isinstance(df, pd.Series):
+            return pd.Series(res, index=df.index, name=df.name)
+        return pd.DataFrame(res, index=df.index, columns=df.columns)
+
+    def _rolling_bivariate(self, kernel, x, y, n):
         (x, y) = self._align_bivariate(x, y)
-        return pd.rolling_corr(x, y, n)
+        if not (x.index.equals(y.index) and x.columns.equals(y.columns)):
+            x, y = x.align(y)
+        return pd.DataFrame(kernel(x.values, y.values, n), index=x.index, columns=x.columns)
+
+    def corr(self, x, y, n):
+        return self._rolling_bivariate(rolling.rolling_corr, x, y, n)
     
     def cov(self, x, y, n):
-        (x, y) = self._align_bivariate(x, y)
-        return pd.rolling_cov(x, y, n)
+        return self._rolling_bivariate(rolling.rolling_cov, x, y, n)
     
     def std_dev(self, x, n):
-        return pd.rolling_std(x, n)
+        return self._rolling(rolling.rolling_std, x, n)
     
     def sum(self, x, n):
-        return pd.rolling_sum(x, n)
+        return self._rolling(rolling.rolling_sum, x, n)
     
     def count_nans(self, x, n):
-        return n - pd.rolling_count(x, n)
+        return n - self._rolling(rolling.rolling_count, x, n)
     
     def delay(self, x, n):
         return x.shift(n)
@@ -552,35 +617,31 @@ class Parser(object):
         return res
     
     def ts_mean(self, x, n):
-        return pd.rolling_mean(x, n)
+        return self._rolling(rolling.rolling_mean, x, n)
     
     def ts_min(self, x, n):
-        return pd.rolling_min(x, n)
+        return self._rolling(rolling.rolling_min, x, n)
     
     def ts_max(self, x, n):
-        return pd.rolling_max(x, n)
+        return self._rolling(rolling.rolling_max, x, n)
     
     def ts_kurt(self, x, n):
-        return pd.rolling_kurt(x, n)
+        return self._rolling(rolling.rolling_kurt, x, n)
     
     def ts_skew(self, x, n):
-        return pd.rolling_skew(x, n)
+        return self._rolling(rolling.rolling_skew, x, n)
     
     def product(self, x, n):
-        return pd.rolling_apply(x, n, np.product)
+        return self._rolling(rolling.rolling_product, x, n)
 
     @staticmethod
     def ts_rank(df, window):
-        """Return a DataFrame with values ranging from 0.0 to 1.0"""
-        roll = df.rolling(window=window)
-    
-        def _rank_arr(arr, norm=1.0):
-            norm = norm * 1.0
-            ranks = np.argsort(np.argsort(arr))[-1] + 1
-            return ranks / norm
-    
-        res = roll.apply(_rank_arr, kwargs={'norm': window})
-        return res
+        """
+        Return a DataFrame with values ranging from 0.0 to 1.0.
+        The latest value is ranked after equal values earlier in the window.
+
+        """
+        return Parser._rolling(rolling.rolling_rank, df, window, method='max')
 
     def step(self, x, n):
         st = x.copy()
@@ -590,23 +651,11 @@ class Parser(object):
             st.loc[:, col] = range(begin, n, 1)
         return st
     
-    def decay_exp_array(self, x, f):
-        n = len(x)
-        step = range(0, n)
-        step = step[::-1]
-        fs = np.power(f, step)
-        return np.dot(x, fs) / np.sum(fs)
-    
-    def decay_linear_array(self, x):
-        n = len(x) + 1
-        step = range(1, n)
-        return np.dot(x, step) / np.sum(step)
-    
     def decay_linear(self, x, n):
-        return pd.rolling_apply(x, n, self.decay_linear_array)
+        return self._rolling(rolling.rolling_decay_linear, x, n)
     
     def decay_exp(self, x, f, n):
-        return pd.rolling_apply(x, n, self.decay_exp_array, args=[f])
+        return self._rolling(rolling.rolling_decay_exp, x, f, n)
     
     def signed_power(self, x, e):
         signs = np.sign(x)
@@ -622,30 +671,43 @@ class Parser(object):
     # -----------------------------------------------------
     # cross section functions
     def _mask_non_index_member(self, df):
+        # do not modify df in place: it may be a view of data stored in DataView
         if self.index_member is not None:
-            self.index_member = self.index_member.astype(bool)
-            df[~self.index_member] = np.nan
+            mask = self.index_member.reindex(index=df.index, columns=df.columns).fillna(1).astype(bool)
+            df = df.where(mask)
         return df
 
     def rank(self, df):
         """Return a DataFrame with values ranging from 0.0 to 1.0"""
         df = self._align_univariate(df)
         df = self._mask_non_index_member(df)
-        return df.rank(axis=1).div((df.shape[1] - df.isnull().sum(axis=1)), axis=0)
+        return pd.DataFrame(index=df.index, columns=df.columns, data=numeric.rank_without_nan(df.values, pct=True))
 
-    # TODO: all cross-section operations support in-group modification: neutral, extreme values, standardize.
-    def group_rank(self, x, group):
+    def _group_segments(self, x, group):
+        """Segments of (date, group) of group aligned to x, see jaqs.util.grouped.GroupSegments."""
+        if isinstance(group, pd.DataFrame):
+            group = self._align_univariate(group)
+            if not (group.index.equals(x.index) and group.columns.equals(x.columns)):
+                group = group.reindex(index=x.index, columns=x.columns)
+            codes = grouped.group_codes(group)
+        elif isinstance(group, pd.Series):
+            # the same group of each symbol on all dates
+            codes = grouped.group_codes(group.reindex(x.columns), shape=x.shape)
+        else:
+            raise NotImplementedError("type of group {}".format(type(group)))
+        return grouped.GroupSegments(codes)
+
+    def _group_apply(self, kernel, x, group, *args):
+        """Apply a kernel of GroupSegments to x within group on each date."""
         x = self._align_univariate(x)
         x = self._mask_non_index_member(x)
-        vals = np.unique(group.values.flatten())
-        res = None
-        for val in vals:
-            rank = x[group == val].rank(axis=1, na_option='keep')
-            if res is None:
-                res = rank
-            else:
-                res = res.fillna(rank)
-        return res
+        segments = self._group_segments(x, group)
+        res = getattr(segments, kernel)(x.values, *args)
+        return pd.DataFrame(index=x.index, columns=x.columns, data=res)
+
+    def group_rank(self, x, group):
+        """Rank (from 1) of x in its group on each date. Equal values get their average rank."""
+        return self._group_apply('rank', x, group)
     
     def ts_quantile(self, df, window=3, n_quantiles=5):
         roll = df.rolling(window=window)
@@ -654,7 +716,7 @@ class Parser(object):
         res = roll.apply(func)
         return res
     
-    def to_quantile(self, df, n_quantiles=5, axis=1):
+    def to_quantile(self, df, n_quantiles=5, axis=1, ties='order'):
         """
         Convert cross-section values to the quantile number they belong.
         Small values get small quantile numbers.
@@ -667,6 +729,9 @@ class Parser(object):
             The number of quantile to be divided to.
         axis : int
             Axis to apply quantilize.
+        ties : {'order', 'first'}
+            'order' (default): equal values may get different quantile numbers, every number is used.
+            'first': equal values get the quantile number of the first of them.
 
         Returns
         -------
@@ -676,25 +741,13 @@ class Parser(object):
         """
         df = self._align_univariate(df)
         df = self._mask_non_index_member(df)
-        # TODO: unnecesssary warnings
-        # import warnings
-        # warnings.filterwarnings(action='ignore', category=RuntimeWarning, module='py_exp')
-        res_arr = numeric.quantilize_without_nan(df.values, n_quantiles=n_quantiles, axis=axis)
+        res_arr = numeric.quantilize_fast(df.values, n_quantiles=n_quantiles, axis=axis, ties=ties)
         res = pd.DataFrame(index=df.index, columns=df.columns, data=res_arr)
         return res
 
     def group_quantile(self, df, group, n_quantiles=5):
-        df = self._align_univariate(df)
-        df = self._mask_non_index_member(df)
-        
-        res = None
-        for val in np.unique(group.values.flatten()):
-            val_res = self.to_quantile(df[group == val], n_quantiles=n_quantiles)
-            if res is None:
-                res = val_res
-            else:
-                res = res.fillna(val_res)
-        return res
+        """Quantile number of x in its group on each date, the same as to_quantile applied to each group."""
+        return self._group_apply('quantile', df, group, n_quantiles)
 
     '''
         def group_apply(self, func, df_arg, *args, **kwargs):
@@ -777,7 +830,7 @@ class Parser(object):
         df = self._mask_non_index_member(df)
 
         axis = 1
-        x = df.values
+        x = df.values.copy()
         
         median = np.nanmedian(x, axis=axis).reshape(-1, 1)
         diff = x - median
@@ -790,8 +843,45 @@ class Parser(object):
         
         return pd.DataFrame(index=df.index, columns=df.columns, data=x)
     
-    def industry_netural(self, x, group):
-        pass
+    def group_standardize(self, df, group):
+        """Standardize x in its group on each date."""
+        return self._group_apply('zscore', df, group)
+
+    def industry_neutral(self, x, group, exposure=None):
+        """
+        Neutralize x against industry (group), and optionally against an exposure like log market value.
+        The result is the residual of regressing x on industry dummies (and exposure) on each date.
+        
+        Parameters
+        ----------
+        x : pd.DataFrame
+        group : pd.DataFrame or pd.Series
+            Industry of symbols, index is date, column is symbol.
+        exposure : pd.DataFrame, optional
+
+        Returns
+        -------
+        pd.DataFrame
+
+        """
+        if exposure is None:
+            return self._group_apply('demean', x, group)
+        
+        x, exposure = self._align_bivariate(x, exposure)
+        x = self._align_univariate(x)
+        x = self._mask_non_index_member(x)
+        exposure = exposure.reindex(index=x.index, columns=x.columns)
+        valid = ~(x.isnull().values | exposure.isnull().values)
+        
+        # Frisch-Waugh: demean both in industries, then regress on each date with one slope
+        segments = self._group_segments(x, group)
+        y_demeaned = segments.demean(np.where(valid, x.values, np.nan))
+        e_demeaned = segments.demean(np.where(valid, exposure.values, np.nan))
+        by_date = grouped.GroupSegments(np.zeros(x.shape, dtype=np.int64))
+        res = by_date.residual(y_demeaned, e_demeaned)
+        return pd.DataFrame(index=x.index, columns=x.columns, data=res)
+    
+    industry_netural = industry_neutral
     
     # -----------------------------------------------------
     # align functions
@@ -1008,10 +1098,12 @@ class Parser(object):
         self.tokens = tokenstack
         return Expression(tokenstack, self.ops1, self.ops2, self.functions)
     
-    def evaluate(self, values, ann_dts=None, trade_dts=None, index_member=None):
+    def evaluate(self, values, ann_dts=None, trade_dts=None, index_member=None, tokens=None,
+                 start_date=None, chunk_size=None, profiler=None, n_threads=1):
         """
         Evaluate the value of expression using. Data of different frequency will be automatically expanded.
-        
+        Sub-expressions which appear more than once are evaluated only once, see ExprGraph.
+
         Parameters
         ----------
         values : dict
@@ -1021,55 +1113,152 @@ class Parser(object):
         trade_dts : np.ndarray
             The date index of result.
         index_member : pd.DataFrame
+        tokens : list of Token, optional
+            Evaluate these tokens (e.g. tokens of a stage returned by split_stages)
+            instead of the last parsed expression.
+        start_date : int, optional
+            Only evaluate the result since start_date: variables indexed by trade dates are sliced to
+            start_date minus lookback rows (see lookback). Earlier dates are not in the result.
+        chunk_size : int, optional
+            Evaluate chunk_size rows at a time, each block with lookback previous rows, to limit memory use.
+        profiler : ExprProfiler, optional
+            Records time, size and NaN ratio of each sub-expression, see jaqs.data.expr_graph.ExprProfiler.
+        n_threads : int, optional
+            Number of threads evaluating independent sub-expressions at the same time. Default 1.
 
         Returns
         -------
         pd.DataFrame
 
         """
-        self.ann_dts = ann_dts
-        self.trade_dts = trade_dts
-        self.index_member = index_member
+        from jaqs.data.expr_graph import ExprGraph
         
-        values = values or {}
+        if tokens is None:
+            tokens = self.tokens
+        graph = ExprGraph(self)
+        graph.add('result', tokens)
+        dic = graph.evaluate(values, ann_dts=ann_dts, trade_dts=trade_dts, index_member=index_member,
+                             start_date=start_date, chunk_size=chunk_size, profiler=profiler, n_threads=n_threads)
+        return dic['result']
+
+    def lookback(self, tokens=None):
+        """
+        Number of previous rows needed to evaluate the last parsed expression exactly on later rows.
+        Windows of nested time series functions are added up, e.g. 'Delta(Ts_Mean(close, 5), 2)' needs 6 rows.
+
+        Parameters
+        ----------
+        tokens : list of Token, optional
+            Analyse these tokens instead of the last parsed expression.
+
+        Returns
+        -------
+        int or None
+            None if the result depends on the whole history (e.g. Ewma, or functions with unknown window).
+
+        """
+        from jaqs.data.expr_graph import ExprGraph
+        
+        graph = ExprGraph(self)
+        graph.add('result', self.tokens if tokens is None else tokens)
+        return graph.lookback()
+
+    def split_stages(self, prefix='_stage'):
+        """
+        Split the last parsed expression into stages, each of which can be evaluated on part of the data:
+        by symbol (time series functions), by date (cross section functions), or both (element-wise operations).
+        A sub-expression which can not be evaluated the same way as the function it is passed to is cut out
+        as an earlier stage and referred to by a variable named prefix + number,
+        e.g. 'Rank(Delta(close, 1))' is split into '_stage0 = Delta(close, 1)' by symbol, then 'Rank(_stage0)' by date.
+        Registered (non built-in) functions are assumed to need all data.
+
+        Parameters
+        ----------
+        prefix : str
+            Prefix of variable names of intermediate results.
+
+        Returns
+        -------
+        list of tuple
+            (name, expression, by_symbol, by_date) in the order of evaluation.
+            name of the last stage (the whole expression) is None. expression is an Expression.
+
+        """
+        cs_funcs = {name.lower() for name in self.cross_section_functions}
+        ew_funcs = {name.lower() for name in self.elementwise_functions}
+        builtin_funcs = {name.lower() for name in self._builtin_functions}
+        stages = []
+
+        # stack items: [tokens, by_symbol, by_date] of values, ('func', name) and ('list', items, token)
+        def cut(value):
+            tokens, by_symbol, by_date = value
+            name = '{}{:d}'.format(prefix, len(stages))
+            stages.append((name, Expression(tokens, self.ops1, self.ops2, self.functions), by_symbol, by_date))
+            return [Token(TVAR, name, 0, 0)], True, True
+
+        def join(values, kind):
+            # kind: 'symbol' or 'date' if the values are required to be separable that way, else None
+            if kind is None and not (all([v[1] for v in values]) or all([v[2] for v in values])):
+                if any([v[1] for v in values]):
+                    kind = 'symbol'
+                elif any([v[2] for v in values]):
+                    kind = 'date'
+            if kind == 'symbol':
+                values = [v if v[1] else cut(v) for v in values]
+            elif kind == 'date':
+                values = [v if v[2] else cut(v) for v in values]
+            return values, all([v[1] for v in values]), all([v[2] for v in values])
+
         nstack = []
-        L = len(self.tokens)
-        for i in range(0, L):
-            item = self.tokens[i]
+        for item in self.tokens:
             type_ = item.type_
             if type_ == TNUMBER:
-                nstack.append(item.number_)
-            elif type_ == TOP2:
-                n2 = nstack.pop()
-                n1 = nstack.pop()
-                f = self.ops2[item.index_]
-                nstack.append(f(n1, n2))
+                nstack.append(([item], True, True))
             elif type_ == TVAR:
-                if item.index_ in values:
-                    nstack.append(values[item.index_])
-                elif item.index_ in self.functions:
-                    nstack.append(self.functions[item.index_])
+                if item.index_ in self.functions:
+                    nstack.append(('func', item))
                 else:
-                    raise Exception('undefined variable: ' + item.index_)
+                    nstack.append(([item], True, True))
             elif type_ == TOP1:
+                tokens, by_symbol, by_date = nstack.pop()
+                nstack.append((tokens + [item], by_symbol, by_date))
+            elif type_ == TOP2:
+                n2 = nstack.pop()
                 n1 = nstack.pop()
-                f = self.ops1[item.index_]
-                nstack.append(f(n1))
+                if item.index_ == ',':
+                    nstack.append(('list', n1[1] + [n2], item) if n1[0] == 'list' else ('list', [n1, n2], item))
+                else:
+                    (n1, n2), by_symbol, by_date = join([n1, n2], None)
+                    nstack.append((n1[0] + n2[0] + [item], by_symbol, by_date))
             elif type_ == TFUNCALL:
-                n1 = nstack.pop()
-                f = nstack.pop()
-                if callable(f):
-                    if type(n1) is list:
-                        nstack.append(f(*n1))
-                    else:
-                        nstack.append(f(n1))  # call(f, n1)
+                args = nstack.pop()
+                _, func = nstack.pop()
+                name = func.index_.lower()
+                if name in cs_funcs:
+                    kind = 'date'
+                elif name in ew_funcs or name not in builtin_funcs:
+                    kind = None
                 else:
-                    raise Exception(f + ' is not a function')
+                    kind = 'symbol'
+
+                values = args[1] if args[0] == 'list' else [args]
+                if name in builtin_funcs:
+                    values, by_symbol, by_date = join(values, kind)
+                    by_symbol = by_symbol and kind != 'date'
+                    by_date = by_date and kind != 'symbol'
+                else:
+                    by_symbol, by_date = False, False
+
+                tokens = [func] + values[0][0]
+                for v in values[1:]:
+                    tokens = tokens + v[0] + [args[2]]
+                nstack.append((tokens + [item], by_symbol, by_date))
             else:
                 raise Exception('invalid Expression')
-        if len(nstack) > 1:
-            raise Exception('invalid Expression (parity)')
-        return nstack[0]
+
+        tokens, by_symbol, by_date = nstack[0]
+        stages.append((None, Expression(tokens, self.ops1, self.ops2, self.functions), by_symbol, by_date))
+        return stages
 
     # -----------------------------------------------------
     # Other
@@ -0,0 +1,344 @@
+# encoding: utf-8
+"""
+Evaluate an expression incrementally, one new cross-section (row) at a time.
+
+Parser.evaluate works on the whole history, which is wasteful in live trading, where only the row
+of today is new. StreamingExpression compiles a formula into an ExprGraph and keeps state for each node:
+time series functions keep buffers of the last rows of their inputs (their window, see
+Parser.function_lookback), Ewma and Sma keep exponentially weighted accumulators,
+and cross section and element-wise functions only need the new row.
+So each new row costs O(symbols x window) instead of O(history).
+
+"""
+from __future__ import print_function
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data.py_expression_eval import Parser, TNUMBER, TOP1, TOP2, TVAR, TFUNCALL
+from jaqs.data.expr_graph import ExprGraph
+
+
+class _NodeState(object):
+    """
+    Compiled node of StreamingExpression.
+
+    Attributes
+    ----------
+    kind : {'number', 'var', 'op1', 'op2', 'row', 'window', 'ewm'}
+        'row' nodes are functions of the current row of arguments,
+        'window' nodes are functions of the last n_rows rows of arguments,
+        'ewm' nodes are exponentially weighted means.
+    n_rows : int
+        Number of rows of arguments a 'window' node needs.
+    history : deque
+        Last results of this node, (date, 1-D np.ndarray), kept when a 'window' node uses them.
+    alpha : float
+        Smoothing factor of 'ewm' nodes.
+
+    """
+    def __init__(self, kind, op, args, n_rows=1):
+        self.kind = kind
+        self.op = op
+        self.args = args
+        self.n_rows = n_rows
+        self.history = None
+        self.value = op if kind == 'number' else None
+        self.alpha = None
+        self.ewm_num = None
+        self.ewm_den = None
+
+
+class StreamingExpression(object):
+    """
+    Expression evaluated one date at a time, with per-node rolling state.
+
+    Variables are daily data. Functions with a window must have a number as window,
+    and user registered functions are not supported, since their window is unknown.
+
+    Attributes
+    ----------
+    formula : str
+    symbols : list of str
+        Columns of the results. Values of variables are aligned to them.
+    lookback : int or None
+        Number of previous rows needed to warm up, so that results are exactly those of full recomputation.
+        None if results depend on the whole history (Ewma, Sma).
+    last_date : int
+        Date of the last row consumed.
+
+    Examples
+    --------
+    expr = StreamingExpression('Rank(Ts_Mean(close, 5) / close)', symbols)
+    expr.warm_up({'close': df_close_history})
+    row = expr.update(20180102, {'close': sr_close_today})  # pd.Series indexed by symbol
+
+    """
+    def __init__(self, formula, symbols, formula_func_name_style='camel'):
+        self.formula = formula
+        self.symbols = list(symbols)
+        self.formula_func_name_style = formula_func_name_style
+        self.last_date = None
+
+        self.parser = Parser()
+        self.parser.set_capital(formula_func_name_style)
+        self._graph = ExprGraph(self.parser)
+        self._root = self._graph.add('result', self.parser.parse(formula))
+        self.variables = self._graph.variables()
+
+        self._order = self._graph._needed_nodes(['result'])
+        self._states = dict()
+        self._compile()
+        self.lookback = self._graph.lookback()
+
+    def _compile(self):
+        lookback_map = {k.lower(): v for k, v in self.parser.function_lookback.items()}
+        nodes = self._graph._nodes
+        states = self._states
+        for node_id in self._order:
+            type_, op, args = nodes[node_id]
+            if type_ == TNUMBER:
+                states[node_id] = _NodeState('number', op, args)
+                continue
+            if type_ == TVAR:
+                states[node_id] = _NodeState('var', op, args)
+                continue
+
+            # operations of numbers only are done once here
+            if all(states[arg].kind == 'number' for arg in args):
+                numbers = [states[arg].value for arg in args]
+                if type_ == TOP1:
+                    value = self.parser.ops1[op](*numbers)
+                elif type_ == TOP2:
+                    value = self.parser.ops2[op](*numbers)
+                else:
+                    value = self.parser.functions[op](*numbers)
+                states[node_id] = _NodeState('number', value, ())
+                continue
+
+            if type_ == TOP1:
+                states[node_id] = _NodeState('op1', op, args)
+            elif type_ == TOP2:
+                states[node_id] = _NodeState('op2', op, args)
+            elif type_ == TFUNCALL:
+                name = op.lower()
+                if name in ('ewma', 'sma'):
+                    states[node_id] = self._compile_ewm(op, args)
+                    continue
+
+                rule = lookback_map.get(name, None)
+                if rule is None:
+                    raise NotImplementedError("Function [{:s}] can not be evaluated incrementally.".format(op))
+                pos, offset, default = rule
+                if pos is None:
+                    states[node_id] = _NodeState('row', op, args)
+                    continue
+                if pos < len(args):
+                    if states[args[pos]].kind != 'number':
+                        raise NotImplementedError("Window of function [{:s}] must be a number.".format(op))
+                    window = states[args[pos]].value
+                else:
+                    window = default
+                n_rows = max(int(window) + offset, 0) + 1
+                states[node_id] = _NodeState('window', op, args, n_rows=n_rows)
+                for arg in args:
+                    arg_state = states[arg]
+                    if arg_state.kind != 'number':
+                        maxlen = max(n_rows, arg_state.history.maxlen if arg_state.history is not None else 1)
+                        arg_state.history = deque(arg_state.history or [], maxlen=maxlen)
+            else:
+                raise Exception('invalid Expression')
+
+    def _compile_ewm(self, op, args):
+        states = self._states
+        params = [states[arg] for arg in args[1:]]
+        if states[args[0]].kind == 'number' or any(p.kind != 'number' for p in params):
+            raise NotImplementedError("Parameters of function [{:s}] must be numbers.".format(op))
+        state = _NodeState('ewm', op, args)
+        if op.lower() == 'ewma':
+            halflife, = [p.value for p in params]
+            state.alpha = 1.0 - np.exp(np.log(0.5) / halflife)
+        else:
+            n, m = [p.value for p in params]
+            # Parser.sma uses com = n / m - 1
+            state.alpha = m * 1.0 / n
+        return state
+
+    # -----------------------------------------------------
+    # evaluation
+    def _to_row(self, date, value):
+        """1-row pd.DataFrame of value, whose columns are self.symbols."""
+        if isinstance(value, pd.DataFrame):
+            value = value.iloc[-1]
+        if isinstance(value, pd.Series):
+            value = value.reindex(self.symbols).values
+        value = np.asarray(value)
+        if value.ndim == 0:
+            value = np.repeat(value, len(self.symbols))
+        if value.shape != (len(self.symbols),):
+            raise ValueError("Length of value ({:d}) is different from that of symbols ({:d})."
+                             .format(len(value), len(self.symbols)))
+        return pd.DataFrame(value.reshape(1, -1), index=[date], columns=self.symbols)
+
+    def _window_frame(self, state):
+        dates, rows = zip(*state.history)
+        return pd.DataFrame(np.vstack(rows), index=list(dates), columns=self.symbols)
+
+    def update(self, date, values, index_member=None):
+        """
+        Consume the cross-section of a new date, and evaluate the expression on it.
+
+        Parameters
+        ----------
+        date : int
+            Must be later than dates consumed before.
+        values : dict
+            {variable: value of the date}, value is pd.Series indexed by symbol, or array-like aligned to symbols.
+        index_member : pd.Series or array-like, optional
+            Whether each symbol is an index member on the date. Cross section functions only use members.
+
+        Returns
+        -------
+        pd.Series
+            Result of the date, indexed by symbol.
+
+        """
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError("Date {} is not later than the last date {}.".format(date, self.last_date))
+        parser = self.parser
+        parser.ann_dts = None
+        parser.trade_dts = None
+        parser.index_member = None if index_member is None else self._to_row(date, index_member)
+
+        states = self._states
+        for node_id in self._order:
+            state = states[node_id]
+            kind = state.kind
+            if kind == 'number':
+                continue
+            args = [states[arg] for arg in state.args]
+            if kind == 'var':
+                if state.op not in values:
+                    raise Exception('undefined variable: ' + state.op)
+                res = self._to_row(date, values[state.op])
+            elif kind == 'op1':
+                res = parser.ops1[state.op](args[0].value)
+            elif kind == 'op2':
+                res = parser.ops2[state.op](args[0].value, args[1].value)
+            elif kind == 'row':
+                res = parser.functions[state.op](*[arg.value for arg in args])
+            elif kind == 'window':
+                res = parser.functions[state.op](*[arg.value if arg.kind == 'number' else self._window_frame(arg)
+                                                   for arg in args])
+            else:
+                res = self._update_ewm(state, args[0].value)
+
+            state.value = self._to_row(date, res)
+            if state.history is not None:
+                state.history.append((date, state.value.values[0]))
+
+        self.last_date = date
+        return states[self._root].value.iloc[0].copy()
+
+    def _update_ewm(self, state, df):
+        """Exponentially weighted mean, the same as pandas ewm(adjust=True, ignore_na=False).mean()."""
+        x = df.values[0].astype(float)
+        valid = ~np.isnan(x)
+        if state.ewm_num is None:
+            state.ewm_num = np.zeros_like(x)
+            state.ewm_den = np.zeros_like(x)
+        decay = 1.0 - state.alpha
+        state.ewm_num = state.ewm_num * decay + np.where(valid, x, 0.0)
+        state.ewm_den = state.ewm_den * decay + valid
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(state.ewm_den > 0, state.ewm_num / state.ewm_den, np.nan)
+
+    def warm_up(self, values, index_member=None):
+        """
+        Consume history, so that results of later rows are the same as full recomputation.
+        Only the last lookback rows are used, unless lookback is None.
+
+        Parameters
+        ----------
+        values : dict
+            {variable: pd.DataFrame}, index is date, column is symbol.
+        index_member : pd.DataFrame, optional
+
+        Returns
+        -------
+        pd.Series or None
+            Result of the last date of history.
+
+        """
+        dates = None
+        for var in self.variables:
+            if var not in values:
+                raise Exception('undefined variable: ' + var)
+            dates = values[var].index if dates is None else dates.union(values[var].index)
+        if dates is None:
+            return None
+        if self.last_date is not None:
+            dates = dates[dates > self.last_date]
+        if self.lookback is not None:
+            dates = dates[-(self.lookback + 1):] if len(dates) > self.lookback else dates
+
+        dic = {var: values[var].reindex(index=dates, columns=self.symbols) for var in self.variables}
+        if index_member is not None:
+            index_member = index_member.reindex(index=dates, columns=self.symbols)
+        res = None
+        for i, date in enumerate(dates):
+            row_member = None if index_member is None else index_member.values[i]
+            res = self.update(date, {var: df.values[i] for var, df in dic.items()}, index_member=row_member)
+        return res
+
+    def check(self, values, n_rows=5, index_member=None, rtol=1e-6, atol=1e-8):
+        """
+        Compare incremental results with full recomputation by Parser.evaluate.
+        A new StreamingExpression of the same formula is warmed up with all but the last n_rows rows of values,
+        then the last n_rows rows are consumed one by one.
+
+        Parameters
+        ----------
+        values : dict
+            {variable: pd.DataFrame}, index is date, column is symbol.
+        n_rows : int
+        index_member : pd.DataFrame, optional
+        rtol, atol : float
+            Tolerance of np.isclose.
+
+        Returns
+        -------
+        bool
+            True if all results agree. Mismatches are printed.
+
+        """
+        parser = Parser()
+        parser.set_capital(self.formula_func_name_style)
+        parser.parse(self.formula)
+        df_full = parser.evaluate(values, index_member=index_member)
+        if not isinstance(df_full, pd.DataFrame):
+            df_full = pd.DataFrame(df_full, index=values[self.variables[0]].index, columns=self.symbols)
+        df_full = df_full.reindex(columns=self.symbols)
+
+        dates = df_full.index
+        n_rows = min(n_rows, len(dates))
+        history_end = dates[len(dates) - n_rows - 1] if len(dates) > n_rows else None
+        expr = StreamingExpression(self.formula, self.symbols, formula_func_name_style=self.formula_func_name_style)
+        if history_end is not None:
+            expr.warm_up({var: values[var].loc[:history_end] for var in self.variables},
+                         index_member=None if index_member is None else index_member.loc[:history_end])
+
+        ok = True
+        for date in dates[len(dates) - n_rows:]:
+            row_member = None if index_member is None else index_member.reindex(columns=self.symbols).loc[date]
+            row = expr.update(date, {var: values[var].loc[date] for var in self.variables}, index_member=row_member)
+            expected = df_full.loc[date]
+            is_close = np.isclose(row.values.astype(float), expected.values.astype(float),
+                                  rtol=rtol, atol=atol, equal_nan=True)
+            if not is_close.all():
+                ok = False
+                bad = row.index[~is_close]
+                print("Mismatch on {}: {:d} symbols, e.g. {}: incremental {}, full {}".format(
+                    date, len(bad), bad[0], row[bad[0]], expected[bad[0]]))
+        return ok
@@ -0,0 +1,262 @@
+# encoding: utf-8
+"""
+Trade calendar kept in memory.
+
+All trade dates are loaded once into a sorted int array, so each query is a binary search
+(np.searchsorted) instead of a query to the data server. Array arguments are answered at once.
+
+"""
+from __future__ import print_function
+import os
+
+import numpy as np
+
+import jaqs.util as jutil
+
+
+def _to_days(dates):
+    """Days since 1970-01-01 of int dates like 20170103."""
+    dates = np.asarray(dates, dtype=np.int64)
+    months = (dates // 10000 - 1970) * 12 + dates // 100 % 100 - 1
+    days = months.astype('datetime64[M]').astype('datetime64[D]') + (dates % 100 - 1)
+    return days.astype(np.int64)
+
+
+def _period_keys(dates, period):
+    """Integer key of the period of each date, increasing with dates. Weeks start on Monday."""
+    dates = np.asarray(dates, dtype=np.int64)
+    if period == 'day':
+        return dates
+    elif period == 'week':
+        # 1970-01-01 is a Thursday
+        return (_to_days(dates) + 3) // 7
+    elif period == 'month':
+        return dates // 100
+    elif period == 'quarter':
+        return dates // 10000 * 4 + (dates // 100 % 100 - 1) // 3
+    elif period == 'year':
+        return dates // 10000
+    else:
+        raise NotImplementedError("period = {}".format(period))
+
+
+class Calendar(object):
+    """
+    Trade dates in memory, answering calendar queries by binary search.
+
+    Parameters
+    ----------
+    dates : array-like of int
+        Trade dates.
+    start_date, end_date : int, optional
+        Range of dates the calendar knows, dates not in dates are not trade dates.
+        Default the first and the last trade date.
+
+    Attributes
+    ----------
+    dates : np.ndarray
+        Sorted unique trade dates, dtype int64.
+    start_date, end_date : int
+
+    Examples
+    --------
+    cal = Calendar(trade_dates)
+    cal.get_next_trade_date(20170101)
+    cal.shift(dv.dates, -5)  # trade dates 5 trade days before
+    cal.get_period_ends(20170101, 20171231, 'month')  # last trade date of each month
+
+    """
+    PERIODS = ('day', 'week', 'month', 'quarter', 'year')
+
+    def __init__(self, dates, start_date=None, end_date=None):
+        self.dates = np.unique(np.asarray(dates, dtype=np.int64))
+        if start_date is None:
+            start_date = int(self.dates[0]) if len(self.dates) else 0
+        if end_date is None:
+            end_date = int(self.dates[-1]) if len(self.dates) else 0
+        self.start_date = int(start_date)
+        self.end_date = int(end_date)
+        # {period: keys of self.dates}
+        self._keys = dict()
+
+    def __len__(self):
+        return len(self.dates)
+
+    def __repr__(self):
+        return "Calendar({} trade dates from {} to {})".format(len(self.dates), self.start_date, self.end_date)
+
+    # -----------------------------------------------------
+    # persistence
+    def save(self, path):
+        """Save to a .npz file."""
+        jutil.create_dir(path)
+        fp_tmp = path + '.tmp'
+        with open(fp_tmp, 'wb') as f:
+            np.savez(f, dates=self.dates, date_range=np.array([self.start_date, self.end_date], dtype=np.int64))
+        jutil.replace_file(fp_tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load a calendar saved by save. Return None if the file does not exist or is damaged."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as f:
+                start_date, end_date = f['date_range']
+                return cls(f['dates'], start_date=start_date, end_date=end_date)
+        except Exception as e:
+            print("Failed to load calendar from {}: {}".format(path, e))
+            return None
+
+    # -----------------------------------------------------
+    # queries
+    def covers(self, start_date, end_date=None):
+        """Whether dates from start_date to end_date are all in the range of the calendar."""
+        if end_date is None:
+            end_date = start_date
+        return self.start_date <= start_date and end_date <= self.end_date
+
+    def is_trade_date(self, date):
+        """
+        Check whether date is a trade date.
+
+        Parameters
+        ----------
+        date : int or np.ndarray
+
+        Returns
+        -------
+        bool or np.ndarray of bool
+
+        """
+        if not len(self.dates):
+            res = np.zeros(np.shape(date), dtype=bool)
+        else:
+            idx = np.minimum(np.searchsorted(self.dates, date), len(self.dates) - 1)
+            res = self.dates[idx] == date
+        return bool(res) if np.ndim(res) == 0 else res
+
+    def get_trade_date_range(self, start_date, end_date):
+        """
+        Get array of trade dates within given range.
+        Return zero size array if no trade dates within range.
+
+        Parameters
+        ----------
+        start_date : int
+        end_date : int
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        left = np.searchsorted(self.dates, start_date, side='left')
+        right = np.searchsorted(self.dates, end_date, side='right')
+        return self.dates[left: right].copy()
+
+    def get_last_trade_date(self, date):
+        """
+        The last trade date before date. IndexError is raised if there is no such date.
+
+        Returns
+        -------
+        int
+
+        """
+        return int(self.shift(date, -1))
+
+    def get_next_trade_date(self, date):
+        """
+        The first trade date after date. IndexError is raised if there is no such date.
+
+        Returns
+        -------
+        int
+
+        """
+        return int(self.shift(date, 1))
+
+    def shift(self, dates, n):
+        """
+        The n-th trade date after (n > 0) or before (n < 0) each date, not counting the date itself.
+        With n = 0, trade dates are returned as they are and other dates are moved to the next trade date.
+        IndexError is raised if a result is out of the calendar.
+
+        Parameters
+        ----------
+        dates : int or np.ndarray
+        n : int
+
+        Returns
+        -------
+        int or np.ndarray
+
+        """
+        if n > 0:
+            idx = np.searchsorted(self.dates, dates, side='right') + (n - 1)
+        else:
+            idx = np.searchsorted(self.dates, dates, side='left') + n
+        if np.any(idx < 0) or np.any(idx >= len(self.dates)):
+            raise IndexError("Shifting dates by {} trade days is out of the calendar [{}, {}]."
+                             .format(n, self.start_date, self.end_date))
+        res = self.dates[idx]
+        return int(res) if np.ndim(res) == 0 else res
+
+    # -----------------------------------------------------
+    # periods
+    def _trade_date_keys(self, period):
+        if period not in self._keys:
+            self._keys[period] = _period_keys(self.dates, period)
+        return self._keys[period]
+
+    def period_start(self, dates, period='month'):
+        """
+        The first trade date of the period (see PERIODS) of each date, 0 if there is no trade date in it.
+
+        Parameters
+        ----------
+        dates : int or np.ndarray
+        period : {'day', 'week', 'month', 'quarter', 'year'}
+
+        Returns
+        -------
+        int or np.ndarray
+
+        """
+        return self._period_bound(dates, period, side='left')
+
+    def period_end(self, dates, period='month'):
+        """The last trade date of the period (see PERIODS) of each date, 0 if there is no trade date in it."""
+        return self._period_bound(dates, period, side='right')
+
+    def _period_bound(self, dates, period, side):
+        keys = self._trade_date_keys(period)
+        date_keys = _period_keys(dates, period)
+        idx = np.searchsorted(keys, date_keys, side=side)
+        if side == 'right':
+            idx = idx - 1
+        idx_valid = np.clip(idx, 0, max(len(keys) - 1, 0))
+        if len(keys):
+            res = np.where(keys[idx_valid] == date_keys, self.dates[idx_valid], 0)
+        else:
+            res = np.zeros_like(date_keys)
+        return int(res) if np.ndim(res) == 0 else res
+
+    def get_period_ends(self, start_date, end_date, period='month'):
+        """
+        Trade dates from start_date to end_date which are the last trade date of their period, e.g. month ends.
+        The last trade date of the calendar is included only if its period ends within the calendar.
+
+        Returns
+        -------
+        np.ndarray
+
+        """
+        keys = self._trade_date_keys(period)
+        is_end = np.ones(len(keys), dtype=bool)
+        is_end[:-1] = keys[1:] != keys[:-1]
+        if len(keys):
+            is_end[-1] = _period_keys(self.end_date, period) != keys[-1]
+        mask = is_end & (self.dates >= start_date) & (self.dates <= end_date)
+        return self.dates[mask]
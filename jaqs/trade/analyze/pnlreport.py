@@ -10,7 +10,6 @@ import pandas as pd
 from jaqs.data.basic import InstManager
 from jaqs.trade import common
 from jaqs.data.basic import Trade
-# from jaqs.data import Calendar
 
 
 # %matplotlib inline
@@ -67,7 +66,7 @@ class DailyPnlReport(object):
 
 class PnlManager(object):
     def __init__(self):
-        self.calendar = Calendar()
+        self.calendar = None
         self.instmgr = InstManager()
         self.strategy = None
         self.pnls = []
@@ -174,6 +173,7 @@ class PnlManager(object):
     
     def initFromConfig(self, props, data_server):
         self.data_api = data_server
+        self.calendar = data_server.calendar
         
         self.start_date = props.get('start_date')
         self.end_date = props.get('end_date')
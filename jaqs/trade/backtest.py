@@ -256,8 +256,8 @@ class AlphaBacktestInstance(BacktestInstance):
                 continue
             pos = pm.get_position(symbol).current_size
             last_trade_date = self._get_last_trade_date(value_dic['delist_date'])
-            last_close_price = self.ctx.dataview.get_snapshot(last_trade_date, symbol=symbol, fields='close')
-            last_close_price = last_close_price.at[symbol, 'close']
+            last_close_price = self.ctx.dataview.get_snapshot_arrays(last_trade_date, symbol=symbol, fields='close')
+            last_close_price = last_close_price['close'][0]
             
             trade_ind = Trade()
             trade_ind.symbol = symbol
@@ -283,10 +283,9 @@ class AlphaBacktestInstance(BacktestInstance):
         universe_list = self.ctx.universe
         if self.ctx.dataview.universe:
             col = 'index_member'
-            df_is_member = self.ctx.dataview.get_snapshot(self.ctx.trade_date, fields=col)
-            df_is_member = df_is_member.fillna(0).astype(bool)
-            dic_index_member = df_is_member.loc[:, col].to_dict()
-            universe_list = [symbol for symbol, value in dic_index_member.items() if value]
+            dic_is_member = self.ctx.dataview.get_snapshot_arrays(self.ctx.trade_date, fields=col)
+            is_member = np.nan_to_num(dic_is_member[col].astype(float)).astype(bool)
+            universe_list = list(dic_is_member['symbol'][is_member])
 
         # Step.2 filter out those not listed or already de-listed
         df_inst = self.ctx.dataview.data_inst
@@ -395,23 +394,19 @@ class AlphaBacktestInstance(BacktestInstance):
     '''
     def _is_trade_date(self, date):
         if self.ctx.dataview is not None:
-            return date in self.ctx.dataview.dates
+            return self.ctx.calendar.is_trade_date(date)
         else:
             return self.ctx.data_api.is_trade_date(date)
     
     def _get_next_trade_date(self, date):
         if self.ctx.dataview is not None:
-            dates = self.ctx.dataview.dates
-            mask = dates > date
-            return dates[mask][0]
+            return self.ctx.calendar.get_next_trade_date(date)
         else:
             return self.ctx.data_api.get_next_trade_date(date)
     
     def _get_last_trade_date(self, date):
         if self.ctx.dataview is not None:
-            dates = self.ctx.dataview.dates
-            mask = dates < date
-            return dates[mask][-1]
+            return self.ctx.calendar.get_last_trade_date(date)
         else:
             return self.ctx.data_api.get_last_trade_date(date)
     
@@ -460,26 +455,30 @@ class AlphaBacktestInstance(BacktestInstance):
         return False
     
     def get_suspensions(self):
-        trade_status = self.ctx.dataview.get_snapshot(self.ctx.trade_date, fields='trade_status')
-        trade_status = trade_status.loc[:, 'trade_status']
+        dic = self.ctx.dataview.get_snapshot_arrays(self.ctx.trade_date, fields='trade_status')
+        trade_status = dic['trade_status']
         # trade_status: {'N', 'XD', 'XR', 'DR', 'JiaoYi', 'TingPai', NUll (before 2003)}
         mask_sus = trade_status == u'停牌'.encode('utf-8')
-        return list(trade_status.loc[mask_sus].index.values)
+        return list(dic['symbol'][mask_sus])
 
     def get_limit_reaches(self):
         # TODO: 10% is not the absolute value to check limit reach
-        df_open = self.ctx.dataview.get_snapshot(self.ctx.trade_date, fields='open')
-        df_close = self.ctx.dataview.get_snapshot(self.last_date, fields='close')
-        merge = pd.concat([df_close, df_open], axis=1)
-        merge.loc[:, 'limit'] = np.abs((merge['open'] - merge['close']) / merge['close']) > 9.5E-2
-        return list(merge.loc[merge.loc[:, 'limit'], :].index.values)
+        dic_open = self.ctx.dataview.get_snapshot_arrays(self.ctx.trade_date, fields='open')
+        dic_close = self.ctx.dataview.get_snapshot_arrays(self.last_date, fields='close')
+        close = dic_close['close']
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mask_limit = np.abs((dic_open['open'] - close) / close) > 9.5E-2
+        return list(dic_open['symbol'][mask_limit])
     
     def on_new_day(self, date):
         # self.ctx.strategy.on_new_day(date)
         self.ctx.trade_api.on_new_day(date)
         
-        self.ctx.snapshot = self.ctx.dataview.get_snapshot(date)
-        self.univ_price_dic = self.ctx.snapshot.loc[:, ['close', 'vwap', 'open', 'high', 'low']].to_dict(orient='index')
+        self.ctx.set_snapshot_date(date)
+        price_fields = ['close', 'vwap', 'open', 'high', 'low']
+        dic = self.ctx.dataview.get_snapshot_arrays(date, fields=','.join(price_fields))
+        self.univ_price_dic = {symbol: {field: dic[field][i] for field in price_fields}
+                               for i, symbol in enumerate(dic['symbol'])}
     
     def save_results(self, folder_path='.'):
         import os
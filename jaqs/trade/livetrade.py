@@ -173,7 +173,7 @@ class AlphaLiveTradeInstance(object):
         
         # Step2.
         # plan re-balance before market open of the re-balance day:
-        self.ctx.snapshot = self.ctx.dataview.get_snapshot(self.last_date)
+        self.ctx.set_snapshot_date(self.last_date)
         # get index memebers, get signals, generate weights
         self.re_balance_plan_before_open()
         
@@ -187,23 +187,19 @@ class AlphaLiveTradeInstance(object):
     
     def _is_trade_date(self, date):
         if self.ctx.dataview is not None:
-            return date in self.ctx.dataview.dates
+            return self.ctx.calendar.is_trade_date(date)
         else:
             return self.ctx.data_api.is_trade_date(date)
     
     def _get_next_trade_date(self, date):
         if self.ctx.dataview is not None:
-            dates = self.ctx.dataview.dates
-            mask = dates > date
-            return dates[mask][0]
+            return self.ctx.calendar.get_next_trade_date(date)
         else:
             return self.ctx.data_api.get_next_trade_date(date)
     
     def _get_last_trade_date(self, date):
         if self.ctx.dataview is not None:
-            dates = self.ctx.dataview.dates
-            mask = dates < date
-            return dates[mask][-1]
+            return self.ctx.calendar.get_last_trade_date(date)
         else:
             return self.ctx.data_api.get_last_trade_date(date)
     
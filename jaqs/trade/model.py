@@ -27,8 +27,8 @@ class Context(object):
         Broker of the strategy.
     universe : list of str
         Securities that the strategy cares about.
-    _calendar : Calendar
-        A certain calendar that the strategy refers to.
+    calendar : Calendar
+        Trade calendar of dataview if it exists, else that of data_api.
     snapshot : pd.DataFrame
         Current snapshot of data.
 
@@ -41,8 +41,9 @@ class Context(object):
     def __init__(self, data_api=None, trade_api=None, gateway=None,
                  dataview=None,
                  strategy=None, pm=None, instance=None):
-        # TODO: should also support get calendar from dataview
-        # self._calendar = None
+        self._calendar = None
+        # dates the calendar is built from
+        self._calendar_dates = None
 
         self.universe = []
         self._data_api = data_api
@@ -58,7 +59,9 @@ class Context(object):
         
         self.trade_date = 0
         self.time = 0
-        self.snapshot = None
+        # snapshot of dataview at _snapshot_date, built when first read
+        self._snapshot = None
+        self._snapshot_date = 0
         
         self.storage = dict()
         
@@ -77,19 +80,42 @@ class Context(object):
         if s is not None:
             self.storage = s
             
-    '''
     @property
     def calendar(self):
         from jaqs.data import Calendar
-        if self.data_api is not None:
-            return self.data_api.calendar
-        elif self._calendar is not None:
-            return self._calendar
-        else:
-            self._calendar = Calendar()
+        if self._dataview is not None:
+            dates = self._dataview.dates
+            # rebuild after dates of dataview are replaced, e.g. by extend.
+            # Compared by identity, so that each access does not scan all dates.
+            if self._calendar is None or dates is not self._calendar_dates or len(dates) != len(self._calendar):
+                self._calendar = Calendar(dates)
+                self._calendar_dates = dates
             return self._calendar
-        
-    '''
+        if self._data_api is not None and hasattr(self._data_api, 'calendar'):
+            return self._data_api.calendar
+        return None
+    
+    @property
+    def snapshot(self):
+        """
+        Snapshot of all fields of dataview (symbol as index, field as columns), see set_snapshot_date.
+        It is built when first read after the date is set, so days on which it is not used cost nothing.
+
+        """
+        if self._snapshot is None and self._snapshot_date and self._dataview is not None:
+            self._snapshot = self._dataview.get_snapshot(self._snapshot_date)
+        return self._snapshot
+
+    @snapshot.setter
+    def snapshot(self, value):
+        self._snapshot = value
+        self._snapshot_date = 0
+
+    def set_snapshot_date(self, date):
+        """Make snapshot the snapshot of dataview at date, which is built lazily."""
+        self._snapshot = None
+        self._snapshot_date = date
+
     @property
     def data_api(self):
         return self._data_api
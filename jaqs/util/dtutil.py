@@ -96,6 +96,39 @@ def shift(date, n_weeks=0):
     return res
 
 
+def split_date_range(start_date, end_date, n_days):
+    """
+    Split [start_date, end_date] into consecutive disjoint ranges of at most n_days calendar days.
+
+    Parameters
+    ----------
+    start_date : int
+    end_date : int
+    n_days : int
+        Non-positive means no split.
+
+    Returns
+    -------
+    list of tuple
+        [(start, end)], both ends are included.
+
+    """
+    if n_days <= 0 or start_date >= end_date:
+        return [(start_date, end_date)]
+    
+    dt = convert_int_to_datetime(start_date)
+    end_dt = convert_int_to_datetime(end_date)
+    if (end_dt - dt).days < n_days:
+        return [(start_date, end_date)]
+    
+    res = []
+    while dt <= end_dt:
+        dt_end = min(dt + pd.Timedelta(days=n_days - 1), end_dt)
+        res.append((convert_datetime_to_int(dt), convert_datetime_to_int(dt_end)))
+        dt = dt_end + pd.Timedelta(days=1)
+    return res
+
+
 def combine_date_time(date, time):
     return np.int64(date) * 1000000 + np.int64(time)
 
@@ -110,6 +110,24 @@ def save_pickle(obj, file_name):
         pickle.dump(obj, f)
 
 
+def replace_file(src, dst):
+    """
+    Move file src to dst atomically, so that readers of dst never see a partially written file.
+
+    Parameters
+    ----------
+    src : str
+    dst : str
+
+    """
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # Python 2
+        if os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
 def join_relative_path(*paths):
     """Get absolute path using paths that are relative to project root."""
     return os.path.abspath(os.path.join(SOURCE_ROOT_DIR, *paths))
@@ -0,0 +1,240 @@
+# encoding: utf-8
+"""
+Grouped cross-section kernels on 2-D arrays (index is date, column is symbol).
+
+Symbols of each date are sorted by group code once, so that each (date, group) pair is
+a contiguous segment. Statistics of all segments are then computed together with np.bincount
+and a sort by (segment, value), so the cost does not depend on the number of groups,
+unlike masking the whole panel once for each group.
+Values which are NaN, or whose group is missing, give NaN.
+
+"""
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+
+def group_codes(group, shape=None):
+    """
+    Integer codes of group labels, -1 for missing labels.
+
+    Parameters
+    ----------
+    group : np.ndarray or pd.DataFrame or pd.Series
+        Labels of any type (e.g. industry names, or float codes with NaN).
+    shape : tuple, optional
+        Shape to broadcast codes to, e.g. a 1-D array of labels of symbols to (n_dates, n_symbols).
+
+    Returns
+    -------
+    np.ndarray
+
+    """
+    values = group.values if isinstance(group, (pd.DataFrame, pd.Series)) else np.asarray(group)
+    if np.issubdtype(values.dtype, np.integer):
+        codes = values.astype(np.int64)
+    else:
+        codes, _ = pd.factorize(values.ravel())
+        codes = codes.reshape(values.shape)
+    if shape is not None:
+        codes = np.broadcast_to(codes, shape)
+    return codes
+
+
+class GroupSegments(object):
+    """
+    Segments of (date, group) of a panel of group codes.
+
+    Parameters
+    ----------
+    codes : np.ndarray
+        2-D integer codes (see group_codes), index is date, column is symbol. Negative codes mean no group.
+
+    Attributes
+    ----------
+    segment_ids : np.ndarray
+        Segment of each element (flattened), -1 for elements without group.
+    n_segments : int
+
+    Examples
+    --------
+    seg = GroupSegments(group_codes(df_industry))
+    res = seg.rank(df_value.values)
+
+    """
+    def __init__(self, codes):
+        codes = np.asarray(codes)
+        if codes.ndim != 2:
+            raise ValueError("Only 2-D codes are supported.")
+        self.shape = codes.shape
+        n_dates, n_symbols = codes.shape
+
+        # sort symbols of each date by code, elements without group last
+        key = codes.astype(np.int64)
+        key = np.where(key < 0, np.iinfo(np.int64).max, key)
+        order = np.argsort(key, axis=1, kind='mergesort')
+        sorted_key = np.take_along_axis(key, order, axis=1).ravel()
+        order = (order + (np.arange(n_dates) * n_symbols).reshape(-1, 1)).ravel()
+
+        has_group = sorted_key != np.iinfo(np.int64).max
+        is_start = np.ones(len(sorted_key), dtype=bool)
+        is_start[1:] = sorted_key[1:] != sorted_key[:-1]
+        # a new date always starts a new segment
+        is_start[::n_symbols] = True
+        seg_sorted = np.cumsum(is_start & has_group) - 1
+
+        segment_ids = np.full(len(sorted_key), -1, dtype=np.int64)
+        segment_ids[order[has_group]] = seg_sorted[has_group]
+        self.segment_ids = segment_ids
+        self.n_segments = int(seg_sorted[has_group].max()) + 1 if has_group.any() else 0
+
+    # -----------------------------------------------------
+    # helpers
+    def _flatten(self, arr):
+        arr = np.asarray(arr, dtype=np.float64)
+        if arr.shape != self.shape:
+            raise ValueError("Shape of values {} is different from that of groups {}."
+                             .format(arr.shape, self.shape))
+        return arr.ravel()
+
+    def _valid(self, x):
+        return (self.segment_ids >= 0) & ~np.isnan(x)
+
+    def _bincount(self, idx, weights=None):
+        return np.bincount(self.segment_ids[idx], weights=weights, minlength=self.n_segments)
+
+    def _fill(self, values, idx):
+        res = np.full(self.shape[0] * self.shape[1], np.nan)
+        res[idx] = values
+        return res.reshape(self.shape)
+
+    def _demeaned(self, x, valid):
+        count = self._bincount(valid)
+        total = self._bincount(valid, weights=x[valid])
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = total / count
+        return x[valid] - mean[self.segment_ids[valid]], count
+
+    def _sorted_by_value(self, x, valid):
+        """
+        Indices of valid elements sorted by (segment, value), ties in the order of symbols,
+        and the position of each of them in its segment.
+
+        """
+        n_dates, n_symbols = self.shape
+        # order of values in each date, then order of (segment, order of value), which are unique integers
+        value_order = np.argsort(np.where(valid, x, np.inf).reshape(self.shape), axis=1, kind='mergesort')
+        value_rank = np.empty(self.shape, dtype=np.int64)
+        np.put_along_axis(value_rank, value_order, np.arange(n_symbols, dtype=np.int64).reshape(1, -1), axis=1)
+        idx = np.flatnonzero(valid)
+        key = self.segment_ids[idx] * n_symbols + value_rank.ravel()[idx]
+        idx = idx[np.argsort(key)]
+        seg = self.segment_ids[idx]
+
+        count = np.bincount(seg, minlength=self.n_segments)
+        seg_start = np.cumsum(count) - count
+        pos = np.arange(len(idx)) - seg_start[seg]
+        return idx, seg, pos, count
+
+    @staticmethod
+    def _runs(xs, seg, pos):
+        """Run of equal values in a segment of each sorted element, and the first and last position of runs."""
+        is_start = np.ones(len(xs), dtype=bool)
+        is_start[1:] = (seg[1:] != seg[:-1]) | (xs[1:] != xs[:-1])
+        run = np.cumsum(is_start) - 1
+        run_first = pos[is_start]
+        run_last = np.empty_like(run_first)
+        run_last[:-1] = pos[np.flatnonzero(is_start)[1:] - 1]
+        if len(run_last):
+            run_last[-1] = pos[-1]
+        return run, run_first, run_last
+
+    # -----------------------------------------------------
+    # kernels
+    def count(self, x):
+        """Number of valid values of the segment of each element."""
+        x = self._flatten(x)
+        valid = self._valid(x)
+        count = self._bincount(valid)
+        res = np.full(len(x), np.nan)
+        has_group = self.segment_ids >= 0
+        res[has_group] = count[self.segment_ids[has_group]]
+        return res.reshape(self.shape)
+
+    def demean(self, x):
+        """Values minus mean of their segment."""
+        x = self._flatten(x)
+        valid = self._valid(x)
+        res, _ = self._demeaned(x, valid)
+        return self._fill(res, valid)
+
+    def zscore(self, x):
+        """Values minus mean of their segment, divided by sample standard deviation (ddof=1) of the segment."""
+        x = self._flatten(x)
+        valid = self._valid(x)
+        dx, count = self._demeaned(x, valid)
+        ss = self._bincount(valid, weights=dx * dx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.sqrt(ss / (count - 1))
+            std[count < 2] = np.nan
+            res = dx / std[self.segment_ids[valid]]
+        return self._fill(res, valid)
+
+    def residual(self, y, x):
+        """
+        Residuals of y regressed on x with intercept in each segment.
+        Only elements where both are valid are used. If x is constant in a segment, its slope is 0.
+
+        """
+        y = self._flatten(y)
+        x = self._flatten(x)
+        valid = self._valid(y) & ~np.isnan(x)
+        dy, _ = self._demeaned(y, valid)
+        dx, _ = self._demeaned(x, valid)
+        sxy = self._bincount(valid, weights=dx * dy)
+        sxx = self._bincount(valid, weights=dx * dx)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            beta = np.where(sxx > 0, sxy / sxx, 0.0)
+        res = dy - beta[self.segment_ids[valid]] * dx
+        return self._fill(res, valid)
+
+    def rank(self, x, pct=False):
+        """
+        Rank of values in their segment, from 1, equal values get their average rank (as pandas).
+
+        Parameters
+        ----------
+        x : np.ndarray
+        pct : bool
+            Whether to divide ranks by the number of valid values of the segment.
+
+        """
+        x = self._flatten(x)
+        valid = self._valid(x)
+        idx, seg, pos, count = self._sorted_by_value(x, valid)
+        run, run_first, run_last = self._runs(x[idx], seg, pos)
+        res = (run_first[run] + run_last[run]) / 2.0 + 1.0
+        if pct:
+            res = res / count[seg]
+        return self._fill(res, idx)
+
+    def quantile(self, x, n_quantiles=5, ties='order'):
+        """
+        Quantile number (1 to n_quantiles) of values in their segment, small values get small numbers.
+        The same as jaqs.util.numeric.quantilize_fast applied to each segment. With ties='order',
+        equal values are ordered by symbol, with ties='first' they get the quantile of the first of them.
+
+        """
+        if ties not in ('order', 'first'):
+            raise ValueError("ties must be 'order' or 'first'. Input is: {}".format(ties))
+        x = self._flatten(x)
+        valid = self._valid(x)
+        idx, seg, pos, count = self._sorted_by_value(x, valid)
+        if ties == 'first':
+            run, run_first, _ = self._runs(x[idx], seg, pos)
+            pos = run_first[run]
+        divisor = count[seg] * 1. / n_quantiles
+        res = np.floor(pos / divisor) + 1.0
+        return self._fill(res, idx)
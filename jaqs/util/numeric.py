@@ -17,3 +17,180 @@ def quantilize_without_nan(mat, n_quantiles=5, axis=-1):
     res[mask] = np.nan
     
     return res
+
+
+# number of elements processed at once by rank_without_nan and quantilize_fast, to bound temporary memory
+CHUNK_ELEMENTS = 1 << 22
+# max number of quantiles minus 1, for which quantilize_fast uses partial selection instead of sorting
+MAX_PARTITION_KTH = 19
+
+
+def _apply_by_row(func, mat, axis, dtype, chunk_size, *args):
+    """Apply func(chunk, out, *args) to chunks of rows of a 1-D or 2-D array along axis."""
+    mat = np.asarray(mat)
+    if mat.dtype.kind != 'f':
+        mat = mat.astype(np.float64)
+    if mat.ndim == 1:
+        return _apply_by_row(func, mat.reshape(1, -1), -1, dtype, chunk_size, *args).ravel()
+    if mat.ndim != 2:
+        raise ValueError("Only 1-D and 2-D arrays are supported.")
+    if axis in (0, -2):
+        return _apply_by_row(func, mat.T, -1, dtype, chunk_size, *args).T
+    
+    n_rows, n_cols = mat.shape
+    res = np.empty(mat.shape, dtype=dtype)
+    if not chunk_size:
+        chunk_size = max(CHUNK_ELEMENTS // max(n_cols, 1), 1)
+    for row in range(0, n_rows, chunk_size):
+        func(mat[row: row + chunk_size], res[row: row + chunk_size], *args)
+    return res
+
+
+def _sort_rows(x):
+    """
+    Sort each row once, NaN last. Return the order, number of valid values of each row,
+    and whether each sorted element is the first of a run of equal values.
+    Results only depend on runs, so the order of equal values does not matter and the sort needs not be stable.
+    
+    """
+    n_cols = x.shape[1]
+    order = np.argsort(x, axis=1)
+    xs = np.take_along_axis(x, order, axis=1)
+    count = n_cols - np.isnan(x).sum(axis=1)
+    is_first = np.ones(xs.shape, dtype=bool)
+    np.not_equal(xs[:, 1:], xs[:, :-1], out=is_first[:, 1:])
+    return order, count, is_first
+
+
+def _run_first(is_first):
+    """First sorted position of the run of equal values each sorted element belongs to."""
+    pos = np.arange(is_first.shape[1])
+    return np.maximum.accumulate(np.where(is_first, pos, 0), axis=1)
+
+
+def _run_last(is_first):
+    """Last sorted position of the run of equal values each sorted element belongs to."""
+    n_cols = is_first.shape[1]
+    is_last = np.ones(is_first.shape, dtype=bool)
+    is_last[:, :-1] = is_first[:, 1:]
+    return np.minimum.accumulate(np.where(is_last, np.arange(n_cols), n_cols)[:, ::-1], axis=1)[:, ::-1]
+
+
+def _scatter(out, order, res_sorted, count):
+    res_sorted[np.arange(order.shape[1]) >= count.reshape(-1, 1)] = np.nan
+    np.put_along_axis(out, order, res_sorted, axis=1)
+
+
+def _rank_rows(x, out, pct):
+    order, count, is_first = _sort_rows(x)
+    # NaN are not equal to each other, so they do not break the check
+    if is_first.all():
+        res = np.empty(x.shape)
+        res[:] = np.arange(1.0, x.shape[1] + 1.0)
+    else:
+        res = (_run_first(is_first) + _run_last(is_first)) / 2.0 + 1.0
+    if pct:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            res /= count.reshape(-1, 1)
+    _scatter(out, order, res, count)
+
+
+def _quantilize_sorted(x, out, n_quantiles, ties):
+    """Quantile numbers of rows of x by sorting each row once."""
+    n_cols = x.shape[1]
+    order, count, is_first = _sort_rows(x)
+    if ties == 'first' and not is_first.all():
+        first = _run_first(is_first)
+    else:
+        # equal values are ordered as argsort orders them, the same as quantilize_without_nan
+        first = np.arange(n_cols)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        divisor = count.reshape(-1, 1) * 1. / n_quantiles
+        res = np.floor(first / divisor) + 1.0
+    _scatter(out, order, res, count)
+
+
+def _quantilize_rows(x, out, n_quantiles, ties):
+    n_cols = x.shape[1]
+    divisor = n_cols * 1. / n_quantiles
+    # quantile number of each sorted position if all values are valid
+    bucket = np.floor(np.arange(n_cols) / divisor) + 1.0
+    # first positions of quantiles 2, 3, ...
+    starts = np.searchsorted(bucket, np.arange(2, n_quantiles + 1))
+    starts = starts[starts < n_cols]
+    if len(starts) <= MAX_PARTITION_KTH and not np.isnan(x).any():
+        # the same number of values in every row: select values before quantile starts instead of sorting,
+        # a value larger than the one before a start is in that quantile or later
+        if len(starts):
+            part = np.partition(x, starts - 1, axis=1)
+        out[:] = 1.0
+        split = np.zeros(len(x), dtype=bool)
+        for start in starts:
+            larger = x > part[:, start - 1: start]
+            out += larger
+            if ties == 'order':
+                # equal values on both sides of a start are split by their order, which needs sorting
+                split |= larger.sum(axis=1) != n_cols - start
+        if split.any():
+            res = np.empty((split.sum(), n_cols), dtype=out.dtype)
+            _quantilize_sorted(x[split], res, n_quantiles, ties)
+            out[split] = res
+        return
+    
+    _quantilize_sorted(x, out, n_quantiles, ties)
+
+
+def rank_without_nan(mat, pct=False, axis=-1, dtype=np.float64, chunk_size=None):
+    """
+    Rank of values along axis, from 1. Equal values get their average rank, NaN gets NaN,
+    the same as pd.DataFrame.rank. Each row is sorted once and ranks are scattered back.
+    
+    Parameters
+    ----------
+    mat : np.ndarray
+        1-D or 2-D.
+    pct : bool
+        Whether to divide ranks by the number of valid values.
+    axis : int
+    dtype : np.dtype
+        Type of the result, np.float32 halves its memory.
+    chunk_size : int, optional
+        Number of rows (along the other axis) processed at once. Default about CHUNK_ELEMENTS elements.
+    
+    Returns
+    -------
+    np.ndarray
+    
+    """
+    return _apply_by_row(_rank_rows, mat, axis, dtype, chunk_size, pct)
+
+
+def quantilize_fast(mat, n_quantiles=5, axis=-1, dtype=np.float64, chunk_size=None, ties='order'):
+    """
+    Quantile number (1 to n_quantiles) of values along axis, small values get small numbers, NaN gets NaN.
+    The same as quantilize_without_nan. Rows without NaN are bucketed by partial selection (np.partition)
+    when n_quantiles is small, other rows are sorted once.
+    
+    Parameters
+    ----------
+    mat : np.ndarray
+        1-D or 2-D.
+    n_quantiles : int
+    axis : int
+    dtype : np.dtype
+        Type of the result, np.float32 halves its memory.
+    chunk_size : int, optional
+        Number of rows (along the other axis) processed at once. Default about CHUNK_ELEMENTS elements.
+    ties : {'order', 'first'}
+        'order' (default): equal values are ordered by the sort and may get different quantile numbers,
+        so every quantile number is used. 'first': equal values get the quantile of the first of them,
+        so the largest quantile numbers may be missing.
+    
+    Returns
+    -------
+    np.ndarray
+    
+    """
+    if ties not in ('order', 'first'):
+        raise ValueError("ties must be 'order' or 'first'. Input is: {}".format(ties))
+    return _apply_by_row(_quantilize_rows, mat, axis, dtype, chunk_size, n_quantiles, ties)
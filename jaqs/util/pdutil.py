@@ -6,7 +6,7 @@ import pandas as pd
 from jaqs.util import numeric
 
 
-def to_quantile(df, n_quantiles=5, axis=1):
+def to_quantile(df, n_quantiles=5, axis=1, ties='order'):
     """
     Convert cross-section values to the quantile number they belong.
     Small values get small quantile numbers.
@@ -19,6 +19,9 @@ def to_quantile(df, n_quantiles=5, axis=1):
         The number of quantile to be divided to.
     axis : int
         Axis to apply quantilize.
+    ties : {'order', 'first'}
+        'order' (default): equal values may get different quantile numbers, every number is used.
+        'first': equal values get the quantile number of the first of them.
 
     Returns
     -------
@@ -26,10 +29,7 @@ def to_quantile(df, n_quantiles=5, axis=1):
         index date, column symbols
 
     """
-    # TODO: unnecesssary warnings
-    # import warnings
-    # warnings.filterwarnings(action='ignore', category=RuntimeWarning, module='py_exp')
-    res_arr = numeric.quantilize_without_nan(df.values, n_quantiles=n_quantiles, axis=axis)
+    res_arr = numeric.quantilize_fast(df.values, n_quantiles=n_quantiles, axis=axis, ties=ties)
     res = pd.DataFrame(index=df.index, columns=df.columns, data=res_arr)
     return res
 
@@ -0,0 +1,377 @@
+# encoding: utf-8
+"""
+NaN-aware rolling window kernels on 2-D arrays (index is date, column is symbol), along axis 0.
+
+Window statistics are computed from cumulative sums, recurrences, strided views and
+the van Herk / Gil-Werman algorithm for min and max, so no Python function is called per window.
+Missing values (NaN and inf) are skipped. A window gives NaN if it has less than min_periods valid values,
+which is the window length by default, the same as pandas.
+Unlike some versions of pandas, skewness, kurtosis and correlation of a constant window are NaN.
+
+"""
+from __future__ import division
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# max number of elements of temporary arrays built from strided windows
+_CHUNK_ELEMENTS = 2 ** 24
+
+
+def _as_2d(arr):
+    arr = np.asarray(arr, dtype=np.float64)
+    if arr.ndim == 1:
+        return arr.reshape(-1, 1)
+    elif arr.ndim != 2:
+        raise ValueError("Only 1-D or 2-D arrays are supported.")
+    return arr
+
+
+def _restore(res, arr):
+    """Reshape result to the shape of input."""
+    return res.reshape(np.shape(arr))
+
+
+def _check_window(window, min_periods):
+    window = int(window)
+    if window < 1:
+        raise ValueError("window must be a positive integer, got {}.".format(window))
+    min_periods = window if min_periods is None else int(min_periods)
+    if not 0 <= min_periods <= window:
+        raise ValueError("min_periods must be between 0 and window, got {}.".format(min_periods))
+    return window, min_periods
+
+
+def _window_sum(arr, window, dtype=None):
+    """Sums of arr over windows ending at each row. The first window - 1 rows sum partial windows."""
+    cs = np.cumsum(arr, axis=0, dtype=dtype)
+    if window >= len(cs):
+        return cs
+    res = np.empty_like(cs)
+    res[:window] = cs[:window]
+    np.subtract(cs[window:], cs[:-window], out=res[window:])
+    return res
+
+
+def _center(arr, valid):
+    """Subtract column means of valid values and fill invalid values with 0, to keep cumulative sums small."""
+    res = np.where(valid, arr, 0.0)
+    mean = res.sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+    res -= mean
+    res[~valid] = 0.0
+    return res, mean
+
+
+def _finalize(res, count, min_periods):
+    res[count < max(min_periods, 1)] = np.nan
+    return res
+
+
+def _valid_count(arr, window):
+    valid = np.isfinite(arr)
+    return valid, _window_sum(valid, window, dtype=np.int32)
+
+
+def rolling_count(arr, window):
+    """Number of valid values in each window, including partial windows of the first window - 1 rows."""
+    x = _as_2d(arr)
+    _, count = _valid_count(x, int(window))
+    return _restore(count.astype(np.float64), arr)
+
+
+def rolling_sum(arr, window, min_periods=None):
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    centered, mean = _center(x, valid)
+    res = _window_sum(centered, window) + count * mean
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_mean(arr, window, min_periods=None):
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    centered, mean = _center(x, valid)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = _window_sum(centered, window) / count + mean
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def _min_max(x, window, func, fill):
+    """Van Herk / Gil-Werman: max of a window is the max of a block suffix and the next block prefix."""
+    n = len(x)
+    if window == 1:
+        return x.copy()
+    if window >= n:
+        return func.accumulate(x, axis=0)
+    n_blocks = -(-n // window)
+    if n_blocks * window == n:
+        padded = x
+    else:
+        padded = np.full((n_blocks * window,) + x.shape[1:], fill)
+        padded[:n] = x
+    blocks = padded.reshape((n_blocks, window) + x.shape[1:])
+    prefix = func.accumulate(blocks, axis=1).reshape(padded.shape)
+    suffix = func.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(padded.shape)
+    res = np.empty(x.shape)
+    res[:window - 1] = prefix[:window - 1]
+    func(suffix[:n - window + 1], prefix[window - 1:n], out=res[window - 1:])
+    return res
+
+
+def rolling_max(arr, window, min_periods=None):
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    res = _min_max(np.where(valid, x, -np.inf), window, np.maximum, -np.inf)
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_min(arr, window, min_periods=None):
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    res = _min_max(np.where(valid, x, np.inf), window, np.minimum, np.inf)
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def _is_constant(x, valid, window, sum_sq, centered):
+    """
+    Whether valid values of each window are all equal, so that variance is exactly 0.
+    Variances from cumulative sums are not exactly 0 for constant windows, but they are tiny compared to
+    the sum of squares of the column. Only windows with such tiny variance are checked value by value.
+
+    """
+    scale = 1e-9 * (centered * centered).sum(axis=0)
+    res = np.zeros(x.shape, dtype=bool)
+    rows, cols = np.nonzero(sum_sq <= scale)
+    if len(rows):
+        windows = _full_windows(np.where(valid, x, np.nan), window)
+        values = windows[rows, :, cols]
+        with np.errstate(invalid='ignore'):
+            res[rows, cols] = np.nanmax(values, axis=1) == np.nanmin(values, axis=1)
+    return res
+
+
+def _moments(x, valid, count, window, order):
+    """
+    Window sums of centered values to the power of 1 .. order,
+    and whether each window is constant (see _is_constant).
+
+    """
+    centered, _ = _center(x, valid)
+    res = []
+    power = centered
+    for k in range(order):
+        if k:
+            power = power * centered
+        res.append(_window_sum(power, window))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sum_sq = np.maximum(res[1] - res[0] * res[0] / count, 0.0)
+    return res, _is_constant(x, valid, window, sum_sq, centered)
+
+
+def rolling_var(arr, window, min_periods=None, ddof=1):
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    (s1, s2), constant = _moments(x, valid, count, window, 2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = np.maximum(s2 - s1 * s1 / count, 0.0) / (count - ddof)
+    res[constant] = 0.0
+    res[count <= ddof] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_std(arr, window, min_periods=None, ddof=1):
+    return np.sqrt(rolling_var(arr, window, min_periods=min_periods, ddof=ddof))
+
+
+def rolling_skew(arr, window, min_periods=None):
+    """Unbiased skewness, the same as pandas. At least 3 valid values are needed."""
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    (s1, s2, s3), constant = _moments(x, valid, count, window, 3)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = s1 / count
+        b = s2 / count - a * a
+        c = s3 / count - a * a * a - 3 * a * b
+        res = np.sqrt(count * (count - 1)) * c / ((count - 2) * b ** 1.5)
+    res[(b <= 1e-14) | constant | (count < 3)] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_kurt(arr, window, min_periods=None):
+    """Unbiased excess kurtosis, the same as pandas. At least 4 valid values are needed."""
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    (s1, s2, s3, s4), constant = _moments(x, valid, count, window, 4)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a = s1 / count
+        b = s2 / count - a * a
+        c = s3 / count - a * a * a - 3 * a * b
+        d = s4 / count - a ** 4 - 6 * b * a * a - 4 * c * a
+        k = (count * count - 1) * d / (b * b) - 3 * (count - 1) ** 2
+        res = k / ((count - 2) * (count - 3))
+    res[(b <= 1e-14) | constant | (count < 4)] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def _pair_moments(x, y, window):
+    """Count, sums of x, y, x * x, y * y, x * y over windows, using pairs where both x and y are valid."""
+    valid = np.isfinite(x) & np.isfinite(y)
+    count = _window_sum(valid, window, dtype=np.int32)
+    cx, _ = _center(x, valid)
+    cy, _ = _center(y, valid)
+    sums = [_window_sum(v, window) for v in [cx, cy, cx * cx, cy * cy, cx * cy]]
+    return count, sums, cx, cy, valid
+
+
+def rolling_cov(arr_x, arr_y, window, min_periods=None, ddof=1):
+    window, min_periods = _check_window(window, min_periods)
+    x, y = _as_2d(arr_x), _as_2d(arr_y)
+    count, (sx, sy, _, _, sxy), _, _, _ = _pair_moments(x, y, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = (sxy - sx * sy / count) / (count - ddof)
+    res[count <= ddof] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr_x)
+
+
+def rolling_corr(arr_x, arr_y, window, min_periods=None):
+    window, min_periods = _check_window(window, min_periods)
+    x, y = _as_2d(arr_x), _as_2d(arr_y)
+    count, (sx, sy, sxx, syy, sxy), cx, cy, valid = _pair_moments(x, y, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cov = sxy - sx * sy / count
+        var_x = np.maximum(sxx - sx * sx / count, 0.0)
+        var_y = np.maximum(syy - sy * sy / count, 0.0)
+        res = np.clip(cov / np.sqrt(var_x * var_y), -1.0, 1.0)
+    constant = _is_constant(x, valid, window, var_x, cx) | _is_constant(y, valid, window, var_y, cy)
+    res[constant | (count < 2)] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr_x)
+
+
+def _full_windows(x, window):
+    """
+    Read-only strided view of shape (n_rows, window, n_cols): rows of the window ending at each row.
+    x is padded with NaN on the top, so that the first window - 1 rows have windows too.
+
+    """
+    n, m = x.shape
+    padded = np.full((n + window - 1, m), np.nan)
+    padded[window - 1:] = x
+    s0, s1 = padded.strides
+    return as_strided(padded, shape=(n, window, m), strides=(s0, s0, s1), writeable=False)
+
+
+def rolling_rank(arr, window, min_periods=None, pct=True, method='average'):
+    """
+    Rank of the last value in its window, among valid values of the window.
+
+    Parameters
+    ----------
+    pct : bool
+        If True, divide ranks by the number of valid values, so that they range from 0.0 to 1.0.
+    method : {'average', 'max'}
+        Rank of the last value if earlier values of the window are equal to it:
+        'average' gives the average rank of equal values (as pandas),
+        'max' ranks the last value after equal earlier values (as a stable sort of the window).
+
+    """
+    if method not in ('average', 'max'):
+        raise ValueError("method = {}".format(method))
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    windows = _full_windows(np.where(valid, x, np.nan), window)
+
+    res = np.empty(x.shape)
+    n_rows = max(_CHUNK_ELEMENTS // max(window * x.shape[1], 1), 1)
+    for start in range(0, len(x), n_rows):
+        w = windows[start: start + n_rows]
+        last = w[:, -1:, :]
+        n_equal = (w == last).sum(axis=1)
+        if method == 'average':
+            res[start: start + n_rows] = (w < last).sum(axis=1) + (n_equal + 1) / 2.0
+        else:
+            res[start: start + n_rows] = (w < last).sum(axis=1) + n_equal
+    if pct:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            res = res / count
+    res[~valid] = np.nan
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_decay_linear(arr, window, min_periods=None):
+    """Weighted mean with weights 1, 2, ..., window from the oldest value to the latest one."""
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    centered, mean = _center(x, valid)
+    # sum of (i - t + window) * x_i over window ending at t is sum(i * x_i) - (t - window) * sum(x_i)
+    row = np.arange(len(x), dtype=np.float64).reshape(-1, 1)
+    offset = row - window
+    weight = valid.astype(np.float64)
+    numerator = _window_sum(row * centered, window) - offset * _window_sum(centered, window)
+    denominator = _window_sum(row * weight, window) - offset * _window_sum(weight, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = numerator / denominator + mean
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def _exp_window_sum(x, factor, window):
+    """Sum of factor ** (t - i) * x_i over windows ending at each row t, by recurrence. 0 < factor <= 1."""
+    acc = np.empty(x.shape)
+    acc[0] = x[0]
+    for i in range(1, len(x)):
+        acc[i] = factor * acc[i - 1] + x[i]
+    if window < len(x):
+        acc[window:] = acc[window:] - factor ** window * acc[:-window]
+    return acc
+
+
+def rolling_decay_exp(arr, factor, window, min_periods=None):
+    """Weighted mean with weights factor ** (window - 1), ..., factor, 1 from the oldest value to the latest one."""
+    window, min_periods = _check_window(window, min_periods)
+    factor = float(factor)
+    if factor <= 0:
+        raise ValueError("factor must be positive, got {}.".format(factor))
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    centered, mean = _center(x, valid)
+    weight = valid.astype(np.float64)
+
+    if factor <= 1:
+        numerator = _exp_window_sum(centered, factor, window)
+        denominator = _exp_window_sum(weight, factor, window)
+    else:
+        # the recurrence would overflow, use windows directly
+        weights = factor ** np.arange(window - 1, -1, -1, dtype=np.float64)
+        numerator, denominator = np.empty(x.shape), np.empty(x.shape)
+        n_rows = max(_CHUNK_ELEMENTS // max(window * x.shape[1], 1), 1)
+        win_x, win_w = _full_windows(centered, window), _full_windows(weight, window)
+        for start in range(0, len(x), n_rows):
+            sl = slice(start, start + n_rows)
+            numerator[sl] = np.einsum('ijk,j->ik', np.nan_to_num(win_x[sl]), weights)
+            denominator[sl] = np.einsum('ijk,j->ik', np.nan_to_num(win_w[sl]), weights)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        res = numerator / denominator + mean
+    return _restore(_finalize(res, count, min_periods), arr)
+
+
+def rolling_product(arr, window, min_periods=None):
+    """Product of valid values, from window sums of log absolute values, counts of zeros and negative values."""
+    window, min_periods = _check_window(window, min_periods)
+    x = _as_2d(arr)
+    valid, count = _valid_count(x, window)
+    x = np.where(valid, x, 1.0)
+    is_zero = x == 0
+    n_zeros = _window_sum(is_zero, window, dtype=np.int32)
+    n_negative = _window_sum(x < 0, window, dtype=np.int32)
+    res = np.exp(_window_sum(np.log(np.abs(np.where(is_zero, 1.0, x))), window))
+    res[n_negative % 2 == 1] *= -1
+    res[n_zeros > 0] = 0.0
+    return _restore(_finalize(res, count, min_periods), arr)
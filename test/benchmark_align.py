@@ -0,0 +1,44 @@
+# encoding: utf-8
+"""
+Compare jaqs.data.align with the previous implementation, which looks up every date in a loop.
+
+Run: python benchmark_align.py [n_quarters] [n_securities] [n_days] [n_fields]
+
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data.align import align_many, _align_loop
+
+
+def benchmark(n_quarters=40, n_securities=3000, n_days=3700, n_fields=1):
+    """Compare align with the previous loop implementation on random data."""
+    rs = np.random.RandomState(369)
+    report_dates = np.arange(n_quarters) * 91 + 20000000
+    ann = report_dates.reshape(-1, 1) + rs.randint(20, 120, size=(n_quarters, n_securities))
+    df_ann = pd.DataFrame(ann.astype(float))
+    df_ann.values[rs.rand(*ann.shape) < 0.05] = np.nan
+    df_values = [pd.DataFrame(rs.rand(n_quarters, n_securities)) for _ in range(n_fields)]
+    date_arr = np.sort(rs.randint(report_dates[0], report_dates[-1] + 200, size=n_days))
+    
+    t = time.time()
+    res = align_many(df_values, df_ann, date_arr)
+    t_new = time.time() - t
+    
+    t = time.time()
+    res_old = [_align_loop(df, df_ann, date_arr) for df in df_values]
+    t_old = time.time() - t
+    
+    for df, df_old in zip(res, res_old):
+        assert np.allclose(df.values, df_old.values, equal_nan=True)
+    print("align {:d} field(s) of {:d} quarters x {:d} securities to {:d} days:".format(
+        n_fields, n_quarters, n_securities, n_days))
+    print("    loop: {:.2f}s, vectorized: {:.2f}s, {:.0f}x faster".format(t_old, t_new, t_old / t_new))
+
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:5]])
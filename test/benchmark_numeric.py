@@ -0,0 +1,49 @@
+# encoding: utf-8
+"""
+Compare cross-section rank and quantile kernels of jaqs.util.numeric with the old implementation and pandas.
+
+Run: python benchmark_numeric.py [n_dates] [n_symbols]
+
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.util import numeric
+
+
+def _time(func, n_repeats=3):
+    res = []
+    for _ in range(n_repeats):
+        t = time.time()
+        func()
+        res.append(time.time() - t)
+    return min(res)
+
+
+def benchmark(n_dates=2000, n_symbols=3000, nan_ratio=0.1):
+    rs = np.random.RandomState(0)
+    mat = rs.randn(n_dates, n_symbols)
+    mat_nan = mat.copy()
+    mat_nan[rs.rand(n_dates, n_symbols) < nan_ratio] = np.nan
+    
+    cases = [('quantile 5, no NaN', 'quantilize_without_nan', lambda: numeric.quantilize_without_nan(mat, 5),
+              'quantilize_fast', lambda: numeric.quantilize_fast(mat, 5)),
+             ('quantile 5, with NaN', 'quantilize_without_nan', lambda: numeric.quantilize_without_nan(mat_nan, 5),
+              'quantilize_fast', lambda: numeric.quantilize_fast(mat_nan, 5)),
+             ('pct rank, with NaN', 'pd.DataFrame.rank', lambda: pd.DataFrame(mat_nan).rank(axis=1, pct=True),
+              'rank_without_nan', lambda: numeric.rank_without_nan(mat_nan, pct=True)),
+             ('pct rank float32', 'pd.DataFrame.rank', lambda: pd.DataFrame(mat_nan).rank(axis=1, pct=True),
+              'rank_without_nan', lambda: numeric.rank_without_nan(mat_nan, pct=True, dtype=np.float32))]
+    print("{} dates x {} symbols".format(n_dates, n_symbols))
+    for name, old_name, old_func, new_name, new_func in cases:
+        t_old, t_new = _time(old_func), _time(new_func)
+        print("{:24s} {:24s} {:.3f}s  {:20s} {:.3f}s  x{:.1f}".format(name, old_name, t_old, new_name, t_new,
+                                                                       t_old / t_new))
+
+
+if __name__ == "__main__":
+    benchmark(*[int(arg) for arg in sys.argv[1:3]])
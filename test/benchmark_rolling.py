@@ -0,0 +1,77 @@
+# encoding: utf-8
+"""
+Compare rolling window kernels of jaqs.util.rolling with the pandas implementations they replace.
+
+Run: python benchmark_rolling.py [n_dates] [n_symbols] [window]
+
+"""
+from __future__ import print_function
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.util.rolling import (rolling_sum, rolling_mean, rolling_std, rolling_min, rolling_max, rolling_skew,
+                               rolling_kurt, rolling_corr, rolling_cov, rolling_rank, rolling_decay_linear,
+                               rolling_decay_exp, rolling_product)
+
+
+def benchmark(shape=(3000, 3700), window=20, nan_ratio=0.05, n_sample_columns=100):
+    """
+    Print time of each kernel and of the pandas implementation it replaces, on a random panel.
+    Implementations calling a Python function per window are timed on n_sample_columns columns
+    and scaled to the full panel.
+
+    """
+    rs = np.random.RandomState(0)
+    arr = 10 + rs.randn(*shape)
+    arr[rs.rand(*shape) < nan_ratio] = np.nan
+    arr2 = 10 + rs.randn(*shape)
+    df, df2 = pd.DataFrame(arr), pd.DataFrame(arr2)
+    roll = df.rolling(window)
+    roll_sample = df.iloc[:, :n_sample_columns].rolling(window)
+    linear = np.arange(1, window + 1, dtype=np.float64)
+    exp = 0.9 ** np.arange(window - 1, -1, -1, dtype=np.float64)
+
+    def rank_last(a):
+        return (np.argsort(np.argsort(a, kind='mergesort'))[-1] + 1.0) / window
+
+    # (name, kernel, pandas implementation, whether pandas is timed on sample columns)
+    cases = [('sum', lambda: rolling_sum(arr, window), lambda: roll.sum(), False),
+             ('mean', lambda: rolling_mean(arr, window), lambda: roll.mean(), False),
+             ('std', lambda: rolling_std(arr, window), lambda: roll.std(), False),
+             ('min', lambda: rolling_min(arr, window), lambda: roll.min(), False),
+             ('max', lambda: rolling_max(arr, window), lambda: roll.max(), False),
+             ('skew', lambda: rolling_skew(arr, window), lambda: roll.skew(), False),
+             ('kurt', lambda: rolling_kurt(arr, window), lambda: roll.kurt(), False),
+             ('corr', lambda: rolling_corr(arr, arr2, window), lambda: roll.corr(df2), False),
+             ('cov', lambda: rolling_cov(arr, arr2, window), lambda: roll.cov(df2), False),
+             ('rank', lambda: rolling_rank(arr, window, method='max'),
+              lambda: roll_sample.apply(rank_last, raw=True), True),
+             ('decay_linear', lambda: rolling_decay_linear(arr, window),
+              lambda: roll_sample.apply(lambda a: np.dot(a, linear) / linear.sum(), raw=True), True),
+             ('decay_exp', lambda: rolling_decay_exp(arr, 0.9, window),
+              lambda: roll_sample.apply(lambda a: np.dot(a, exp) / exp.sum(), raw=True), True),
+             ('product', lambda: rolling_product(arr, window), lambda: roll_sample.apply(np.prod, raw=True), True)]
+
+    print("Window {:d} on {:d} x {:d} panel, seconds:".format(window, shape[0], shape[1]))
+    print("{:15s}{:>10s}{:>10s}{:>10s}".format('kernel', 'rolling', 'pandas', 'speedup'))
+    for name, func, func_pd, sample in cases:
+        t0 = time.time()
+        func()
+        t_kernel = time.time() - t0
+        t0 = time.time()
+        func_pd()
+        t_pd = time.time() - t0
+        if sample:
+            t_pd = t_pd * shape[1] / n_sample_columns
+        print("{:15s}{:10.3f}{:10.3f}{:10.1f}".format(name, t_kernel, t_pd, t_pd / t_kernel))
+
+
+if __name__ == "__main__":
+    args = [int(arg) for arg in sys.argv[1:4]]
+    if len(args) >= 2:
+        benchmark(shape=tuple(args[:2]), window=args[2] if len(args) > 2 else 20)
+    else:
+        benchmark()
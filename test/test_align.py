@@ -1,7 +1,9 @@
 # encoding: utf-8
 from __future__ import print_function
+import numpy as np
 import pandas as pd
 from jaqs.data import RemoteDataService
+from jaqs.data.align import align, align_many, _align_loop
 from jaqs.data import Parser
 import jaqs.util as jutil
 
@@ -61,6 +63,33 @@ def test_align():
     assert abs(df_res.loc[20170427, sec] - 42360000000) < 1
 
 
+
+def test_align_vectorized():
+    rs = np.random.RandomState(369)
+    n_quarters, n_securities = 12, 50
+    report_dates = np.arange(n_quarters) * 91 + 20150000
+    # announcement dates are not always increasing, eg. a report is delayed
+    ann = report_dates.reshape(-1, 1) + rs.randint(20, 200, size=(n_quarters, n_securities))
+    df_ann = pd.DataFrame(ann.astype(float))
+    df_ann.values[rs.rand(*ann.shape) < 0.1] = np.nan
+    df_ann.iloc[:, 0] = np.nan
+    df_value = pd.DataFrame(rs.rand(n_quarters, n_securities))
+    df_value.values[rs.rand(*ann.shape) < 0.1] = np.nan
+    date_arr = np.arange(report_dates[0] - 10, report_dates[-1] + 300, 7)
+    
+    df_res = align(df_value, df_ann, date_arr)
+    df_old = _align_loop(df_value, df_ann, date_arr)
+    assert np.all(df_res.index == df_old.index) and np.all(df_res.columns == df_old.columns)
+    assert np.allclose(df_res.values, df_old.values, equal_nan=True)
+    assert np.all(np.isnan(df_res.values[:, 0]))
+    
+    df_code = pd.DataFrame(rs.randint(0, 5, size=ann.shape).astype(str).astype(object))
+    res_float, res_code = align_many([df_value, df_code], df_ann, date_arr)
+    assert res_float.equals(df_res)
+    old_code = _align_loop(df_code, df_ann, date_arr)
+    assert np.all(res_code.fillna('nan').values == old_code.fillna('nan').values)
+
+
 if __name__ == "__main__":
     import time
     t_start = time.time()
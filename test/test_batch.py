@@ -0,0 +1,62 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import Parser
+from jaqs.data.batch import BatchEvaluator
+
+
+def _data():
+    rs = np.random.RandomState(5)
+    index = np.arange(20170101, 20170131)
+    columns = ['000001.SZ', '000063.SZ', '600030.SH', '600519.SH']
+    close = pd.DataFrame(10 + rs.rand(30, 4), index=index, columns=columns)
+    volume = pd.DataFrame(rs.rand(30, 4) * 1000, index=index, columns=columns)
+    sector = pd.DataFrame(np.array(['a', 'b'], dtype=object)[rs.randint(0, 2, size=(30, 4))],
+                          index=index, columns=columns)
+    return {'close': close, 'volume': volume, 'sector': sector}
+
+
+def test_split_tasks():
+    evaluator = BatchEvaluator(n_processes=2)
+    formulas = [('a', 'Rank(close)'), ('b', 'Ts_Mean(volume, 3)'), ('c', 'a + 1'), ('d', 'c * b'),
+                ('e', 'Delta(close, 1)')]
+    tasks = evaluator.split_tasks(formulas)
+    assert [[name for name, _ in task] for task in tasks] == [['a', 'b', 'c', 'd'], ['e']]
+
+
+def test_batch_evaluate():
+    values = _data()
+    formulas = [('a', 'Rank(Ts_Mean(close, 3))'), ('b', 'GroupRank(volume, sector)'), ('c', 'a * Delay(close, 1)'),
+                ('d', 'Correlation(close, volume, 5)')]
+    shm_dir = tempfile.mkdtemp()
+    for n_processes in [1, 2]:
+        evaluator = BatchEvaluator(n_processes=n_processes, shm_dir=shm_dir)
+        dic = evaluator.evaluate(dict(formulas), values)
+        assert list(dic.keys()) == ['a', 'b', 'c', 'd']
+        
+        parser = Parser()
+        parser.parse('Rank(Ts_Mean(close, 3)) * Delay(close, 1)')
+        expected = parser.evaluate(values)
+        assert np.allclose(dic['c'].values, expected.values, equal_nan=True)
+        assert dic['c'].index.equals(expected.index) and dic['c'].columns.equals(expected.columns)
+        parser.parse('GroupRank(volume, sector)')
+        assert np.allclose(dic['b'].values, parser.evaluate(values).values, equal_nan=True)
+        # shared files are removed
+        assert os.listdir(shm_dir) == []
+    os.rmdir(shm_dir)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
@@ -0,0 +1,183 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import RemoteDataService
+from jaqs.data.cache import QueryCache, ExprCache
+
+
+def test_cache_key():
+    key = QueryCache.make_key('daily', symbol='600030.SH,000001.SZ', fields='close,open', start_date=20170101)
+    key2 = QueryCache.make_key('daily', start_date=np.int64(20170101), fields='open, close',
+                               symbol='000001.SZ,600030.SH')
+    assert key == key2
+    assert key != QueryCache.make_key('bar', symbol='600030.SH,000001.SZ', fields='close,open', start_date=20170101)
+    assert key != QueryCache.make_key('daily', symbol='600030.SH,000001.SZ', fields='close,open', start_date=20170102)
+
+    key = QueryCache.make_key('query', view='jz.secTradeCal', filter='start_date=1&end_date=2', fields='')
+    key2 = QueryCache.make_key('query', view='jz.secTradeCal', filter='end_date=2&start_date=1', fields='')
+    assert key == key2
+
+
+def test_cache_put_get_evict():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = QueryCache(folder)
+        df = pd.DataFrame(np.random.rand(100, 10))
+        cache.put('a', (df, '0,'))
+        res, msg = cache.get('a')
+        assert msg == '0,' and res.equals(df)
+        assert cache.get('b') is None
+        size_one = cache.size
+
+        # size is restored from files when re-opened
+        cache = QueryCache(folder, max_size=int(size_one * 2.5))
+        assert cache.size == size_one and 'a' in cache
+
+        cache.put('b', (df, '0,'))
+        # make 'a' the most recently used
+        os.utime(os.path.join(folder, 'b' + QueryCache.SUFFIX), (time.time() - 10, time.time() - 10))
+        cache.get('a')
+        cache.put('c', (df, '0,'))
+        assert len(cache) == 2
+        assert 'a' in cache and 'c' in cache and 'b' not in cache
+        assert cache.size <= cache.max_size
+
+        cache.clear()
+        assert len(cache) == 0 and cache.size == 0
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_expr_cache():
+    folder = tempfile.mkdtemp()
+    try:
+        cache = ExprCache(folder)
+        arr = np.random.rand(100, 10)
+        cache.put('a', arr)
+        res = cache.get('a')
+        assert isinstance(res, np.memmap) and np.array_equal(res, arr)
+        del res
+        size_one = cache.size
+
+        cache = ExprCache(folder, max_size=int(size_one * 1.5))
+        cache.put('b', arr * 2)
+        assert len(cache) == 1 and 'b' in cache
+
+        try:
+            cache.put('c', np.array(['a', 'b'], dtype=object))
+            assert False
+        except ValueError:
+            pass
+        assert 'c' not in cache
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_remote_data_service_cache():
+    folder = tempfile.mkdtemp()
+    ds = RemoteDataService()
+    data_api, cache = ds.data_api, ds.cache
+    try:
+        ds.data_api = None
+        ds.init_from_config({'cache.path': folder})
+        df = pd.DataFrame({'symbol': ['600030.SH'], 'trade_date': [20170104], 'close': [16.5]})
+        key = ds.cache.make_key('daily', symbol='600030.SH', start_date=20170101, end_date=20170105,
+                                fields='close', adjust_mode=None)
+        ds.cache.put(key, (df, '0,'))
+
+        # answered by cache without login
+        res, msg = ds.daily('600030.SH', 20170101, 20170105, fields='close')
+        assert msg == '0,' and res.equals(df)
+    finally:
+        ds.data_api, ds.cache = data_api, cache
+        shutil.rmtree(folder)
+
+
+class _FakeDataApi(object):
+    """Answer daily with one row per month, fail for dates in fail_years."""
+    def __init__(self):
+        self.calls = []
+        self.fail_years = set()
+
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None, data_format=""):
+        self.calls.append((start_date, end_date))
+        if start_date // 10000 in self.fail_years:
+            raise IOError("connection lost")
+        dates = [d for d in range(start_date // 100, end_date // 100 + 1) if 1 <= d % 100 <= 12]
+        dates = [d * 100 + 15 for d in dates if start_date <= d * 100 + 15 <= end_date]
+        df = pd.DataFrame({'symbol': symbol, 'trade_date': dates, 'close': np.arange(len(dates), dtype=float)})
+        return df, '0,'
+
+
+def test_remote_data_service_cache_chunks():
+    folder = tempfile.mkdtemp()
+    ds = RemoteDataService()
+    data_api, cache, ttl = ds.data_api, ds.cache, ds.cache_ttl
+    try:
+        api = _FakeDataApi()
+        ds.data_api = api
+        ds.set_cache(folder)
+
+        # the query fails in its last chunk, finished chunks are kept
+        api.fail_years = {2017}
+        try:
+            ds.daily('600030.SH', 20150301, 20170630, fields='close')
+            assert False
+        except IOError:
+            pass
+        assert api.calls == [(20150301, 20151231), (20160101, 20161231), (20170101, 20170630)]
+
+        api.fail_years, api.calls = set(), []
+        df, msg = ds.daily('600030.SH', 20150301, 20170630, fields='close')
+        assert api.calls == [(20170101, 20170630)]
+        assert list(df['trade_date']) == [d * 100 + 15 for d in range(201503, 201707) if 1 <= d % 100 <= 12]
+        assert list(df.columns) == ['symbol', 'trade_date', 'close']
+
+        # chunks are shared by a query of another date range
+        api.calls = []
+        ds.daily('600030.SH', 20160101, 20170630, fields='close')
+        assert api.calls == []
+
+        # results reaching today may change, they expire after cache_ttl seconds
+        today = int(time.strftime('%Y%m%d'))
+        api.calls = []
+        ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        assert len(api.calls) == 1
+        ds.cache_ttl = 0
+        ds.cache.clear()
+        ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        assert len(api.calls) == 3 and len(ds.cache) == 0
+
+        # expired results are used when not logged in
+        ds.cache_ttl = 3600.0
+        ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        key = ds.cache.make_key('daily', symbol='600030.SH', start_date=today // 10000 * 10000 + 101,
+                                end_date=today, fields='close', adjust_mode=None)
+        df, msg, _ = ds.cache.get(key)
+        ds.cache.put(key, (df, msg, time.time() - 1))
+        ds.data_api = None
+        res, _ = ds.daily('600030.SH', today // 10000 * 10000 + 101, today, fields='close')
+        assert res.equals(df)
+    finally:
+        ds.data_api, ds.cache, ds.cache_ttl = data_api, cache, ttl
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
@@ -1,8 +1,14 @@
 # encoding: utf-8
 
+import os
+import shutil
+import tempfile
 import datetime
 
-from jaqs.data import RemoteDataService
+import numpy as np
+import pandas as pd
+
+from jaqs.data import RemoteDataService, Calendar
 import jaqs.util as jutil
 
 from config_path import DATA_CONFIG_PATH
@@ -43,6 +49,118 @@ def test_dtutil():
         assert datetime.datetime.strptime(str(monthly), "%Y%m%d").weekday() < 5
 
 
+def _trade_dates(start_date=20161201, end_date=20180131):
+    """Weekdays, except Spring Festival holidays of 2017."""
+    dates = np.array([int(d.strftime('%Y%m%d')) for d in pd.bdate_range(str(start_date), str(end_date))])
+    return dates[(dates < 20170127) | (dates > 20170202)]
+
+
+def test_calendar_local():
+    dates = _trade_dates()
+    cal = Calendar(dates[::-1], end_date=20180228)
+    assert cal.covers(20170101, 20180228) and not cal.covers(20161130, 20170101)
+    
+    assert cal.is_trade_date(20170103) and not cal.is_trade_date(20170101) and not cal.is_trade_date(20170130)
+    assert np.all(cal.is_trade_date(dates)) and not cal.is_trade_date(np.array([20170107, 20170108])).any()
+    assert np.all(cal.get_trade_date_range(20170101, 20170228) == dates[(dates >= 20170101) & (dates <= 20170228)])
+    assert len(cal.get_trade_date_range(20170128, 20170202)) == 0
+    assert cal.get_next_trade_date(20170126) == 20170203 and cal.get_next_trade_date(20170129) == 20170203
+    assert cal.get_last_trade_date(20170203) == 20170126 and cal.get_last_trade_date(20170205) == 20170203
+    try:
+        cal.get_next_trade_date(20180131)
+        assert False
+    except IndexError:
+        pass
+    
+    # shift is the same as counting in the array
+    sample = dates[10:-10]
+    for n in [-3, -1, 1, 5]:
+        idx = np.searchsorted(dates, sample) + n
+        assert np.all(cal.shift(sample, n) == dates[idx])
+    assert np.all(cal.shift(np.array([20170128, 20170101]), 0) == [20170203, 20170102])
+    assert cal.shift(20170128, -1) == 20170126
+    
+    assert cal.period_start(20170215, 'month') == 20170203 and cal.period_end(20170215, 'month') == 20170228
+    assert np.all(cal.period_start(np.array([20170131, 20170405]), 'quarter') == [20170102, 20170403])
+    assert cal.period_end(20170201, 'week') == 20170203 and cal.period_start(20170201, 'week') == 20170203
+    assert cal.period_start(20170130, 'day') == 0
+    assert list(cal.get_period_ends(20170101, 20180131, 'year')) == [20171229]
+    month_ends = cal.get_period_ends(20170101, 20180131, 'month')
+    assert len(month_ends) == 13 and month_ends[0] == 20170126 and month_ends[-1] == 20180131
+    assert len(Calendar(dates).get_period_ends(20170101, 20180131, 'month')) == 12
+
+
+def test_remote_data_service_calendar():
+    folder = tempfile.mkdtemp()
+    ds = RemoteDataService()
+    data_api, cache, calendar = ds.data_api, ds.cache, ds._calendar
+    try:
+        ds.data_api, ds._calendar = None, None
+        path = os.path.join(folder, 'cal.npz')
+        today = jutil.convert_datetime_to_int(datetime.datetime.now())
+        Calendar(_trade_dates(), start_date=20161201, end_date=today // 10000 * 10000 + 1231).save(path)
+        ds.init_from_config({'cache.path': folder, 'calendar.path': path})
+        
+        # answered by the calendar without login
+        assert len(ds.calendar) == len(_trade_dates())
+        assert ds.get_next_trade_date(20170126) == 20170203
+        assert ds.get_last_trade_date(20170203) == 20170126
+        assert not ds.is_trade_date(20170130)
+        assert len(ds.get_trade_date_range(20170101, 20170131)) == 19
+    finally:
+        ds.data_api, ds.cache, ds._calendar, ds.calendar_path = data_api, cache, calendar, ""
+        shutil.rmtree(folder)
+
+
+class _FakeDataApi(object):
+    """Answer jz.secTradeCal with weekdays till published_end."""
+    def __init__(self, published_end):
+        self.published_end = published_end
+        self.calls = []
+
+    def query(self, view, fields="", filter="", orderby="", data_format=""):
+        dic = dict([part.split('=') for part in filter.split('&')])
+        start, end = int(dic['start_date']), min(int(dic['end_date']), self.published_end)
+        self.calls.append((start, end))
+        dates = pd.bdate_range(str(start), str(end)) if end >= start else []
+        return pd.DataFrame({'trade_date': [jutil.convert_datetime_to_int(d) for d in dates]}), '0,'
+
+
+def test_remote_data_service_calendar_end():
+    ds = RemoteDataService()
+    saved = ds.data_api, ds.cache, ds._calendar, ds._calendar_query_date
+    try:
+        today = jutil.convert_datetime_to_int(datetime.datetime.now())
+        end_of_year = today // 10000 * 10000 + 1231
+        api = _FakeDataApi(end_of_year)
+        ds.data_api, ds.cache, ds._calendar, ds._calendar_query_date = api, None, None, 0
+
+        # the calendar ends on the last published trade date, not on the requested end
+        cal = ds.calendar
+        assert len(api.calls) == 1
+        assert cal.end_date == cal.dates[-1] <= end_of_year
+        assert not cal.covers(end_of_year + 10000)
+
+        # dates after it are asked to the server, the calendar is not loaded again
+        next_year = (today // 10000 + 1) * 10000 + 101
+        assert len(ds.get_trade_date_range(next_year, next_year + 30)) == 0
+        assert len(api.calls) == 2 and ds.calendar is cal
+
+        # an outdated calendar is loaded again, at most once a day
+        ds._calendar, ds._calendar_query_date = Calendar(cal.dates[:-300]), 0
+        api.published_end = 20170131
+        ds.get_trade_date_range(next_year, next_year + 30)
+        ds.get_trade_date_range(next_year, next_year + 30)
+        assert api.calls[2] == (RemoteDataService.CALENDAR_START_DATE, 20170131)
+        assert len(api.calls) == 5
+        assert ds.calendar.end_date == 20170131
+    finally:
+        ds.data_api, ds.cache, ds._calendar, ds._calendar_query_date = saved
+
+
 if __name__ == "__main__":
     test_calendar()
     test_dtutil()
+    test_calendar_local()
+    test_remote_data_service_calendar()
+    test_remote_data_service_calendar_end()
@@ -0,0 +1,267 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import DataView
+
+SYMBOLS = ['000001.SZ', '000063.SZ', '600030.SH']
+
+
+class _LocalDataService(object):
+    """Serve fixed random daily data, so that DataView.extend can be tested without data server."""
+    def __init__(self):
+        self.dates = np.array([int(d.strftime('%Y%m%d')) for d in pd.bdate_range('20161001', '20170331')])
+        rs = np.random.RandomState(369)
+        shape = (len(self.dates), len(SYMBOLS))
+        self.data = {'close': pd.DataFrame(10 + rs.rand(*shape), index=self.dates, columns=SYMBOLS),
+                     'volume': pd.DataFrame(rs.randint(1, 1000, size=shape).astype(float),
+                                            index=self.dates, columns=SYMBOLS),
+                     'adjust_factor': pd.DataFrame(1 + rs.rand(*shape), index=self.dates, columns=SYMBOLS)}
+
+    def get_trade_date_range(self, start_date, end_date):
+        return self.dates[(self.dates >= start_date) & (self.dates <= end_date)]
+
+    def _select(self, field, start_date, end_date, symbol=None):
+        df = self.data[field]
+        if symbol is not None:
+            df = df.loc[:, symbol.split(',')]
+        return df.loc[(df.index >= start_date) & (df.index <= end_date)]
+
+    def daily(self, symbol, start_date, end_date, fields="", adjust_mode=None):
+        dic = dict()
+        for field in fields.split(','):
+            if field in self.data:
+                dic[field] = self._select(field, start_date, end_date, symbol=symbol).stack()
+        df = pd.DataFrame(dic)
+        df.index.names = ['trade_date', 'symbol']
+        df = df.reset_index()
+        df.loc[:, 'trade_status'] = u'交易'
+        return df, '0,'
+
+    def query_inst_info(self, symbol, inst_type="", fields=""):
+        return pd.DataFrame(index=pd.Index(symbol.split(','), name='symbol'), data={'inst_type': 1})
+
+    def get_adj_factor_daily(self, symbol, start_date, end_date, div=False):
+        return self._select('adjust_factor', start_date, end_date, symbol=symbol)
+
+
+def _prepare(ds, end_date, storage='frame', **kwargs):
+    dv = DataView()
+    props = {'start_date': 20170105, 'end_date': end_date, 'symbol': ','.join(SYMBOLS),
+             'fields': 'close,volume', 'freq': 1, 'all_price': False, 'storage': storage}
+    props.update(kwargs)
+    dv.init_from_config(props, data_api=ds)
+    dv.prepare_data()
+    dv.add_formula('ret', 'Delta(close, 2) / Delay(close, 1)', is_quarterly=False, within_index=False)
+    dv.add_formula('ts_rank', 'Delta(ret, 3) + Rank(volume)', is_quarterly=False, within_index=False)
+    dv.add_formula('ewma', 'Ewma(close, 2)', is_quarterly=False, within_index=False)
+    return dv
+
+
+def _assert_same_data(dv, dv_full, rtol=1e-5, atol=1e-8):
+    assert np.all(dv.dates == dv_full.dates)
+    for field in ['close', 'volume', 'adjust_factor', 'ret', 'ts_rank', 'ewma']:
+        arr = dv.get_ts(field, start_date=dv.dates[0]).values
+        arr_full = dv_full.get_ts(field, start_date=dv_full.dates[0]).values
+        assert np.allclose(arr, arr_full, rtol=rtol, atol=atol, equal_nan=True)
+    status = dv.get_ts('trade_status', start_date=dv.dates[0]).values
+    assert np.all(status == dv_full.get_ts('trade_status', start_date=dv_full.dates[0]).values)
+
+
+def test_extend():
+    ds = _LocalDataService()
+    dv_full = _prepare(ds, 20170228)
+
+    for storage in ['frame', 'dense', 'field']:
+        dv = _prepare(ds, 20170210, storage=storage)
+        assert dv.extend(20170228)
+        assert dv.end_date == 20170228
+        _assert_same_data(dv, dv_full)
+
+    dv = _prepare(ds, 20170210, storage='dense', dtype_policy='compact')
+    assert dv.extend(20170228)
+    assert dv.panel_d.values.dtype == np.float32
+    _assert_same_data(dv, dv_full, atol=1e-6)
+
+
+def test_prepare_chunked():
+    ds = _LocalDataService()
+    dv_full = _prepare(ds, 20170228)
+    # 2 symbol chunks by 8 date chunks
+    dv = _prepare(ds, 20170228, chunk_size=2, chunk_days=15, n_workers=3)
+    _assert_same_data(dv, dv_full)
+
+    dv = _prepare(ds, 20170210, chunk_size=1, chunk_days=7)
+    assert dv.extend(20170228)
+    _assert_same_data(dv, dv_full)
+
+
+def test_extend_loaded():
+    ds = _LocalDataService()
+    dv_full = _prepare(ds, 20170228)
+
+    folder = tempfile.mkdtemp()
+    try:
+        _prepare(ds, 20170210).save_dataview(folder, file_format='npy')
+        dv = DataView()
+        dv.load_dataview(folder)
+        assert len(dv.custom_formulas) == 3
+        assert dv.extend(20170228, data_api=ds)
+        _assert_same_data(dv, dv_full)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_add_formulas():
+    ds = _LocalDataService()
+    formulas = [('ret2', 'Delta(close, 2) / Delay(close, 1)'),
+                ('ret2_rank', 'Rank(ret2) + Rank(Delay(close, 1))')]
+    dv_full = _prepare(ds, 20170228)
+    for field_name, formula in formulas:
+        dv_full.add_formula(field_name, formula, is_quarterly=False, within_index=False)
+    
+    for storage, n_processes in [('frame', 1), ('sharded', 1), ('frame', 2), ('dense', 2)]:
+        folder = tempfile.mkdtemp()
+        try:
+            dv = _prepare(ds, 20170228, storage=storage, shard_path=os.path.join(folder, 'a'))
+            dv.add_formulas(formulas, is_quarterly=False, within_index=False, n_processes=n_processes)
+            assert [dic['field_name'] for dic in dv.custom_formulas] == ['ret', 'ts_rank', 'ewma', 'ret2', 'ret2_rank']
+            for field_name, _ in formulas:
+                assert np.allclose(dv.get_ts(field_name).values, dv_full.get_ts(field_name).values, equal_nan=True)
+        finally:
+            shutil.rmtree(folder)
+
+
+def test_add_formula_date_range():
+    ds = _LocalDataService()
+    dv = _prepare(ds, 20170228)
+    dates = dv.dates
+    start_date = dates[-10]
+    formula = 'Delta(Ts_Mean(close, 5), 2) / Delay(close, 1) + Rank(volume)'
+    dv.add_formula('full', formula, is_quarterly=False, within_index=False)
+    dv.add_formula('part', formula, is_quarterly=False, within_index=False, start_date=start_date)
+    dv.add_formulas([('part2', formula)], is_quarterly=False, within_index=False, start_date=start_date,
+                    chunk_size=3)
+    dv.add_formula('chunked', formula, is_quarterly=False, within_index=False, chunk_size=7)
+    dv.add_formula('threaded', formula, is_quarterly=False, within_index=False, n_threads=3)
+    
+    df_full = dv.get_ts('full')
+    assert np.allclose(dv.get_ts('chunked').values, df_full.values, equal_nan=True)
+    assert dv.get_ts('threaded').equals(df_full)
+    for name in ['part', 'part2']:
+        df = dv.get_ts(name)
+        assert df.index.equals(df_full.index)
+        assert df.loc[:dates[-11]].isnull().all().all()
+        assert np.allclose(df.loc[start_date:].values, df_full.loc[start_date:].values)
+
+
+def test_add_formula_profiler():
+    from jaqs.data import ExprProfiler
+    
+    ds = _LocalDataService()
+    profiler = ExprProfiler()
+    dv = _prepare(ds, 20170228)
+    dv.add_formula('alpha', 'Rank(Delta(close, 2))', is_quarterly=False, within_index=False, profiler=profiler)
+    dv.add_formulas([('alpha2', 'Rank(Delta(close, 2)) * volume')], is_quarterly=False, within_index=False,
+                    profiler=profiler)
+    df = profiler.report()
+    assert set(df['outputs']) == {'', 'result', 'alpha2'}
+    shape = dv.get_ts('alpha', start_date=dv.extended_start_date_d).shape
+    assert (df.loc[df['op'] == 'Rank', 'shape'] == shape).all()
+
+
+def test_expr_cache():
+    ds = _LocalDataService()
+    folder = tempfile.mkdtemp()
+    try:
+        dv = _prepare(ds, 20170228, expr_cache_path=folder)
+        assert len(dv.expr_cache) == 3
+        dv.add_formula('alpha', 'Rank(Ts_Mean(close, 5))', is_quarterly=False, within_index=False)
+        assert len(dv.expr_cache) == 4
+
+        # the same formula in another style is read from cache, even if the file changed
+        dv = _prepare(ds, 20170228, expr_cache_path=folder)
+        assert len(dv.expr_cache) == 4
+        for name in os.listdir(folder):
+            arr = np.load(os.path.join(folder, name))
+            np.save(os.path.join(folder, name), np.ones_like(arr))
+        dv.add_formula('alpha', 'rank(ts_mean(close, 5))', is_quarterly=False, within_index=False,
+                       formula_func_name_style='lower')
+        dv.add_formulas([('alpha2', 'Rank(Ts_Mean(close, 5))'), ('beta', 'alpha2 * 2'),
+                         ('gamma', 'Rank(Ts_Mean(close, 5))')], is_quarterly=False, within_index=False)
+        assert len(dv.expr_cache) == 5
+        assert np.all(dv.get_ts('alpha').values == 1) and np.all(dv.get_ts('gamma').values == 1)
+        # alpha2 is used by beta, so it is evaluated again
+        assert np.allclose(dv.get_ts('beta').values, dv.get_ts('alpha2').values * 2, equal_nan=True)
+        assert not np.all(dv.get_ts('alpha2').values == 1)
+
+        # a different date range or different inputs are evaluated again
+        dv.add_formula('alpha3', 'Rank(Ts_Mean(close, 5))', is_quarterly=False, within_index=False,
+                       start_date=dv.dates[-5])
+        assert len(dv.expr_cache) == 6
+        dv.append_df(dv.get_ts('close') + 1, 'close')
+        dv.add_formula('alpha4', 'Rank(Ts_Mean(close, 5))', is_quarterly=False, within_index=False)
+        assert len(dv.expr_cache) == 7
+        assert not np.all(dv.get_ts('alpha4').values == 1)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_streaming_formula():
+    ds = _LocalDataService()
+    formula = 'Rank(Ts_Mean(close, 5)) + Delta(volume, 2) / Ewma(volume, 3)'
+    dv = _prepare(ds, 20170227)
+    expr = dv.streaming_formula(formula, within_index=False)
+    assert expr.last_date == dv.dates[-1]
+
+    dv_full = _prepare(ds, 20170228)
+    dv_full.add_formula('alpha', formula, is_quarterly=False, within_index=False)
+    date = dv_full.dates[-1]
+    row = expr.update(date, {'close': dv_full.get_ts('close').loc[date], 'volume': dv_full.get_ts('volume').loc[date]})
+    assert np.allclose(row.values, dv_full.get_ts('alpha').loc[date].values)
+
+
+def test_sharded_storage():
+    ds = _LocalDataService()
+    dv_full = _prepare(ds, 20170228)
+
+    folder = tempfile.mkdtemp()
+    try:
+        dv = _prepare(ds, 20170228, storage='sharded', shard_size=2, shard_path=os.path.join(folder, 'a'))
+        assert dv.panel_d.n_shards == 2
+        # temporary fields of formula stages are removed
+        assert sorted(dv.panel_d.fields) == sorted(dv_full.get_snapshot(20170105).columns)
+        _assert_same_data(dv, dv_full)
+        df = dv.get_snapshot(20170105, symbol='000063.SZ,600030.SH', fields='close,ts_rank')
+        df_full = dv_full.get_snapshot(20170105, symbol='000063.SZ,600030.SH', fields='close,ts_rank')
+        assert np.allclose(df.values, df_full.values)
+
+        dv = _prepare(ds, 20170210, storage='sharded', shard_size=1, shard_path=os.path.join(folder, 'b'),
+                      memory_budget=0.001)
+        assert dv.extend(20170228)
+        _assert_same_data(dv, dv_full)
+
+        dv.save_dataview(os.path.join(folder, 'saved'), file_format='npy')
+        dv = DataView()
+        dv.shard_path = os.path.join(folder, 'c')
+        dv.load_dataview(os.path.join(folder, 'saved'))
+        assert dv.storage == 'sharded'
+        _assert_same_data(dv, dv_full)
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
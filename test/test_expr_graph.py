@@ -0,0 +1,182 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data import Parser, ExprProfiler
+from jaqs.data.expr_graph import ExprGraph
+
+
+def _data():
+    rs = np.random.RandomState(7)
+    index = np.arange(20170101, 20170121)
+    columns = ['000001.SZ', '000063.SZ', '600030.SH']
+    close = pd.DataFrame(10 + rs.rand(20, 3), index=index, columns=columns)
+    volume = pd.DataFrame(rs.rand(20, 3) * 1000, index=index, columns=columns)
+    return {'close': close, 'volume': volume}
+
+
+def _counting_parser():
+    """Parser with function Counted(x), which returns x and counts how many times it is called."""
+    parser = Parser()
+    calls = []
+
+    def counted(x):
+        calls.append(1)
+        return x * 1.0
+
+    parser.register_function('Counted', counted)
+    return parser, calls
+
+
+def test_common_subexpression():
+    values = _data()
+    parser, calls = _counting_parser()
+    parser.parse('Delta(Counted(close), 1) / Delay(Counted(close), 1) + Rank(Counted(close) * volume)')
+    res = parser.evaluate(values)
+    assert len(calls) == 1
+
+    close, volume = values['close'], values['volume']
+    expected = close.diff(1) / close.shift(1) + (close * volume).rank(axis=1) / 3
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+def test_graph_shared_nodes():
+    values = _data()
+    parser, calls = _counting_parser()
+    graph = ExprGraph(parser)
+    graph.add('a', parser.parse('Rank(Counted(close) + volume)'))
+    n_nodes = len(graph)
+    # the same sub-expression with swapped operands of a commutative operator is shared
+    graph.add('b', parser.parse('Delta(volume + Counted(close), 2)'))
+    assert len(graph) == n_nodes + 2
+    # an expression can use the result of an expression added before
+    graph.add('c', parser.parse('a * 2'))
+    assert graph.names == ['a', 'b', 'c']
+    assert sorted(graph.variables()) == ['close', 'volume']
+    assert graph.to_string(graph.add('d', parser.parse('Delta(close, 2)'))) == 'Delta(close, 2)'
+
+    dic = graph.evaluate(values)
+    assert len(calls) == 1
+    assert list(dic.keys()) == ['a', 'b', 'c', 'd']
+    s = values['close'] + values['volume']
+    assert np.allclose(dic['a'].values, (s.rank(axis=1) / 3).values)
+    assert np.allclose(dic['b'].values, s.diff(2).values, equal_nan=True)
+    assert np.allclose(dic['c'].values, dic['a'].values * 2)
+
+    # only what is needed by names is evaluated
+    dic = graph.evaluate(values, names=['d'])
+    assert list(dic.keys()) == ['d'] and len(calls) == 1
+
+
+def test_graph_undefined_function():
+    parser = Parser()
+    graph = ExprGraph(parser)
+    try:
+        graph.add('a', parser.parse('Ts_Sum(volume, 5) + close'))
+        assert False
+    except Exception as e:
+        assert str(e) == 'undefined variable: Ts_Sum'
+    assert graph.names == []
+
+def test_evaluate_date_range():
+    values = _data()
+    parser = Parser()
+    graph = ExprGraph(parser)
+    graph.add('a', parser.parse('Delta(Ts_Mean(close, 3), 2) + Rank(volume)'))
+    graph.add('b', parser.parse('Ts_Rank(close, 4) * Delay(volume, 1)'))
+    assert graph.lookback() == 4
+    assert graph.lookback(['b']) == 3
+    dic_full = graph.evaluate(values)
+    dates = values['close'].index
+
+    dic = graph.evaluate(values, start_date=dates[10])
+    for name in ['a', 'b']:
+        assert list(dic[name].index) == list(dates[10:])
+        assert np.allclose(dic[name].values, dic_full[name].loc[dates[10]:].values, equal_nan=True)
+
+    # blocks of 3 dates with a halo of 4 dates give the same results
+    dic = graph.evaluate(values, chunk_size=3, trade_dts=dates.values)
+    for name in ['a', 'b']:
+        assert np.allclose(dic[name].values, dic_full[name].values, equal_nan=True)
+
+    # results which depend on the whole history are evaluated on all rows
+    parser.parse('Ewma(close, 3)')
+    res = parser.evaluate(values, start_date=dates[5], chunk_size=4)
+    assert np.allclose(res.values, values['close'].ewm(halflife=3).mean().loc[dates[5]:].values)
+
+    # Step counts rows back from the last one, so it must not be evaluated on chunks either
+    for formula in ['Step(close, 10)', 'Ts_Mean(close, 3) * Step(close, 10)']:
+        parser.parse(formula)
+        res_full = parser.evaluate(values)
+        res = parser.evaluate(values, start_date=dates[8], chunk_size=3)
+        assert np.allclose(res.values, res_full.loc[dates[8]:].values, equal_nan=True)
+
+
+def test_profiler():
+    values = _data()
+    values['close'].iloc[:5, 0] = np.nan
+    parser = Parser()
+    profiler = ExprProfiler()
+    parser.parse('Rank(Ts_Rank(close, 5)) + Corr(close, volume, 3) * 2')
+    res = parser.evaluate(values, profiler=profiler)
+    parser.parse('Ts_Rank(close, 5)')
+    parser.evaluate(values, profiler=profiler, chunk_size=10)
+
+    df = profiler.report()
+    assert list(df.columns) == ExprProfiler.COLUMNS
+    # 2 variables, 1 number (window 5) used twice, 3, 2, Ts_Rank, Rank, Corr, *, +
+    first = df.loc[df['run'] == 0]
+    assert len(first) == 10
+    assert set(df['run']) == {0, 1, 2}
+    assert first['outputs'].iloc[-1] == 'result'
+    row = first.loc[first['op'] == 'Ts_Rank'].iloc[0]
+    assert row['expr'] == 'Ts_Rank(close, 5)'
+    assert row['shape'] == res.shape and row['bytes'] == res.values.nbytes
+    assert np.isclose(row['nan_ratio'], np.isnan(parser.ts_rank(values['close'], 5).values).mean())
+
+    summary = profiler.summary()
+    assert summary.loc['Ts_Rank', 'count'] == 3
+    assert np.isclose(summary['time_ratio'].sum(), 1.0)
+
+    lines = profiler.folded().split('\n')
+    assert 'result;+;Rank;Ts_Rank;close' in [line.rsplit(' ', 1)[0] for line in lines]
+    assert all(int(line.rsplit(' ', 1)[1]) >= 0 for line in lines)
+
+
+def test_threaded():
+    values = _data()
+    parser = Parser()
+    graph = ExprGraph(parser)
+    graph.add('a', parser.parse('Corr(Rank(close), Rank(volume), 5) + Ts_Mean(close, 3) / StdDev(volume, 4)'))
+    graph.add('b', parser.parse('Rank(Ts_Rank(close, 5)) * Delta(a, 2) - Ewma(volume, 3)'))
+    expected = graph.evaluate(values)
+    for n_threads in [2, 4]:
+        dic = graph.evaluate(values, n_threads=n_threads)
+        for name in ['a', 'b']:
+            assert dic[name].equals(expected[name])
+    dic = graph.evaluate(values, n_threads=3, chunk_size=7, start_date=20170105)
+    assert np.allclose(dic['a'].values, expected['a'].loc[20170105:].values, equal_nan=True)
+
+    # errors of a node are raised
+    def fail(x):
+        raise ValueError("fail")
+
+    parser.register_function('Fail', fail)
+    parser.parse('Rank(close) + Fail(volume)')
+    try:
+        parser.evaluate(values, n_threads=2)
+        assert False
+    except ValueError as e:
+        assert str(e) == 'fail'
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
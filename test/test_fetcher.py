@@ -0,0 +1,125 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import time
+
+try:
+    import pytest
+except ImportError as e:
+    if __name__ == "__main__":
+        pass
+    else:
+        raise e
+
+from jaqs.data.fetcher import FetchPlanner
+
+
+def _slow_query(x, delay=0.2):
+    time.sleep(delay)
+    return x * 2
+
+
+def _failed_query():
+    raise ValueError("query failed")
+
+
+class _FlakyQuery(object):
+    def __init__(self, n_fails):
+        self.n_fails = n_fails
+
+    def __call__(self, x):
+        if self.n_fails > 0:
+            self.n_fails -= 1
+            raise IOError("connection lost")
+        return x
+
+
+def test_fetch_planner_concurrent():
+    planner = FetchPlanner(n_workers=4)
+    for i in range(4):
+        planner.add('q{:d}'.format(i), _slow_query, i, delay=0.3 - 0.1 * (i % 3))
+    t = time.time()
+    res = planner.run()
+    assert time.time() - t < 0.6
+    assert list(res.keys()) == ['q0', 'q1', 'q2', 'q3']
+    assert list(res.values()) == [0, 2, 4, 6]
+    assert len(planner) == 0
+
+
+def test_fetch_planner_sequential():
+    planner = FetchPlanner(n_workers=1)
+    planner.add('a', _slow_query, 1, delay=0)
+    planner.add('b', _slow_query, 2, delay=0)
+    assert list(planner.run().items()) == [('a', 2), ('b', 4)]
+
+    with pytest.raises(ValueError):
+        planner.add('a', _slow_query, 1)
+        planner.add('a', _slow_query, 1)
+
+
+def test_fetch_planner_error():
+    planner = FetchPlanner(n_workers=2)
+    planner.add('a', _slow_query, 1)
+    planner.add('b', _failed_query)
+    with pytest.raises(ValueError):
+        planner.run()
+
+
+
+def test_fetch_planner_retry():
+    planner = FetchPlanner(n_workers=2, n_retries=2, retry_wait=0.01)
+    planner.add('a', _FlakyQuery(2), 1)
+    planner.add('b', _slow_query, 2, delay=0)
+    assert list(planner.run().values()) == [1, 4]
+
+    planner.add('a', _FlakyQuery(3), 1)
+    with pytest.raises(IOError):
+        planner.run()
+
+
+def test_fetch_planner_iter_run():
+    planner = FetchPlanner(n_workers=3)
+    for i in range(6):
+        planner.add(('q', i), _slow_query, i, delay=0.05 * (6 - i))
+    res = list(planner.iter_run())
+    assert [name for name, _ in res] == [('q', i) for i in range(6)]
+    assert [r for _, r in res] == [i * 2 for i in range(6)]
+
+
+def test_fetch_planner_bounded():
+    started = []
+
+    def query(i):
+        started.append(i)
+        if i == 7:
+            raise ValueError("query failed")
+        time.sleep(0.02)
+        return i
+
+    # a query is started only after a result is consumed
+    planner = FetchPlanner(n_workers=2)
+    for i in range(6):
+        planner.add(i, query, i)
+    for name, r in planner.iter_run():
+        assert name == r
+        assert len(started) <= r + 2
+    assert started == list(range(6))
+
+    # no more queries are started after one fails
+    del started[:]
+    for i in range(6, 20):
+        planner.add(i, query, i)
+    with pytest.raises(ValueError):
+        planner.run()
+    time.sleep(0.1)
+    assert max(started) <= 9
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
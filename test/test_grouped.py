@@ -0,0 +1,128 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data import Parser
+import jaqs.util.numeric as numeric
+from jaqs.util.grouped import GroupSegments, group_codes
+
+
+def _data(n_dates=30, n_symbols=40, n_groups=6, seed=3):
+    rs = np.random.RandomState(seed)
+    index = np.arange(20170101, 20170101 + n_dates)
+    columns = ['{:06d}.SZ'.format(i) for i in range(n_symbols)]
+    x = pd.DataFrame(rs.randn(n_dates, n_symbols), index=index, columns=columns)
+    x[rs.rand(n_dates, n_symbols) < 0.1] = np.nan
+    # industries change over time, some are missing
+    labels = np.array(['ind{}'.format(i) for i in range(n_groups)], dtype=object)
+    group = pd.DataFrame(labels[rs.randint(0, n_groups, size=(n_dates, n_symbols))], index=index, columns=columns)
+    group[rs.rand(n_dates, n_symbols) < 0.05] = np.nan
+    return x, group
+
+
+def _loop(x, group, func):
+    """Reference: apply func to values of each group on each date."""
+    res = pd.DataFrame(np.nan, index=x.index, columns=x.columns)
+    for date in x.index:
+        row, row_group = x.loc[date], group.loc[date]
+        for val in row_group.dropna().unique():
+            mask = (row_group == val).values
+            res.loc[date, mask] = func(row[mask])
+    return res
+
+
+def test_group_kernels():
+    x, group = _data()
+    segments = GroupSegments(group_codes(group))
+    assert segments.n_segments <= 30 * 6
+
+    def check(res, expected):
+        assert np.allclose(res, expected.values, equal_nan=True)
+
+    check(segments.demean(x.values), _loop(x, group, lambda s: s - s.mean()))
+    check(segments.zscore(x.values), _loop(x, group, lambda s: (s - s.mean()) / s.std()))
+    check(segments.rank(x.values), _loop(x, group, lambda s: s.rank()))
+    check(segments.rank(x.values, pct=True), _loop(x, group, lambda s: s.rank(pct=True)))
+    check(segments.count(x.values), _loop(x, group, lambda s: s.count()).where(group.notnull()))
+    check(segments.quantile(x.values, 3),
+          _loop(x, group, lambda s: numeric.quantilize_without_nan(s.values, n_quantiles=3)))
+
+    y = x * 2 + 1
+    y = y + np.random.RandomState(0).randn(*y.shape) * 0.1
+
+    def resid(s):
+        z = x.loc[s.name].reindex(s.index)
+        valid = s.notnull() & z.notnull()
+        beta, alpha = np.polyfit(z[valid], s[valid], 1) if valid.sum() > 1 else (0.0, s[valid].mean())
+        return (s - alpha - beta * z).where(valid)
+
+    expected = pd.DataFrame(np.nan, index=x.index, columns=x.columns)
+    for date in x.index:
+        row_group = group.loc[date]
+        for val in row_group.dropna().unique():
+            mask = (row_group == val).values
+            s = y.loc[date, mask]
+            s.name = date
+            expected.loc[date, mask] = resid(s)
+    check(segments.residual(y.values, x.values), expected)
+
+    # ties get average ranks
+    seg = GroupSegments(np.array([[0, 0, 0, 1, 1, -1]]))
+    assert np.allclose(seg.rank(np.array([[1.0, 1.0, 0.5, 2.0, np.nan, 1.0]])),
+                       [[2.5, 2.5, 1.0, 1.0, np.nan, np.nan]], equal_nan=True)
+    # ties of quantiles are split in the order of symbols, or get the quantile of the first of them
+    x_ties = np.array([[1.0, 1.0, 0.5, 2.0, np.nan, 1.0]])
+    assert np.allclose(seg.quantile(x_ties, 3), [[2, 3, 1, 1, np.nan, np.nan]], equal_nan=True)
+    assert np.allclose(seg.quantile(x_ties, 3, ties='first'), [[2, 2, 1, 1, np.nan, np.nan]], equal_nan=True)
+
+
+def test_parser_group_functions():
+    x, group = _data()
+    parser = Parser()
+    values = {'x': x, 'ind': group}
+    parser.parse('GroupRank(x, ind)')
+    res = parser.evaluate(values)
+    assert np.allclose(res.values, _loop(x, group, lambda s: s.rank()).values, equal_nan=True)
+    parser.parse('GroupQuantile(x, ind, 4)')
+    res = parser.evaluate(values)
+    expected = _loop(x, group, lambda s: numeric.quantilize_without_nan(s.values, n_quantiles=4))
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+    # industry neutral values have zero mean in each industry
+    parser.parse('IndustryNeutral(x, ind)')
+    res = parser.evaluate(values)
+    assert np.allclose(_loop(res, group, lambda s: s.mean()).fillna(0).values, 0)
+
+    # with an exposure, the result is the residual of a regression on industry dummies and the exposure
+    size = pd.DataFrame(np.random.RandomState(1).rand(*x.shape), index=x.index, columns=x.columns)
+    values['size'] = size
+    parser.parse('IndustryNeutral(x, ind, size)')
+    res = parser.evaluate(values)
+    for date in x.index[:3]:
+        valid = (x.loc[date].notnull() & size.loc[date].notnull() & group.loc[date].notnull()).values
+        dummies = pd.get_dummies(group.loc[date][valid]).values.astype(float)
+        design = np.hstack([dummies, size.loc[date][valid].values.reshape(-1, 1)])
+        y = x.loc[date][valid].values
+        coef = np.linalg.lstsq(design, y, rcond=None)[0]
+        assert np.allclose(res.loc[date][valid].values, y - design.dot(coef))
+        assert res.loc[date][~valid].isnull().all()
+
+    # time invariant groups
+    sr_group = group.iloc[0]
+    parser.parse('GroupStandardize(x, ind)')
+    res = parser.evaluate({'x': x, 'ind': sr_group})
+    expected = _loop(x, pd.DataFrame([sr_group.values] * len(x), index=x.index, columns=x.columns),
+                     lambda s: (s - s.mean()) / s.std())
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
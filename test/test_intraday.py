@@ -0,0 +1,104 @@
+# encoding: utf-8
+
+from __future__ import print_function
+
+import numpy as np
+import pandas as pd
+
+from jaqs.data import IntradayDataView
+
+SYMBOLS = ['000001.SZ', '000063.SZ', '600030.SH']
+DATES = np.array([20170801, 20170802, 20170803])
+TIMES = np.array([93100, 93200, 93300, 130100, 130200])
+
+
+class _LocalBarService(object):
+    """Serve fixed random minute bars, so that IntradayDataView can be tested without data server."""
+    def __init__(self):
+        rs = np.random.RandomState(123)
+        index = pd.MultiIndex.from_product([DATES, TIMES, SYMBOLS], names=['date', 'time', 'symbol'])
+        self.df = pd.DataFrame({'close': 10 + rs.rand(len(index)),
+                                'volume': rs.randint(1, 1000, size=len(index)).astype(float)},
+                               index=index).reset_index()
+        self.df['trade_date'] = self.df['date']
+        # a suspended symbol has no bar
+        self.df = self.df.loc[~((self.df['date'] == 20170802) & (self.df['symbol'] == '000063.SZ'))]
+
+    def get_trade_date_range(self, start_date, end_date):
+        return DATES[(DATES >= start_date) & (DATES <= end_date)]
+
+    def bar(self, symbol, start_time=200000, end_time=160000, trade_date=None, freq='1m', fields=""):
+        df = self.df
+        df = df.loc[(df['trade_date'] == trade_date) & df['symbol'].isin(symbol.split(','))]
+        return df.copy(), '0,'
+
+
+def _prepare(**kwargs):
+    dv = IntradayDataView()
+    props = {'start_date': 20170801, 'end_date': 20170803, 'symbol': ','.join(SYMBOLS),
+             'fields': 'close,volume', 'freq': '1m'}
+    props.update(kwargs)
+    dv.init_from_config(props, data_api=_LocalBarService())
+    dv.prepare_data()
+    return dv
+
+
+def test_intraday_prepare():
+    dv = _prepare(chunk_size=2, n_workers=2)
+    assert list(dv.dates) == list(DATES)
+    assert len(dv.datetimes) == len(DATES) * len(TIMES)
+    assert dv.datetimes[0] == 20170801093100
+    assert dv.get_day(20170801).get_array('close').dtype == np.float32
+    assert dv.get_day(20170801).get_array('volume').dtype == np.float64
+
+    df = dv.get_ts('close')
+    assert df.shape == (15, 3)
+    assert df.loc[20170802093200:20170802130200, '000063.SZ'].isnull().all()
+    snap = dv.get_snapshot(20170803130100, symbol='600030.SH', fields='close,volume')
+    src = _LocalBarService().df.set_index(['date', 'time', 'symbol'])
+    assert np.isclose(snap.loc['600030.SH', 'close'], src.loc[(20170803, 130100, '600030.SH'), 'close'])
+
+
+def test_intraday_formula():
+    dv = _prepare()
+    close = dv.get_ts('close').astype(float)
+
+    # windows restart each day
+    dv.add_formula('ret', 'Delta(close, 1) / Delay(close, 1)')
+    ret = dv.get_ts('ret')
+    assert ret.loc[20170802093100].isnull().all()
+    assert np.allclose(ret.loc[20170801093200].values,
+                       (close.loc[20170801093200] / close.loc[20170801093100] - 1).values, atol=1e-6)
+
+    # windows continue from previous days
+    dv.add_formula('ret_cont', 'Delta(close, 2)', session_reset=False)
+    expected = close.diff(2)
+    assert np.allclose(dv.get_ts('ret_cont').values, expected.values, atol=1e-5, equal_nan=True)
+    dv.add_formula('rank', 'Rank(volume)')
+    assert dv.get_ts('rank').max().max() == 1.0
+
+    dv.remove_field('ret_cont')
+    assert 'ret_cont' not in dv.fields
+    assert [dic['field_name'] for dic in dv.custom_formulas] == ['ret', 'rank']
+
+
+def test_intraday_daily_field():
+    dv = _prepare()
+    df_daily = pd.DataFrame({symbol: [1.0, 2.0, 3.0] for symbol in SYMBOLS}, index=DATES)
+    dv.add_daily_field('factor', df_daily)
+    dv.add_daily_field('close_1d', df_daily, available_time=150000)
+    factor = dv.get_ts('factor')
+    close_1d = dv.get_ts('close_1d')
+    assert (factor.loc[20170802093100: 20170802130200] == 2.0).all().all()
+    assert close_1d.loc[20170801093100: 20170801130200].isnull().all().all()
+    assert (close_1d.loc[20170803093100: 20170803130200] == 2.0).all().all()
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
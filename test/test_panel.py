@@ -0,0 +1,378 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import jaqs.util as jutil
+from jaqs.data import DataView
+from jaqs.data.panel import DensePanel, FieldPanel, save_fields
+
+
+def _make_data_d(n_dates=30, symbols=('000001.SZ', '000063.SZ', '600030.SH'),
+                 fields=('close', 'open', 'volume')):
+    dates = np.arange(20170101, 20170101 + n_dates)
+    cols = pd.MultiIndex.from_product([list(symbols), list(fields)], names=['symbol', 'field'])
+    df = pd.DataFrame(np.random.rand(n_dates, len(cols)), index=dates, columns=cols)
+    df.index.name = 'trade_date'
+    return df
+
+
+def test_dense_panel_roundtrip():
+    df = _make_data_d()
+    panel = DensePanel.from_frame(df)
+    assert panel.shape == (30, 3, 3)
+    
+    df2 = panel.to_frame()
+    assert np.shares_memory(df2.values, panel.values)
+    assert np.all(df2.columns == df.columns)
+    assert np.allclose(df2.values, df.values)
+
+
+def test_dense_panel_get():
+    df = _make_data_d()
+    panel = DensePanel.from_frame(df)
+    
+    ts = panel.get_ts('close', start_date=20170105, end_date=20170110)
+    ts_frame = df.loc[20170105: 20170110, pd.IndexSlice[:, 'close']]
+    assert ts.shape == (6, 3)
+    assert np.allclose(ts.values, ts_frame.values)
+    assert np.shares_memory(ts.values, panel.values)
+    
+    snap = panel.get_snapshot(20170103, symbol=['000063.SZ', '600030.SH'], fields=['open', 'close'])
+    assert list(snap.columns) == ['close', 'open']
+    assert list(snap.index) == ['000063.SZ', '600030.SH']
+    assert snap.at['600030.SH', 'open'] == df.at[20170103, ('600030.SH', 'open')]
+    assert np.shares_memory(snap.values, panel.values)
+    
+    res = panel.get(start_date=20170103, end_date=20170104)
+    assert res.shape == (2, 9)
+    assert np.shares_memory(res.values, panel.values)
+
+
+def test_dense_panel_object_field():
+    df = _make_data_d()
+    df_status = pd.DataFrame(index=df.index, columns=df.columns.levels[0], data='N')
+    df_status.columns = pd.MultiIndex.from_product([df_status.columns, ['trade_status']])
+    df = pd.concat([df, df_status], axis=1).sort_index(axis=1)
+    
+    panel = DensePanel.from_frame(df)
+    assert list(panel.fields) == ['close', 'open', 'volume']
+    assert 'trade_status' in panel.extra
+    
+    snap = panel.get_snapshot(20170110, fields=['trade_status', 'close'])
+    assert list(snap.columns) == ['close', 'trade_status']
+    assert (snap['trade_status'] == 'N').all()
+    assert panel.to_frame().shape == df.shape
+
+
+def test_dense_panel_modify():
+    df = _make_data_d()
+    panel = DensePanel.from_frame(df)
+    
+    df_new = pd.DataFrame(index=df.index, columns=['000063.SZ', '600030.SH'], data=1.0)
+    panel.set_field('myfactor', df_new)
+    assert list(panel.fields) == ['close', 'myfactor', 'open', 'volume']
+    ts = panel.get_ts('myfactor')
+    assert np.isnan(ts['000001.SZ']).all()
+    assert (ts['600030.SH'] == 1.0).all()
+    
+    panel.remove_field('myfactor')
+    assert list(panel.fields) == ['close', 'open', 'volume']
+    assert np.allclose(panel.to_frame().values, df.values)
+
+
+def test_dataview_dense_storage():
+    df = _make_data_d()
+    dv = DataView()
+    dv.storage = 'dense'
+    dv.start_date, dv.end_date = 20170105, 20170125
+    dv.data_d = df
+    
+    assert dv.panel_d is not None
+    assert np.all(dv.dates == df.index.values)
+    assert np.allclose(dv.get_ts('open').values, df.loc[20170105: 20170125, pd.IndexSlice[:, 'open']].values)
+    snap = dv.get_snapshot(20170110, symbol='000001.SZ', fields='volume')
+    assert snap.shape == (1, 1)
+    
+    dv.append_df(dv.get_ts('open', start_date=20170101, end_date=20170130) * 2, 'open2')
+    assert 'open2' in dv.fields
+    assert dv.data_d.shape == (30, 12)
+    dv.remove_field('open2')
+    assert dv.data_d.shape == (30, 9)
+
+
+def test_dataview_field_storage():
+    df = _make_data_d()
+    df_q = _make_data_d(n_dates=4, fields=('ann_date', 'oper_rev'))
+    df_q.index.name = 'report_date'
+    dv = DataView()
+    dv.storage = 'field'
+    dv.start_date, dv.end_date = 20170105, 20170125
+    dv.data_d = df
+    dv.data_q = df_q
+    assert isinstance(dv.panel_d, FieldPanel)
+    assert dv._data_d is None and dv._data_q is None
+    
+    # fields are added and removed without building the MultiIndex frame
+    open_ = dv.get_ts('open', start_date=20170101, end_date=20170130)
+    for i in range(5):
+        dv.append_df(open_ * i, 'open{:d}'.format(i))
+    dv.append_df(df_q.xs('oper_rev', axis=1, level=1) * 2, 'rev2', is_quarterly=True)
+    dv.remove_field('open0')
+    assert dv._data_d is None and dv._data_q is None
+    assert 'open0' not in dv.fields and 'open4' in dv.fields
+    
+    # the frame is built on access, and dropped when data is changed
+    assert dv.data_d.shape == (30, 21)
+    assert np.allclose(dv.data_d.loc[:, pd.IndexSlice[:, 'open3']].values, open_.values * 3)
+    assert np.allclose(dv.get_ts_quarter('rev2').values, df_q.xs('oper_rev', axis=1, level=1).values * 2)
+    assert dv.data_q.shape == (4, 9)
+    dv.remove_field('open4')
+    assert dv._data_d is None
+    assert dv.data_d.shape == (30, 18)
+
+
+def test_dataview_snapshot_arrays():
+    df = _make_data_d()
+    df_status = pd.DataFrame(index=df.index, columns=df.columns.levels[0], data='N')
+    df_status.columns = pd.MultiIndex.from_product([df_status.columns, ['trade_status']])
+    df = pd.concat([df, df_status], axis=1).sort_index(axis=1)
+    
+    for storage in ['frame', 'dense', 'field']:
+        dv = DataView()
+        dv.storage = storage
+        dv.data_d = df
+        
+        dic = dv.get_snapshot_arrays(20170110, symbol='600030.SH,000001.SZ', fields='open,trade_status')
+        assert list(dic.keys()) == ['symbol', 'open', 'trade_status']
+        assert list(dic['symbol']) == ['000001.SZ', '600030.SH']
+        assert np.allclose(dic['open'], df.loc[20170110, pd.IndexSlice[['000001.SZ', '600030.SH'], 'open']].values)
+        assert np.all(dic['trade_status'] == 'N')
+        # the same with the stacked frame
+        snap = dv.get_snapshot(20170110)
+        expected = df.loc[[20170110], :].stack(level='symbol').reset_index(level=0, drop=True)
+        assert list(snap.columns) == list(expected.columns) and list(snap.index) == list(expected.index)
+        assert np.allclose(snap.loc[:, 'close'].values, expected.loc[:, 'close'].values.astype(float))
+        
+        # recent snapshots are cached until data is changed
+        assert dv.get_snapshot_arrays(20170110, symbol='600030.SH,000001.SZ', fields='open,trade_status') is dic
+        dv.snapshot_cache_size = 2
+        dv.get_snapshot_arrays(20170111, fields='close')
+        dv.get_snapshot_arrays(20170112, fields='close')
+        assert len(dv._snapshot_cache) == 2
+        dv.append_df(dv.get_ts('open', start_date=20170101, end_date=20170130) * 2, 'open2')
+        assert len(dv._snapshot_cache) == 0
+        assert np.allclose(dv.get_snapshot_arrays(20170110, fields='open2')['open2'],
+                           df.loc[20170110, pd.IndexSlice[:, 'open']].values * 2)
+
+
+def test_dataview_snapshot_frame():
+    df = _make_data_d()
+    dv = DataView()
+    dv.data_d = df
+    
+    # values are read from data_d, which is not copied
+    panel = dv._get_snapshot_panel()
+    assert not hasattr(panel, '_arrays')
+    assert dv.get_snapshot(20170110).loc['000001.SZ', 'close'] == df.loc[20170110, ('000001.SZ', 'close')]
+    dv.data_d.loc[20170110, ('000001.SZ', 'close')] = 999.0
+    assert dv.get_snapshot(20170110).loc['000001.SZ', 'close'] == 999.0
+    assert dv.get_snapshot_arrays(20170110, symbol='000001.SZ', fields='close')['close'][0] == 999.0
+    assert dv._get_snapshot_panel() is panel
+    
+    # a symbol without some field gives NaN
+    dv.data_d = df.drop(columns=[('600030.SH', 'open')])
+    dic = dv.get_snapshot_arrays(20170111, fields='open')
+    assert dv._get_snapshot_panel() is not panel
+    assert np.isnan(dic['open'][2]) and np.allclose(dic['open'][:2], df.loc[20170111, pd.IndexSlice[:, 'open']][:2])
+    assert np.isnan(dv._get_snapshot_panel().get_array('open')[:, 2]).all()
+
+
+def test_dataview_compact_dtype():
+    df = _make_data_d(fields=('close', 'open', 'volume', 'index_member'))
+    df.loc[:, pd.IndexSlice[:, 'index_member']] = np.where(df.loc[:, pd.IndexSlice[:, 'index_member']] > 0.5, 1.0,
+                                                           np.nan)
+    df_status = pd.DataFrame(index=df.index, columns=df.columns.levels[0], data=u'交易')
+    df_status.iloc[3, 1] = u'停牌'
+    df_status.iloc[4, 2] = np.nan
+    df_status.columns = pd.MultiIndex.from_product([df_status.columns, ['trade_status']])
+    df = pd.concat([df, df_status], axis=1).sort_index(axis=1)
+    
+    dv = DataView()
+    dv.storage = 'dense'
+    dv.data_d = df
+    nbytes_default = dv.panel_d.nbytes
+    
+    dv = DataView()
+    dv.storage = 'dense'
+    dv.dtype_policy = 'compact'
+    dv.data_d = df
+    panel = dv.panel_d
+    assert list(panel.fields) == ['close', 'open']
+    assert panel.values.dtype == np.float32
+    assert panel.extra['volume'].dtype == np.float64
+    assert panel.extra['index_member'].dtype == np.bool_
+    assert panel.extra['trade_status'].dtype == np.int32
+    assert panel.nbytes < nbytes_default * 0.6
+    
+    assert np.allclose(dv.get_ts('close').values, df.loc[:, pd.IndexSlice[:, 'close']].values)
+    assert np.all(dv.get_ts('volume').values == df.loc[:, pd.IndexSlice[:, 'volume']].values)
+    status = dv.get_ts('trade_status', start_date=20170101).values
+    expected = df.loc[:, pd.IndexSlice[:, 'trade_status']].values
+    assert np.all(status[~pd.isnull(expected)] == expected[~pd.isnull(expected)])
+    assert pd.isnull(status[4, 2])
+    member = dv.get_snapshot_arrays(20170105, fields='index_member')['index_member']
+    assert np.all(member == (df.loc[20170105, pd.IndexSlice[:, 'index_member']].values == 1))
+    
+    # labels added later share the dictionary
+    df_group = pd.DataFrame(index=df.index, columns=df.columns.levels[0], data='A')
+    df_group.iloc[:, 0] = 'B'
+    dv.append_df(df_group, 'sw1')
+    assert list(panel.categories['sw1']) == ['B', 'A']
+    codes = panel.get_codes('sw1')
+    assert (codes.iloc[:, 0] == 0).all() and (codes.iloc[:, 1] == 1).all()
+    assert (dv.get_ts('sw1', start_date=20170101).iloc[:, 0] == 'B').all()
+    
+    # frame storage only converts float fields
+    dv = DataView()
+    dv.dtype_policy = 'compact'
+    dv.data_d = df
+    assert (dv.get_ts('close').dtypes == np.float32).all()
+    assert (dv.get_ts('volume').dtypes == np.float64).all()
+
+
+def test_field_panel_save_load():
+    df = _make_data_d()
+    df_status = pd.DataFrame(index=df.index, columns=df.columns.levels[0], data='N')
+    df_status.iloc[0, 0] = np.nan
+    df_status.columns = pd.MultiIndex.from_product([df_status.columns, ['trade_status']])
+    df = pd.concat([df, df_status], axis=1).sort_index(axis=1)
+    
+    folder = tempfile.mkdtemp()
+    try:
+        save_fields(folder, DensePanel.from_frame(df))
+        panel = FieldPanel.load(folder)
+        assert panel.loaded_fields == []
+        assert list(panel.fields) == ['close', 'open', 'trade_status', 'volume']
+        
+        ts = panel.get_ts('close', start_date=20170103)
+        assert panel.loaded_fields == ['close']
+        assert isinstance(panel.get_array('close'), np.memmap)
+        assert np.allclose(ts.values, df.loc[20170103:, pd.IndexSlice[:, 'close']].values)
+        
+        df_load = panel.to_frame()
+        assert df_load.shape == df.shape
+        assert pd.isnull(df_load.iat[0, df_load.columns.get_loc(('000001.SZ', 'trade_status'))])
+        assert np.allclose(df_load.xs('open', axis=1, level=1).values, df.xs('open', axis=1, level=1).values)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_dataview_npy_format():
+    df = _make_data_d()
+    dv = DataView()
+    dv.start_date, dv.end_date = 20170105, 20170125
+    dv.data_d = df
+    
+    folder = tempfile.mkdtemp()
+    try:
+        dv.save_dataview(folder, file_format='npy')
+        assert os.path.exists(os.path.join(folder, 'data_d', 'fields', 'close.npy'))
+        
+        dv2 = DataView()
+        dv2.load_dataview(folder)
+        assert dv2.panel_d.loaded_fields == []
+        assert dv2.start_date == 20170105
+        assert np.allclose(dv2.get_ts('close').values, dv.get_ts('close').values)
+        assert dv2.panel_d.loaded_fields == ['close']
+        assert dv2.data_d.shape == df.shape
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_dataview_npy_object_field():
+    df = _make_data_d(n_dates=4)
+    values = [['N', np.nan, None, b'XD'], [1, 2.5, u'停牌', 'N'], [np.nan] * 4]
+    df_obj = pd.DataFrame(np.array(values, dtype=object).T, index=df.index, columns=df.columns.levels[0])
+    df_obj.columns = pd.MultiIndex.from_product([df_obj.columns, ['status']])
+    df = pd.concat([df, df_obj], axis=1).sort_index(axis=1)
+    dv = DataView()
+    dv.start_date, dv.end_date = 20170101, 20170104
+    dv.data_d = df
+
+    folder = tempfile.mkdtemp()
+    try:
+        dv.save_dataview(folder, file_format='npy')
+        dv2 = DataView()
+        dv2.load_dataview(folder)
+        res = dv2.get_ts('status')
+        expected = dv.get_ts('status')
+        # missing values, types of objects and dtype are kept
+        assert res.dtypes.tolist() == expected.dtypes.tolist()
+        assert (res.isnull() == expected.isnull()).all().all()
+        for a, b in zip(res.values.ravel(), expected.values.ravel()):
+            assert type(a) is type(b) and (pd.isnull(a) or a == b)
+        assert np.allclose(dv2.get_ts('close').values, dv.get_ts('close').values)
+    finally:
+        shutil.rmtree(folder)
+
+
+def test_dataview_delta_save():
+    df = _make_data_d()
+    for storage in ['frame', 'field']:
+        dv = DataView()
+        dv.storage = storage
+        dv.start_date, dv.end_date = 20170105, 20170125
+        dv.data_d = df
+        dv.fields = ['open', 'high', 'low', 'close']
+        
+        folder = tempfile.mkdtemp()
+        try:
+            def file_id(field):
+                # files are replaced when written
+                return os.stat(os.path.join(folder, 'data_d', 'fields', field + '.npy')).st_ino
+            
+            dv.save_dataview(folder, file_format='npy')
+            hash_close, hash_open = dv.get_field_hash('close'), dv.get_field_hash('open')
+            ids = {field: file_id(field) for field in ['open', 'close']}
+            
+            # only the changed field is written again
+            dv.append_df(dv.get_ts('close') * 2, 'close')
+            assert dv.get_field_hash('open') == hash_open
+            assert dv.get_field_hash('close') != hash_close
+            dv.save_dataview(folder, file_format='npy')
+            assert file_id('open') == ids['open']
+            assert file_id('close') != ids['close']
+            manifest = jutil.read_json(os.path.join(folder, 'manifest.json'))
+            assert manifest['data_d']['close'] == dv.get_field_hash('close')
+            
+            dv2 = DataView()
+            dv2.load_dataview(folder, verify=True)
+            assert dv2.get_field_hash('close') == dv.get_field_hash('close')
+            assert np.allclose(dv2.get_ts('close').values, dv.get_ts('close').values)
+            
+            # a field file changed after save is detected
+            arr = np.load(os.path.join(folder, 'data_d', 'fields', 'open.npy'))
+            np.save(os.path.join(folder, 'data_d', 'fields', 'open.npy'), arr + 1)
+            try:
+                DataView().load_dataview(folder, verify=True)
+                assert False
+            except ValueError as e:
+                assert 'data_d/open' in str(e)
+        finally:
+            shutil.rmtree(folder)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+    
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
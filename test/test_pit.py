@@ -0,0 +1,118 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data import DataView, RemoteDataService
+from jaqs.data.pit import PointInTimeStore
+
+
+def _statements():
+    # report 20161231 of 600030.SH is restated on 20170810, after report 20170331 is announced
+    # report 20170331 of 600030.SH is restated on 20170901
+    return pd.DataFrame({'symbol': ['600030.SH'] * 4 + ['000001.SZ'],
+                         'report_date': [20161231, 20170331, 20161231, 20170331, 20170331],
+                         'ann_date': [20170320, 20170425, 20170810, 20170901, 20170428],
+                         'oper_rev': [1., 2., 10., 20., 5.]})
+
+
+def test_pit_store_get():
+    store = PointInTimeStore()
+    store.add(_statements())
+    assert store.fields == ['oper_rev']
+    assert np.isnan(store.get('600030.SH', 20161231, 20170301, 'oper_rev'))
+    assert store.get('600030.SH', 20161231, 20170809, 'oper_rev') == 1.
+    assert store.get('600030.SH', 20161231, 20170810, 'oper_rev') == 10.
+    assert np.isnan(store.get('600000.SH', 20161231, 20170810, 'oper_rev'))
+    
+    latest = store.get_latest('600030.SH', 20170815)
+    assert latest['report_date'] == 20170331 and latest['oper_rev'] == 2.
+    
+    # same key updates the record, new fields are added
+    store.add(pd.DataFrame({'symbol': ['600030.SH'], 'report_date': [20161231], 'ann_date': [20170320],
+                            'oper_rev': [1.5], 'oper_cost': [0.5]}))
+    assert len(store) == 5
+    assert store.fields == ['oper_cost', 'oper_rev'] or store.fields == ['oper_rev', 'oper_cost']
+    assert store.get('600030.SH', 20161231, 20170401, 'oper_rev') == 1.5
+    assert np.isnan(store.get('600030.SH', 20170331, 20170501, 'oper_cost'))
+
+
+def test_pit_store_expand():
+    store = PointInTimeStore()
+    store.add(_statements())
+    dates = [20170101, 20170320, 20170426, 20170810, 20170901]
+    df = store.expand(dates, ['oper_rev'], ['000001.SZ', '600030.SH', '600000.SH'])['oper_rev']
+    expected = np.array([[np.nan, np.nan, np.nan],
+                         [np.nan, 1., np.nan],
+                         [np.nan, 2., np.nan],
+                         # restatement of an older report does not change the latest report
+                         [5., 2., np.nan],
+                         [5., 20., np.nan]])
+    assert np.allclose(df.values, expected, equal_nan=True)
+    
+    # the same as looking up one by one
+    for date in dates:
+        latest = store.get_latest('600030.SH', date)
+        assert np.allclose(latest['oper_rev'], df.loc[date, '600030.SH'], equal_nan=True)
+
+
+def test_dataview_restatement():
+    dv = DataView()
+    dv.symbol = ['000001.SZ', '600030.SH']
+    dates = np.array([20170320, 20170426, 20170810, 20170901])
+    
+    df = _statements()
+    results = [(('income', 0, 0), (df.sample(frac=1, random_state=0), '0,'))]
+    _, quarterly_list, _ = dv._collect_query_data(results, ['oper_rev'], pit_stores=dv._pit_stores)
+    _, data_q = dv._process_daily_quarterly([], quarterly_list, dates=dates)
+    
+    # data_q keeps the first announced version
+    assert data_q.loc[20161231, ('600030.SH', 'oper_rev')] == 1.
+    assert data_q.loc[20170331, ('600030.SH', 'ann_date')] == 20170425
+    
+    df_expanded = dv._expand_quarterly(data_q, dates)
+    assert np.allclose(df_expanded.loc[:, ('600030.SH', 'oper_rev')].values, [1., 2., 2., 20.])
+    assert np.allclose(df_expanded.loc[:, ('600030.SH', 'ann_date')].values,
+                       [20170320, 20170425, 20170425, 20170901])
+
+
+class _FakeDataApi(object):
+    """Answer queries of statements with the restated versions first."""
+    def query(self, view, fields="", filter="", order_by="", data_format=""):
+        df = _statements().sort_values('ann_date', ascending=False)
+        return df.sort_values('report_date', kind='mergesort').reset_index(drop=True), '0,'
+
+
+def test_dataview_restatement_server_order():
+    ds = RemoteDataService()
+    data_api, cache = ds.data_api, ds.cache
+    try:
+        ds.data_api, ds.cache = _FakeDataApi(), None
+        dv = DataView()
+        dv.data_api = ds
+        dv.symbol = ['000001.SZ', '600030.SH']
+        planner = dv._new_planner()
+        dv._add_query_data_tasks(planner, dv.symbol, ['oper_rev'],
+                                 start_date_d=20170101, start_date_q=20160101, end_date=20170901)
+        _, quarterly_list, _ = dv._collect_query_data(planner.iter_run(), ['oper_rev'])
+        _, data_q = dv._process_daily_quarterly([], quarterly_list, dates=np.array([20170901]))
+    finally:
+        ds.data_api, ds.cache = data_api, cache
+    
+    # the server returns the restated version first, data_q still keeps the first announced one,
+    # while dropping duplicates in the order of the server (before point-in-time stores) kept the restated one
+    assert data_q.loc[20161231, ('600030.SH', 'oper_rev')] == 1.
+    assert data_q.loc[20170331, ('600030.SH', 'oper_rev')] == 2.
+    assert data_q.loc[20170331, ('600030.SH', 'ann_date')] == 20170425
+    assert data_q.loc[20170331, ('000001.SZ', 'oper_rev')] == 5.
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
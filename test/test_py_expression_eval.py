@@ -163,6 +163,15 @@ def test_calc_return():
     assert abs(res.loc[20170808, '000001.SH'] - 0.006067) < 1e-6
 
 
+def test_lookback():
+    parser.parse('Delta(Ts_Mean(close, 5), 2) / Delay(open, 1)')
+    assert parser.lookback() == 6
+    parser.parse('Corr(close, open, 10) + Rank(close)')
+    assert parser.lookback() == 9
+    parser.parse('Ewma(close, 3)')
+    assert parser.lookback() is None
+
+
 @pytest.fixture(autouse=True)
 def my_globals(request):
     ds = RemoteDataService()
@@ -0,0 +1,105 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data import Parser
+import jaqs.util.rolling as rolling
+
+
+def _data(shape=(120, 6)):
+    rs = np.random.RandomState(11)
+    x = 10 + rs.randn(*shape)
+    x[rs.rand(*shape) < 0.1] = np.nan
+    y = 5 + rs.randn(*shape)
+    y[rs.rand(*shape) < 0.1] = np.nan
+    return x, y
+
+
+def test_rolling_vs_pandas():
+    x, y = _data()
+    df_x, df_y = pd.DataFrame(x), pd.DataFrame(y)
+    for window, min_periods in [(5, None), (10, 3)]:
+        roll = df_x.rolling(window, min_periods=min_periods)
+        cases = [(rolling.rolling_sum(x, window, min_periods), roll.sum()),
+                 (rolling.rolling_mean(x, window, min_periods), roll.mean()),
+                 (rolling.rolling_std(x, window, min_periods), roll.std()),
+                 (rolling.rolling_min(x, window, min_periods), roll.min()),
+                 (rolling.rolling_max(x, window, min_periods), roll.max()),
+                 (rolling.rolling_skew(x, window, min_periods), roll.skew()),
+                 (rolling.rolling_kurt(x, window, min_periods), roll.kurt()),
+                 (rolling.rolling_corr(x, y, window, min_periods), roll.corr(df_y)),
+                 (rolling.rolling_cov(x, y, window, min_periods), roll.cov(df_y)),
+                 (rolling.rolling_rank(x, window, min_periods), roll.rank(pct=True)),
+                 (rolling.rolling_count(x, window), df_x.rolling(window, min_periods=0).count())]
+        for res, expected in cases:
+            assert res.shape == x.shape
+            assert np.allclose(res, expected.values, equal_nan=True)
+
+
+def test_rolling_weighted():
+    x, _ = _data()
+    df = pd.DataFrame(x)
+    window = 6
+    linear = np.arange(1, window + 1, dtype=float)
+    exp = 0.8 ** np.arange(window - 1, -1, -1)
+    steep = 1.5 ** np.arange(window - 1, -1, -1)
+    cases = [(rolling.rolling_decay_linear(x, window), linear),
+             (rolling.rolling_decay_exp(x, 0.8, window), exp),
+             (rolling.rolling_decay_exp(x, 1.5, window), steep)]
+    for res, weights in cases:
+        expected = df.rolling(window).apply(lambda a: np.dot(a, weights) / weights.sum(), raw=True)
+        assert np.allclose(res, expected.values, equal_nan=True)
+
+    z = x - 10
+    z[50, :] = 0.0
+    expected = pd.DataFrame(z).rolling(window).apply(np.prod, raw=True)
+    assert np.allclose(rolling.rolling_product(z, window), expected.values, equal_nan=True)
+
+
+def test_rolling_constant_and_1d():
+    x = np.array([1.0, 2.0, 2.0, 2.0, 2.0, np.nan, 3.0, 1.0])
+    assert np.allclose(rolling.rolling_std(x, 3), [np.nan, np.nan, 0.57735027, 0, 0, np.nan, np.nan, np.nan],
+                       equal_nan=True)
+    assert np.isnan(rolling.rolling_skew(x, 3)[3])
+    assert np.allclose(rolling.rolling_max(x, 2), [np.nan, 2, 2, 2, 2, np.nan, np.nan, 3], equal_nan=True)
+    assert np.allclose(rolling.rolling_rank(x, 3, min_periods=1), [1, 1, 2.5 / 3, 2. / 3, 2. / 3, np.nan, 1, 0.5],
+                       equal_nan=True)
+    assert np.allclose(rolling.rolling_rank(x, 3, min_periods=1, method='max'), [1, 1, 1, 1, 1, np.nan, 1, 0.5],
+                       equal_nan=True)
+
+
+def test_parser_ts_rank_ties():
+    # the latest value is ranked after equal values earlier in the window, as a stable sort of the window
+    rs = np.random.RandomState(1)
+    df = pd.DataFrame(rs.randint(0, 4, size=(60, 3)).astype(float), index=np.arange(20170101, 20170161))
+    parser = Parser()
+    parser.parse('Ts_Rank(x, 5)')
+    res = parser.evaluate({'x': df})
+    expected = df.rolling(5).apply(lambda a: (np.argsort(np.argsort(a, kind='mergesort'))[-1] + 1.0) / 5, raw=True)
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+    # a static method, as before
+    assert np.allclose(Parser.ts_rank(df, 5).values, expected.values, equal_nan=True)
+
+
+def test_parser_rolling_functions():
+    x, y = _data()
+    index = np.arange(20170101, 20170101 + len(x))
+    df_x, df_y = pd.DataFrame(x, index=index), pd.DataFrame(y, index=index)
+    parser = Parser()
+    parser.parse('Ts_Rank(x, 5) + Corr(x, y, 10) - CountNans(x, 4)')
+    res = parser.evaluate({'x': df_x, 'y': df_y})
+    expected = (df_x.rolling(5).rank(pct=True) + df_x.rolling(10).corr(df_y)
+                - (4 - df_x.rolling(4, min_periods=0).count()))
+    assert np.allclose(res.values, expected.values, equal_nan=True)
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
@@ -5,6 +5,8 @@ from jaqs.trade import model
 import jaqs.util as jutil
 import random
 
+import numpy as np
+
 
 def test_context():
     r = random.random()
@@ -20,6 +22,49 @@ def test_context():
     assert context.storage['me'] == 1.0
 
 
+class _DatesView(object):
+    def __init__(self, dates):
+        self.dates = dates
+
+
+def test_context_calendar():
+    dv = _DatesView(np.array([20170103, 20170104, 20170105]))
+    context = model.Context(dataview=dv)
+    cal = context.calendar
+    assert context.calendar is cal
+    assert cal.get_next_trade_date(20170103) == 20170104
+
+    # rebuilt when dates of the dataview are replaced, e.g. by extend
+    dv.dates = np.concatenate([dv.dates, [20170106]])
+    assert context.calendar is not cal
+    assert context.calendar.get_next_trade_date(20170105) == 20170106
+
+
+class _SnapshotView(object):
+    def __init__(self):
+        self.dates = []
+    
+    def get_snapshot(self, date):
+        self.dates.append(date)
+        return date
+
+
+def test_context_snapshot():
+    dv = _SnapshotView()
+    context = model.Context(dataview=dv)
+    assert context.snapshot is None
+    
+    # built when first read after the date is set
+    context.set_snapshot_date(20170103)
+    context.set_snapshot_date(20170104)
+    assert dv.dates == []
+    assert context.snapshot == 20170104 and context.snapshot == 20170104
+    assert dv.dates == [20170104]
+    
+    context.snapshot = 'given'
+    assert context.snapshot == 'given'
+
+
 if __name__ == "__main__":
     import time
     t_start = time.time()
@@ -0,0 +1,79 @@
+# encoding: utf-8
+
+from __future__ import print_function
+import numpy as np
+import pandas as pd
+
+from jaqs.data.streaming import StreamingExpression
+
+
+def _data():
+    rs = np.random.RandomState(11)
+    index = np.arange(20170101, 20170141)
+    columns = ['000001.SZ', '000063.SZ', '600030.SH', '600519.SH']
+    close = pd.DataFrame(10 + rs.rand(40, 4), index=index, columns=columns)
+    close.iloc[3, 1] = np.nan
+    close.iloc[30, 2] = np.nan
+    volume = pd.DataFrame(rs.rand(40, 4) * 1000, index=index, columns=columns)
+    member = pd.DataFrame(rs.rand(40, 4) > 0.2, index=index, columns=columns)
+    return {'close': close, 'volume': volume}, member
+
+
+def test_streaming_consistency():
+    values, member = _data()
+    symbols = list(values['close'].columns)
+    formulas = ['Delta(Ts_Mean(close, 5), 2) / close',
+                'Rank(Correlation(close, volume, 10))',
+                'Ts_Rank(close * volume, 7) + Decay_linear(close, 4)',
+                'StdDev(Return(close, 2), 6) - Ts_Max(volume, 3) + Ts_Min(volume, 3)',
+                'Ewma(close, 3) - Sma(volume, 5, 2)',
+                'If(close > Delay(close, 1), Quantile(volume, 3), -1)',
+                'Sum(Rank(volume), 3) + Product(close / 10, 2)']
+    for formula in formulas:
+        expr = StreamingExpression(formula, symbols)
+        assert expr.check(values, n_rows=8), formula
+        assert expr.check(values, n_rows=5, index_member=member), formula
+
+    assert StreamingExpression(formulas[0], symbols).lookback == 6
+    assert StreamingExpression(formulas[4], symbols).lookback is None
+
+
+def test_streaming_update():
+    values, _ = _data()
+    close = values['close']
+    symbols = list(close.columns)
+    expr = StreamingExpression('Ts_Mean(close, 3) - Delay(close, 2)', symbols)
+    # lookback is 2, so only the last 3 rows of history are used
+    last = expr.warm_up({'close': close.iloc[:30]})
+    assert expr.last_date == close.index[29]
+
+    expected = close.rolling(3).mean() - close.shift(2)
+    assert np.allclose(last.values, expected.iloc[29].values, equal_nan=True)
+    # values can be a Series in a different order, or an array aligned to symbols
+    row = expr.update(close.index[30], {'close': close.iloc[30][::-1]})
+    assert list(row.index) == symbols
+    assert np.allclose(row.values, expected.iloc[30].values, equal_nan=True)
+    row = expr.update(close.index[31], {'close': close.iloc[31].values})
+    assert np.allclose(row.values, expected.iloc[31].values, equal_nan=True)
+
+    try:
+        expr.update(close.index[31], {'close': close.iloc[31]})
+        raise AssertionError("dates must increase")
+    except ValueError:
+        pass
+
+    try:
+        StreamingExpression('Ts_Mean(close, Ts_Max(close, 2))', symbols)
+        raise AssertionError("window must be a number")
+    except NotImplementedError:
+        pass
+
+
+if __name__ == "__main__":
+    g = globals()
+    g = {k: v for k, v in g.items() if k.startswith('test_') and callable(v)}
+
+    for test_name, test_func in g.items():
+        print("\n==========\nTesting {:s}...".format(test_name))
+        test_func()
+    print("Test Complete.")
@@ -27,6 +27,64 @@ def test_combine_date_time():
     assert np.all(jutil.combine_date_time(a, b) == a * 1000000 + b)
 
 
+def test_split_date_range():
+    assert jutil.split_date_range(20170101, 20170110, 4) == [(20170101, 20170104), (20170105, 20170108),
+                                                              (20170109, 20170110)]
+    assert jutil.split_date_range(20161230, 20170102, 2) == [(20161230, 20161231), (20170101, 20170102)]
+    assert jutil.split_date_range(20170101, 20170110, 0) == [(20170101, 20170110)]
+
+
+def test_rank_quantile_kernels():
+    import numpy as np
+    import pandas as pd
+    from jaqs.util import numeric
+    
+    rs = np.random.RandomState(11)
+    mat = rs.randn(50, 40)
+    mat_nan = mat.copy()
+    mat_nan[rs.rand(*mat.shape) < 0.2] = np.nan
+    mat_nan[3] = np.nan
+    
+    # the same as the old implementation without ties, both with partial selection and with sort
+    for arr in [mat, mat_nan]:
+        for n_quantiles in [1, 3, 5, 40, 60]:
+            for axis in [0, 1]:
+                expected = numeric.quantilize_without_nan(arr, n_quantiles=n_quantiles, axis=axis)
+                res = numeric.quantilize_fast(arr, n_quantiles=n_quantiles, axis=axis, chunk_size=7)
+                assert np.allclose(res, expected, equal_nan=True)
+        res = numeric.rank_without_nan(arr, pct=True, chunk_size=9)
+        assert np.allclose(res, pd.DataFrame(arr).rank(axis=1, pct=True).values, equal_nan=True)
+    assert np.allclose(numeric.quantilize_fast(mat[0]), numeric.quantilize_without_nan(mat[0]))
+    
+    # equal values get average rank, and the same quantile with ties='first'
+    arr = np.round(mat_nan, 0)
+    assert np.allclose(numeric.rank_without_nan(arr), pd.DataFrame(arr).rank(axis=1).values, equal_nan=True)
+    for src in [arr, np.round(mat, 0)]:
+        res = numeric.quantilize_fast(src, n_quantiles=4, ties='first')
+        for row, row_res in zip(src, res):
+            for val in np.unique(row[~np.isnan(row)]):
+                assert len(np.unique(row_res[row == val])) == 1
+    assert np.allclose(numeric.quantilize_fast(np.array([1.0, 1.0, 1.0, 2.0]), n_quantiles=2, ties='first'),
+                       [1, 1, 1, 2])
+    
+    # by default equal values are split as before, so every quantile number is used
+    for src in [arr, np.round(mat, 0), np.round(mat * 3, 0)]:
+        for n_quantiles in [2, 5, 30]:
+            for axis in [0, 1]:
+                expected = numeric.quantilize_without_nan(src, n_quantiles=n_quantiles, axis=axis)
+                res = numeric.quantilize_fast(src, n_quantiles=n_quantiles, axis=axis, chunk_size=7)
+                assert np.allclose(res, expected, equal_nan=True)
+    df = pd.DataFrame(np.round(mat, 0))
+    assert np.allclose(jutil.to_quantile(df, n_quantiles=5).values,
+                       numeric.quantilize_without_nan(df.values, n_quantiles=5, axis=1))
+    assert jutil.to_quantile(df, n_quantiles=5).max().max() == 5
+    assert np.allclose(numeric.quantilize_fast(np.array([1.0, 1.0, 1.0, 2.0]), n_quantiles=2), [1, 1, 2, 2])
+    
+    res = numeric.rank_without_nan(mat_nan, dtype=np.float32)
+    assert res.dtype == np.float32
+    assert np.allclose(res, numeric.rank_without_nan(mat_nan), equal_nan=True)
+
+
 if __name__ == "__main__":
     import time
     t_start = time.time()